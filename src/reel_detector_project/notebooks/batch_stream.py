@@ -0,0 +1,136 @@
+# notebooks/batch_stream.py
+# Bounded-memory training input for labeled window CSVs larger than RAM.
+#
+# The CSV is only ever read in chunks. A first pass fits the z-score scaler
+# on the training rows only (StreamingScaler merges per-chunk count / mean /
+# M2, so the result equals normalize_save on the TRAIN part, not on the whole
+# frame as the in-memory path does); training passes then yield normalized
+# batches of one part of the data. Rows are assigned to train / val / test by
+# a generator seeded with the chunk number, so every pass sees the same split
+# without ever holding the row index. Shuffling is per chunk: batches come
+# from a permutation of the current chunk, and the leftover rows carry into
+# the next chunk so every batch but the last is full.
+#
+# make_tf_dataset wraps the batch generator in tf.data with prefetching, so
+# the next batches are parsed and normalized while the model trains on the
+# current one. Memory is bounded by the chunk and the prefetch buffer.
+
+import json
+
+import numpy as np
+import pandas as pd
+
+CSV_CHUNK_ROWS = 100_000
+TRAIN, VAL, TEST = 0, 1, 2
+PARTS = {'train': TRAIN, 'val': VAL, 'test': TEST}
+DROP_COLUMNS = ('wstart', 'label')
+
+
+class StreamingScaler:
+    """Per-feature mean / std from chunks (Chan et al. pairwise merge)."""
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean = np.zeros(n_features, dtype=np.float64)
+        self.m2 = np.zeros(n_features, dtype=np.float64)
+
+    def update(self, X):
+        if len(X) == 0:
+            return
+        X = np.asarray(X, dtype=np.float64)
+        n_b = len(X)
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / n
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.n * n_b / n
+        self.n = n
+
+    @property
+    def std(self):
+        # Sample std plus the epsilon, as normalize_save (pandas .std()) gives it
+        return np.sqrt(self.m2 / max(self.n - 1, 1)) + 1e-9
+
+    def transform(self, X):
+        return ((X - self.mean) / self.std).astype(np.float32)
+
+    def to_json(self, features):
+        return {'mean': self.mean.tolist(), 'std': self.std.tolist(), 'features': list(features)}
+
+    def save(self, path, features):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(features), f)
+
+
+def csv_features(path):
+    """Feature columns of a labeled windows CSV (everything but wstart / label)."""
+    columns = pd.read_csv(path, nrows=0).columns
+    if 'label' not in columns:
+        raise ValueError("CSV must contain 'label' column.")
+    return [c for c in columns if c not in DROP_COLUMNS]
+
+
+def iter_csv_chunks(path, features, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield (X float64, y float32) per CSV chunk."""
+    for chunk in pd.read_csv(path, usecols=features + ['label'], chunksize=chunk_rows):
+        yield chunk[features].to_numpy(dtype=np.float64), chunk['label'].to_numpy(dtype=np.float32)
+
+
+def split_assignments(n, chunk_index, seed=42, val_frac=0.1, test_frac=0.2):
+    """TRAIN / VAL / TEST per row of a chunk; the same on every pass."""
+    u = np.random.default_rng([seed, chunk_index]).random(n)
+    part = np.full(n, TRAIN, dtype=np.int8)
+    part[u < test_frac + val_frac] = VAL
+    part[u < test_frac] = TEST
+    return part
+
+
+def fit_scaler(path, features, chunk_rows=CSV_CHUNK_ROWS, seed=42):
+    """One pass over the training part of the CSV; returns (scaler, row counts per part)."""
+    scaler = StreamingScaler(len(features))
+    counts = np.zeros(3, dtype=np.int64)
+    for i, (X, _y) in enumerate(iter_csv_chunks(path, features, chunk_rows)):
+        part = split_assignments(len(X), i, seed)
+        counts += np.bincount(part, minlength=3)
+        scaler.update(X[part == TRAIN])
+    return scaler, dict(zip(PARTS, counts.tolist()))
+
+
+def iter_batches(path, features, scaler, part='train', batch_size=64, shuffle=True, seed=42,
+                 chunk_rows=CSV_CHUNK_ROWS, epoch=0):
+    """Yield normalized (X float32, y float32) batches of one part of the CSV."""
+    rng = np.random.default_rng([seed, epoch, PARTS[part]])
+    carry_X = np.empty((0, len(features)), dtype=np.float32)
+    carry_y = np.empty(0, dtype=np.float32)
+    for i, (X, y) in enumerate(iter_csv_chunks(path, features, chunk_rows)):
+        keep = split_assignments(len(X), i, seed) == PARTS[part]
+        X = np.concatenate((carry_X, scaler.transform(X[keep])))
+        y = np.concatenate((carry_y, y[keep]))
+        if shuffle:
+            order = rng.permutation(len(X))
+            X, y = X[order], y[order]
+        full = len(X) - len(X) % batch_size
+        for start in range(0, full, batch_size):
+            yield X[start:start + batch_size], y[start:start + batch_size]
+        carry_X, carry_y = X[full:], y[full:]
+    if len(carry_X):
+        yield carry_X, carry_y
+
+
+def make_tf_dataset(path, features, scaler, part='train', batch_size=64, shuffle=True, seed=42,
+                    chunk_rows=CSV_CHUNK_ROWS):
+    """tf.data.Dataset of iter_batches, prefetched in the background.
+
+    A fresh shuffle order is drawn every time the dataset is iterated (i.e. per epoch).
+    """
+    import tensorflow as tf
+    epochs = iter(range(1 << 30))
+
+    def gen():
+        yield from iter_batches(path, features, scaler, part, batch_size, shuffle, seed, chunk_rows,
+                                epoch=next(epochs))
+
+    spec = (tf.TensorSpec(shape=(None, len(features)), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32))
+    return tf.data.Dataset.from_generator(gen, output_signature=spec).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,54 @@
+# notebooks/benchmark_tflite.py
+# Compare the float-I/O model against the full-integer export on Linux
+# (train_and_convert.py --int8): file size, batched throughput, single-row
+# latency including input preparation, accuracy and agreement with the float
+# model. Both read raw features; scaler.json is applied in Python for the float
+# model and folded into the int8 input codes for the integer one.
+#
+#   python benchmark_tflite.py --data ../data/windows_labeled.csv
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from tflite_model import DEFAULT_BATCH_SIZE, TFLiteModel
+
+ap = argparse.ArgumentParser(description='Float-I/O vs full-int8 TFLite benchmark')
+ap.add_argument('--data', default='../data/windows_labeled_synthetic.csv', help='Labeled windows CSV')
+ap.add_argument('--float-model', dest='float_model', default='../models/model_quant.tflite')
+ap.add_argument('--int8-model', dest='int8_model', default='../models/model_int8.tflite')
+ap.add_argument('--scaler', default='../models/scaler.json')
+ap.add_argument('--batch-size', dest='batch_size', type=int, default=DEFAULT_BATCH_SIZE)
+ap.add_argument('--threads', type=int, default=1, help='Interpreter threads (default 1, as on the phone)')
+ap.add_argument('--single-rows', dest='single_rows', type=int, default=2000,
+                help='One-row predictions timed per model')
+args = ap.parse_args()
+
+df = pd.read_csv(args.data)
+y = df['label'].to_numpy(dtype=int)
+results = []
+reference = None
+for name, path in (('float I/O', args.float_model), ('full int8', args.int8_model)):
+    model = TFLiteModel(path, args.scaler, num_threads=args.threads, batch_size=args.batch_size)
+    X = df[model.features].to_numpy(dtype=np.float32)
+    t0 = time.perf_counter()
+    proba = model.predict_proba(X)
+    batch_s = time.perf_counter() - t0
+    single = []
+    for i in range(min(args.single_rows, len(X))):
+        t0 = time.perf_counter()
+        model.predict_proba(X[i:i + 1])
+        single.append(time.perf_counter() - t0)
+    pred = (proba > 0.5).astype(int)
+    if reference is None:
+        reference = proba
+    results.append({'model': name, 'size_kb': os.path.getsize(path) / 1024,
+                    'rows_per_s': len(X) / batch_s,
+                    'single_p50_us': np.median(single) * 1e6, 'single_p99_us': np.percentile(single, 99) * 1e6,
+                    'accuracy': (pred == y).mean(), 'agreement': (pred == (reference > 0.5)).mean(),
+                    'max_abs_p_diff': np.abs(proba - reference).max()})
+
+print(f'{len(df)} rows from {args.data}, batch {args.batch_size}, {args.threads} thread(s)')
+print(pd.DataFrame(results).to_string(index=False, float_format=lambda v: f'{v:.4g}'))
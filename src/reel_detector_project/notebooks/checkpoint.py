@@ -0,0 +1,70 @@
+# notebooks/checkpoint.py
+# Sidecar checkpoints for resumable capture conversion.
+#
+# After each committed batch the converter records, next to its output:
+#   input_offset   byte offset of the next record/block to decode in the capture
+#   packets        packets written so far
+#   output_offset  committed output size (bytes for CSV, rows for a .pkts store)
+#   reader         PcapReader.state() so pcapng interface tables survive the restart
+#   devices        DeviceSketch.state() of the packets written so far (optional)
+# Output is fsynced before the checkpoint is atomically replaced, so on resume the
+# output is rolled back to output_offset (dropping anything written after the last
+# checkpoint) and decoding seeks straight to input_offset: no duplicated or lost rows.
+
+import json
+import os
+from pathlib import Path
+
+CHECKPOINT_SUFFIX = '.ckpt.json'
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_path(out_path):
+    return str(out_path).rstrip('/\\') + CHECKPOINT_SUFFIX
+
+
+def load_checkpoint(out_path, pcap_path):
+    """Checkpoint for out_path if it exists and belongs to pcap_path, else None."""
+    path = checkpoint_path(out_path)
+    if not os.path.exists(path) or not os.path.exists(out_path):
+        return None
+    try:
+        with open(path) as f:
+            ckpt = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if ckpt.get('version') != CHECKPOINT_VERSION:
+        return None
+    if Path(ckpt.get('input', '')).name != Path(pcap_path).name:
+        return None
+    if ckpt['input_offset'] > os.path.getsize(pcap_path):
+        return None
+    return ckpt
+
+
+def save_checkpoint(out_path, pcap_path, input_offset, packets, output_offset, reader_state=None,
+                    complete=False, devices=None):
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'input': str(pcap_path),
+        'input_offset': int(input_offset),
+        'packets': int(packets),
+        'output_offset': int(output_offset),
+        'reader': reader_state,
+        'complete': complete,
+        'devices': devices,
+    }
+    path = checkpoint_path(out_path)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return state
+
+
+def remove_checkpoint(out_path):
+    path = checkpoint_path(out_path)
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,31 +1,37 @@
 # notebooks/eval_tflite.py
-import json, numpy as np, pandas as pd
-import tensorflow as tf
+# Needs only a TFLite runtime (tflite_runtime, or TensorFlow as a fallback)
+# Batched: --batch-size rows per invoke on --threads interpreter threads;
+# --check-rows compares the first rows against the one-row-per-invoke loop
+import argparse
+import numpy as np, pandas as pd
 from sklearn.metrics import classification_report
 
-scaler = json.load(open('../models/scaler.json'))
-features = scaler['features']
-mean = np.array(scaler['mean'])
-std = np.array(scaler['std'])
+from tflite_model import DEFAULT_BATCH_SIZE, TFLiteModel
 
-# Update the path below to use your real windows CSV
-df = pd.read_csv('../data/windows_labeled_synthetic.csv')
-X_raw = df[features].values.astype(np.float32)
-Xn = (X_raw - mean) / std
-y = df['label'].values
+ap = argparse.ArgumentParser(description='Evaluate the TFLite model on a labeled windows CSV')
+# Update the default below to use your real windows CSV
+ap.add_argument('--data', default='../data/windows_labeled_synthetic.csv')
+ap.add_argument('--model', default='../models/model_quant.tflite')
+ap.add_argument('--scaler', default='../models/scaler.json')
+ap.add_argument('--batch-size', dest='batch_size', type=int, default=DEFAULT_BATCH_SIZE)
+ap.add_argument('--threads', type=int, default=None, help='Interpreter threads (default: runtime default)')
+ap.add_argument('--check-rows', dest='check_rows', type=int, default=1000,
+                help='Rows compared against the per-row invoke loop (0 to skip)')
+args = ap.parse_args()
 
-interpreter = tf.lite.Interpreter(model_path='../models/model_quant.tflite')
-interpreter.allocate_tensors()
-inp = interpreter.get_input_details()[0]
-outp = interpreter.get_output_details()[0]
+model = TFLiteModel(args.model, args.scaler, num_threads=args.threads, batch_size=args.batch_size)
+df = pd.read_csv(args.data)
+X_raw = df[model.features].values.astype(np.float32)
+y = df['label'].values
 
-preds = []
-for i in range(Xn.shape[0]):
-    x = Xn[i:i+1].astype(np.float32)
-    interpreter.set_tensor(inp['index'], x)
-    interpreter.invoke()
-    out = interpreter.get_tensor(outp['index'])[0][0]
-    preds.append(out)
+preds = model.predict_proba(X_raw)
+print(model.timing_summary())
+if args.check_rows:
+    n = min(args.check_rows, len(X_raw))
+    loop = model.row_loop_proba(X_raw[:n])
+    same = np.array_equal((loop > 0.5), (preds[:n] > 0.5))
+    print(f'Row-loop check on {n} rows: predictions {"identical" if same else "DIFFER"}, '
+          f'max |p diff| {np.abs(loop - preds[:n]).max():.2e}')
 
-y_pred = (np.array(preds) > 0.5).astype(int)
+y_pred = (preds > 0.5).astype(int)
 print(classification_report(y, y_pred))
@@ -0,0 +1,180 @@
+# notebooks/feature_cache.py
+# On-disk cache of packets_to_windows outputs, addressed by what produced them.
+#
+# An entry's key is the SHA-256 of the input fingerprint, the device, window,
+# step and FEATURE_SCHEMA_VERSION (plus any other parameter the caller passes),
+# so renaming or copying a capture still hits, while changing the data, the
+# parameters or the feature code misses. The fingerprint is a SHA-256 of the
+# full content: every byte of a packet CSV, or of meta.json and every column
+# of a .pkts store (with the file names inside the store, not the store's own
+# name). It costs one sequential read (~1 GB/s), less than the windowing pass
+# that reads the whole input anyway, and any edit to the rows misses even
+# when the size is unchanged.
+#
+# Layout: <root>/<key[:2]>/<key>.<ext>. Entries are written to a temp file in
+# the same directory and renamed into place, so readers on a shared volume
+# never see a partial entry and concurrent writers of the same key are
+# harmless. A hit refreshes the entry's mtime; when the cache grows past its
+# size bound the least recently used entries are removed by whichever job
+# holds the eviction lock (others skip eviction rather than wait).
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from windows import FEATURE_SCHEMA_VERSION
+
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+LOCK_NAME = '.evict.lock'
+STALE_LOCK_SECONDS = 300
+FINGERPRINT_READ_BYTES = 1024 * 1024
+ENTRY_MODE = 0o644          # mkstemp's 0600 would hide entries from other users' jobs
+
+
+def _file_fingerprint(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(FINGERPRINT_READ_BYTES)
+            if not buf:
+                break
+            h.update(buf)
+    return h.digest()
+
+
+def input_fingerprint(path):
+    """Content fingerprint of a packet CSV or .pkts store directory (independent of its name)."""
+    h = hashlib.sha256()
+    p = Path(path)
+    if p.is_dir():
+        for f in sorted(f for f in p.iterdir() if f.is_file() and not f.name.endswith('.tmp')):
+            h.update(f'{f.name}:{f.stat().st_size}:'.encode())
+            h.update(_file_fingerprint(f))
+    else:
+        h.update(f'{p.stat().st_size}:'.encode())
+        h.update(_file_fingerprint(p))
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """Size-bounded LRU directory of cached outputs, safe to share between jobs."""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, **parts):
+        parts['schema'] = FEATURE_SCHEMA_VERSION
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry(self, key, ext):
+        return self.root / key[:2] / f'{key}.{ext}'
+
+    def get(self, key, dest, ext='csv'):
+        """Copy the entry to dest and return True, or False on a miss."""
+        entry = self._entry(key, ext)
+        try:
+            shutil.copyfile(entry, dest)
+        except FileNotFoundError:
+            return False
+        self._touch(entry)
+        return True
+
+    def put(self, key, src, ext='csv'):
+        """Store a copy of src under key (atomic), then enforce the size bound."""
+        entry = self._entry(key, ext)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(src, 'rb') as f:
+                shutil.copyfileobj(f, out, 16 * 1024 * 1024)
+            os.chmod(tmp, ENTRY_MODE)
+            os.replace(tmp, entry)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def get_value(self, key):
+        """Small JSON value stored with put_value, or None."""
+        entry = self._entry(key, 'json')
+        try:
+            with open(entry) as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._touch(entry)
+        return value
+
+    def put_value(self, key, value):
+        entry = self._entry(key, 'json')
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+        os.chmod(tmp, ENTRY_MODE)
+        os.replace(tmp, entry)
+
+    def _touch(self, entry):
+        try:
+            os.utime(entry)
+        except OSError:
+            pass    # evicted meanwhile
+
+    def _entries(self):
+        for sub in self.root.iterdir():
+            if not sub.is_dir():
+                continue
+            for entry in sub.iterdir():
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, entry
+
+    def _acquire_lock(self):
+        lock = self.root / LOCK_NAME
+        for _ in range(2):
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock
+            except FileExistsError:
+                try:
+                    if time.time() - lock.stat().st_mtime < STALE_LOCK_SECONDS:
+                        return None
+                    lock.unlink()   # left behind by a crashed job
+                except FileNotFoundError:
+                    pass
+        return None
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = list(self._entries())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        lock = self._acquire_lock()
+        if lock is None:
+            return
+        try:
+            for _, size, entry in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    entry.unlink()
+                except OSError:
+                    continue    # already gone, or still open on a platform that forbids it
+                total -= size
+        finally:
+            try:
+                lock.unlink()
+            except FileNotFoundError:
+                pass
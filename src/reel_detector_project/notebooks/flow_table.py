@@ -0,0 +1,302 @@
+# notebooks/flow_table.py
+# Streaming 5-tuple flow table with NetFlow-style idle / active timeouts.
+#
+# Flows are bidirectional: (src, sport) and (dst, dport) are put in canonical
+# order, so both directions of a connection share one flow. A key is packed into
+# two uint64 (hi = address pair, lo = proto + port pair).
+#
+# FlowTable.update() takes a time-ordered batch of packet columns and returns a
+# flow id per packet. The batch is lexsorted by key (stable, so each key's
+# packets stay in time order); inside a key a new flow starts after a gap longer
+# than idle_timeout or once the flow has lasted active_timeout. Only the last
+# flow of each key can still be running, so only those occupy table slots; all
+# others are finished inside the batch and go straight to the finished records.
+# Live flows sit in fixed-capacity slot arrays (keys, first/last ts, packets,
+# bytes, id) found by one lexsort of live keys against the batch's keys. Flows
+# idle for longer than idle_timeout at the batch's last timestamp are expired,
+# and when more flows are live than `capacity` the least recently seen ones are
+# evicted, so memory stays bounded whatever the traffic. Finished flows are
+# only counted unless the table is built with keep_finished=True, in which case
+# the caller must drain them with pop_finished() as it goes.
+#
+# flow_window_features() turns per-packet flow ids into per-window aggregates
+# (active flows, byte share of the largest flow) for packets_to_windows --flows.
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_IDLE_TIMEOUT = 15.0       # seconds, NetFlow inactive timeout
+DEFAULT_ACTIVE_TIMEOUT = 1800.0   # seconds, NetFlow active timeout
+DEFAULT_CAPACITY = 65536
+FLOW_FEATURE_COLUMNS = ['active_flows', 'top_flow_share']
+
+END_IDLE, END_ACTIVE, END_CAPACITY, END_FINISH = 0, 1, 2, 3
+
+
+class FlowRecords(NamedTuple):
+    flow_id: np.ndarray     # int64, in order of creation
+    addr_a: np.ndarray      # uint32, canonical (lower) endpoint
+    port_a: np.ndarray      # uint16
+    addr_b: np.ndarray      # uint32
+    port_b: np.ndarray      # uint16
+    proto: np.ndarray       # uint8
+    first_ts: np.ndarray    # float64
+    last_ts: np.ndarray     # float64
+    packets: np.ndarray     # int64
+    bytes: np.ndarray       # int64
+    end_reason: np.ndarray  # uint8, END_*
+
+    def __len__(self):
+        return len(self.flow_id)
+
+    def to_frame(self):
+        return pd.DataFrame(self._asdict())
+
+
+def flow_keys(src, dst, proto, sport, dport):
+    """Canonical bidirectional (hi, lo) uint64 keys of packet 5-tuples."""
+    src = np.asarray(src, dtype=np.uint64)
+    dst = np.asarray(dst, dtype=np.uint64)
+    sport = np.asarray(sport, dtype=np.uint64)
+    dport = np.asarray(dport, dtype=np.uint64)
+    swap = (src > dst) | ((src == dst) & (sport > dport))
+    a, b = np.where(swap, dst, src), np.where(swap, src, dst)
+    pa, pb = np.where(swap, dport, sport), np.where(swap, sport, dport)
+    hi = (a << np.uint64(32)) | b
+    lo = (np.asarray(proto, dtype=np.uint64) << np.uint64(32)) | (pa << np.uint64(16)) | pb
+    return hi, lo
+
+
+def _unpack_keys(hi, lo):
+    mask16 = np.uint64(0xFFFF)
+    return ((hi >> np.uint64(32)).astype(np.uint32), ((lo >> np.uint64(16)) & mask16).astype(np.uint16),
+            (hi & np.uint64(0xFFFFFFFF)).astype(np.uint32), (lo & mask16).astype(np.uint16),
+            (lo >> np.uint64(32)).astype(np.uint8))
+
+
+def _records(ids, hi, lo, first, last, packets, nbytes, reason):
+    a, pa, b, pb, proto = _unpack_keys(hi, lo)
+    return FlowRecords(np.asarray(ids, dtype=np.int64), a, pa, b, pb, proto,
+                       np.asarray(first, dtype=np.float64), np.asarray(last, dtype=np.float64),
+                       np.asarray(packets, dtype=np.int64), np.asarray(nbytes, dtype=np.int64),
+                       np.broadcast_to(np.asarray(reason, dtype=np.uint8), len(ids)).copy())
+
+
+class FlowTable:
+    """Memory-bounded flow table; update() assigns flow ids to time-ordered packet batches.
+
+    With keep_finished, FlowRecords of ended flows are held until pop_finished().
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, active_timeout=DEFAULT_ACTIVE_TIMEOUT,
+                 capacity=DEFAULT_CAPACITY, keep_finished=False):
+        if idle_timeout < 0 or active_timeout <= 0 or capacity < 1:
+            raise ValueError('FlowTable needs idle_timeout >= 0, active_timeout > 0 and capacity >= 1')
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.capacity = capacity
+        self.hi = np.zeros(capacity, dtype=np.uint64)
+        self.lo = np.zeros(capacity, dtype=np.uint64)
+        self.first_ts = np.zeros(capacity)
+        self.last_ts = np.zeros(capacity)
+        self.packets = np.zeros(capacity, dtype=np.int64)
+        self.bytes = np.zeros(capacity, dtype=np.int64)
+        self.flow_id = np.zeros(capacity, dtype=np.int64)
+        self.used = np.zeros(capacity, dtype=bool)
+        self.next_id = 0
+        self.evicted = 0            # flows cut short because the table was full
+        self.finished = 0           # flows ended so far
+        self.keep_finished = keep_finished
+        self._finished = []
+
+    def _emit(self, ids, hi, lo, first, last, packets, nbytes, reason):
+        self.finished += len(ids)
+        if self.keep_finished:
+            self._finished.append(_records(ids, hi, lo, first, last, packets, nbytes, reason))
+
+    def __len__(self):
+        return int(self.used.sum())
+
+    def _lookup(self, hi, lo):
+        """Slot of each (unique) key, or -1."""
+        live = np.flatnonzero(self.used)
+        slots = np.full(len(hi), -1, dtype=np.int64)
+        if len(live) == 0 or len(hi) == 0:
+            return slots
+        all_hi = np.concatenate((self.hi[live], hi))
+        all_lo = np.concatenate((self.lo[live], lo))
+        from_batch = np.concatenate((np.zeros(len(live), dtype=bool), np.ones(len(hi), dtype=bool)))
+        o = np.lexsort((from_batch, all_lo, all_hi))
+        same = (all_hi[o[1:]] == all_hi[o[:-1]]) & (all_lo[o[1:]] == all_lo[o[:-1]])
+        slots[o[1:][same] - len(live)] = live[o[:-1][same]]
+        return slots
+
+    def _finish_slots(self, slots, reason):
+        if len(slots):
+            self._emit(self.flow_id[slots], self.hi[slots], self.lo[slots], self.first_ts[slots],
+                       self.last_ts[slots], self.packets[slots], self.bytes[slots], reason)
+            self.used[slots] = False
+
+    def update(self, ts, length, src, dst, proto, sport, dport):
+        """Flow id (int64) of every packet. Batches must be in time order."""
+        n = len(ts)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        ts = np.asarray(ts, dtype=np.float64)
+        length = np.asarray(length, dtype=np.int64)
+        hi, lo = flow_keys(src, dst, proto, sport, dport)
+        order = np.lexsort((lo, hi))    # stable: time order kept inside each key
+        t, ln, h, l = ts[order], length[order], hi[order], lo[order]
+        new_key = np.ones(n, dtype=bool)
+        new_key[1:] = (h[1:] != h[:-1]) | (l[1:] != l[:-1])
+        gstart = np.flatnonzero(new_key)
+
+        # A key's first packet continues its live flow unless that flow has gone idle
+        slot = self._lookup(h[gstart], l[gstart])
+        has_slot = slot >= 0
+        cont = has_slot.copy()
+        cont[has_slot] = t[gstart[has_slot]] - self.last_ts[slot[has_slot]] <= self.idle_timeout
+        self._finish_slots(slot[has_slot & ~cont], END_IDLE)
+
+        # Flow starts: new key or idle gap, then active-timeout splits until none remain
+        seg = new_key.copy()
+        seg[1:] |= np.diff(t) > self.idle_timeout
+        seg_t0 = t.copy()   # start time of the flow a packet opening a segment belongs to
+        seg_t0[gstart[cont]] = self.first_ts[slot[cont]]
+        forced = np.zeros(n, dtype=bool)
+        idx = np.arange(n)
+        while True:
+            start = np.maximum.accumulate(np.where(seg, idx, 0))
+            over = np.flatnonzero(t - seg_t0[start] >= self.active_timeout)
+            if len(over) == 0:
+                break
+            # Only the first overrun of each flow starts a new one; later ones are re-checked
+            first = over[np.concatenate(([True], start[over[1:]] != start[over[:-1]]))]
+            seg[first] = True
+            forced[first] = True
+            seg_t0[first] = t[first]
+        restarted = cont & forced[gstart]
+        self._finish_slots(slot[restarted], END_ACTIVE)
+        cont &= ~restarted
+
+        starts = np.flatnonzero(seg)
+        ends = np.append(starts[1:], n)
+        batch_packets = ends - starts
+        seg_packets = batch_packets
+        seg_bytes = np.add.reduceat(ln, starts)
+        seg_first, seg_last = t[starts], t[ends - 1]
+        group = np.cumsum(new_key)[starts] - 1
+        last_of_key = np.append(group[1:] != group[:-1], True)
+        first_of_key = new_key[starts]
+
+        seg_ids = np.empty(len(starts), dtype=np.int64)
+        continuing = np.zeros(len(starts), dtype=bool)
+        continuing[first_of_key] = cont
+        cslots = slot[cont]
+        seg_ids[continuing] = self.flow_id[cslots]
+        fresh = ~continuing
+        seg_ids[fresh] = self.next_id + np.arange(int(fresh.sum()))
+        self.next_id += int(fresh.sum())
+
+        # Continued flows absorb their first segment
+        self.last_ts[cslots] = seg_last[continuing]
+        self.packets[cslots] += seg_packets[continuing]
+        self.bytes[cslots] += seg_bytes[continuing]
+        seg_first = seg_first.copy()
+        seg_first[continuing] = self.first_ts[cslots]
+        seg_packets = seg_packets.copy()
+        seg_packets[continuing] = self.packets[cslots]
+        seg_bytes = seg_bytes.copy()
+        seg_bytes[continuing] = self.bytes[cslots]
+
+        # Flows followed by another flow of the same key ended inside the batch
+        done = ~last_of_key
+        done_slots = np.full(len(starts), -1, dtype=np.int64)
+        done_slots[continuing] = cslots
+        self.used[done_slots[done & continuing]] = False
+        next_forced = np.append(forced[starts[1:]], False)
+        for reason, sel in ((END_ACTIVE, done & next_forced), (END_IDLE, done & ~next_forced)):
+            if sel.any():
+                self._emit(seg_ids[sel], h[starts[sel]], l[starts[sel]], seg_first[sel],
+                           seg_last[sel], seg_packets[sel], seg_bytes[sel], reason)
+
+        now = float(t.max())
+        self.expire(now)
+
+        # New live flows take free slots, evicting the least recently seen when full
+        new = np.flatnonzero(last_of_key & fresh)
+        free = self.capacity - len(self)
+        if len(new) > free:
+            live = np.flatnonzero(self.used)
+            need = min(len(new) - free, len(live))
+            victims = live[np.argsort(self.last_ts[live], kind='stable')[:need]]
+            self._finish_slots(victims, END_CAPACITY)
+            self.evicted += need
+            if len(new) > self.capacity:
+                drop = new[np.argsort(seg_last[new], kind='stable')[:len(new) - self.capacity]]
+                self._emit(seg_ids[drop], h[starts[drop]], l[starts[drop]], seg_first[drop],
+                           seg_last[drop], seg_packets[drop], seg_bytes[drop], END_CAPACITY)
+                self.evicted += len(drop)
+                new = np.setdiff1d(new, drop)
+        slots = np.flatnonzero(~self.used)[:len(new)]
+        self.hi[slots], self.lo[slots] = h[starts[new]], l[starts[new]]
+        self.first_ts[slots], self.last_ts[slots] = seg_first[new], seg_last[new]
+        self.packets[slots], self.bytes[slots] = seg_packets[new], seg_bytes[new]
+        self.flow_id[slots] = seg_ids[new]
+        self.used[slots] = True
+        self.expire(now)
+
+        out = np.empty(n, dtype=np.int64)
+        out[order] = np.repeat(seg_ids, batch_packets)
+        return out
+
+    def expire(self, now):
+        """Finish live flows idle for longer than idle_timeout at time now."""
+        self._finish_slots(np.flatnonzero(self.used & (self.last_ts < now - self.idle_timeout)), END_IDLE)
+
+    def finish(self):
+        """Finish every live flow (end of input)."""
+        self._finish_slots(np.flatnonzero(self.used), END_FINISH)
+
+    def pop_finished(self):
+        """FlowRecords of the flows finished since the last call, by flow id (needs keep_finished)."""
+        if not self.keep_finished:
+            raise ValueError('FlowTable was built without keep_finished')
+        if not self._finished:
+            return _records([], np.zeros(0, np.uint64), np.zeros(0, np.uint64), [], [], [], [], END_IDLE)
+        parts = self._finished
+        self._finished = []
+        rec = FlowRecords(*(np.concatenate(cols) for cols in zip(*parts)))
+        return FlowRecords(*(col[np.argsort(rec.flow_id, kind='stable')] for col in rec))
+
+
+def flow_window_features(ts, length, flow_id, wstart, window_size):
+    """Per-window flow aggregates over sorted packets, for windows holding any packet.
+
+    active_flows counts the distinct flows with a packet in [wstart, wstart + window_size);
+    top_flow_share is the largest flow's share of the window's bytes. Rows line up
+    with window_features() for the same ts and wstart.
+    """
+    lo = np.searchsorted(ts, wstart, side='left')
+    hi = np.searchsorted(ts, wstart + window_size, side='left')
+    keep = hi > lo
+    lo, hi = lo[keep], hi[keep]
+    nwin = len(lo)
+    counts = hi - lo
+    # Every (window, packet) pair: windows overlap, so a packet appears win/step times
+    win = np.repeat(np.arange(nwin), counts)
+    pkt = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    _, flow = np.unique(flow_id, return_inverse=True)
+    nflows = int(flow.max()) + 1 if len(flow) else 1
+    pair, inverse = np.unique(win * nflows + flow[pkt], return_inverse=True)
+    pair_bytes = np.bincount(inverse, weights=length[pkt].astype(np.float64))
+    pair_win = pair // nflows
+    active = np.bincount(pair_win, minlength=nwin)
+    first = np.concatenate(([0], np.cumsum(active)[:-1]))
+    top = np.maximum.reduceat(pair_bytes, first) if nwin else np.zeros(0)
+    total = np.bincount(win, weights=length[pkt].astype(np.float64), minlength=nwin)
+    share = np.divide(top, total, out=np.zeros(nwin), where=total > 0)
+    return pd.DataFrame({'active_flows': active.astype(np.int64), 'top_flow_share': share},
+                        columns=FLOW_FEATURE_COLUMNS)
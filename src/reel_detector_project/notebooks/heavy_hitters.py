@@ -0,0 +1,209 @@
+# notebooks/heavy_hitters.py
+# Bounded-memory device autodetection over a whole capture.
+#
+# SpaceSaving keeps at most `capacity` (key, count, error) counters. Packets are
+# folded in a batch at a time: each batch is first reduced to per-key byte sums,
+# keys already tracked add their sum, new keys enter at the current minimum
+# count (recorded as their error) and the table is trimmed back to the largest
+# `capacity` counts. Estimates never undercount, and count - error never
+# overcounts, so any host with more than total/capacity bytes is guaranteed to
+# be tracked. Two sketches merge the same way, which lets parallel conversion
+# shards each keep their own.
+#
+# DeviceSketch tracks bytes received (dst) and sent (src) by private-range
+# hosts, plus bytes per destination of any kind as the fallback the old
+# sample-based autodetect used. Converters update it per batch and leave it
+# next to their output as <out>.devices.json.
+
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from pcap_reader import PRIVATE_PREFIXES, PrefixTable, ipv4_private_mask, ipv4_to_str, private_prefixes
+
+DEFAULT_CAPACITY = 1024
+DEFAULT_TOP_K = 10
+DEVICES_SUFFIX = '.devices.json'
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter sketch over uint32 keys with float64 weights."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.keys = np.empty(0, dtype=np.uint32)    # sorted
+        self.counts = np.empty(0, dtype=np.float64)
+        self.errors = np.empty(0, dtype=np.float64)
+        self.total = 0.0
+
+    def floor(self):
+        """Count a key not in the table may already have (0 until the table is full)."""
+        return float(self.counts.min()) if len(self.keys) >= self.capacity else 0.0
+
+    def update(self, keys, weights):
+        keys = np.asarray(keys, dtype=np.uint32)
+        if len(keys) == 0:
+            return
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.asarray(weights, dtype=np.float64), minlength=len(uniq))
+        self.total += float(sums.sum())
+        self._combine(uniq, sums, np.zeros(len(uniq)), self.floor(), 0.0)
+
+    def merge(self, other):
+        self.total += other.total
+        self._combine(other.keys, other.counts, other.errors, self.floor(), other.floor())
+
+    def _combine(self, keys, counts, errors, own_floor, other_floor):
+        # A key missing from one side may have had up to that side's floor there
+        all_keys = np.union1d(self.keys, keys)
+        new_counts = np.zeros(len(all_keys))
+        new_errors = np.zeros(len(all_keys))
+        for k, c, e, floor in ((self.keys, self.counts, self.errors, own_floor),
+                               (keys, counts, errors, other_floor)):
+            present = np.zeros(len(all_keys), dtype=bool)
+            pos = np.searchsorted(all_keys, k)
+            present[pos] = True
+            new_counts[pos] += c
+            new_errors[pos] += e
+            new_counts[~present] += floor
+            new_errors[~present] += floor
+        if len(all_keys) > self.capacity:
+            keep = np.sort(np.argpartition(-new_counts, self.capacity - 1)[:self.capacity])
+            all_keys, new_counts, new_errors = all_keys[keep], new_counts[keep], new_errors[keep]
+        self.keys, self.counts, self.errors = all_keys, new_counts, new_errors
+
+    def estimate(self, keys):
+        """(count, error) per key; untracked keys get (floor, floor)."""
+        keys = np.asarray(keys, dtype=np.uint32)
+        pos = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        hit = (self.keys[pos] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        floor = self.floor()
+        count = np.where(hit, self.counts[pos] if len(self.keys) else 0.0, floor)
+        error = np.where(hit, self.errors[pos] if len(self.keys) else 0.0, floor)
+        return count, error
+
+    def top(self, k):
+        """Indices of the k largest counters, largest first."""
+        return np.argsort(-self.counts, kind='stable')[:k]
+
+    def state(self):
+        return {'capacity': self.capacity, 'total': self.total, 'keys': self.keys.tolist(),
+                'counts': self.counts.tolist(), 'errors': self.errors.tolist()}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state['capacity'])
+        sketch.total = state['total']
+        sketch.keys = np.asarray(state['keys'], dtype=np.uint32)
+        sketch.counts = np.asarray(state['counts'], dtype=np.float64)
+        sketch.errors = np.asarray(state['errors'], dtype=np.float64)
+        return sketch
+
+
+class DeviceEstimate(NamedTuple):
+    ip: str
+    bytes_down: float   # estimated bytes received (may overcount by error_down)
+    bytes_up: float
+    error_down: float
+    error_up: float
+
+
+class DeviceSketch:
+    """Heavy-hitter sketches of bytes to / from private hosts, updated per packet batch."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.down = SpaceSaving(capacity)   # private dst -> bytes received
+        self.up = SpaceSaving(capacity)     # private src -> bytes sent
+        self.any_dst = SpaceSaving(capacity)
+        self.packets = 0
+
+    def update(self, src, dst, length):
+        """Fold in a batch of uint32 src/dst addresses (0 = unknown) and packet lengths."""
+        src = np.asarray(src, dtype=np.uint32)
+        dst = np.asarray(dst, dtype=np.uint32)
+        length = np.asarray(length, dtype=np.float64)
+        self.packets += len(length)
+        d = ipv4_private_mask(dst)
+        s = ipv4_private_mask(src)
+        self.down.update(dst[d], length[d])
+        self.up.update(src[s], length[s])
+        known = dst != 0
+        self.any_dst.update(dst[known], length[known])
+
+    def merge(self, other):
+        self.down.merge(other.down)
+        self.up.merge(other.up)
+        self.any_dst.merge(other.any_dst)
+        self.packets += other.packets
+
+    def ranked(self, k=DEFAULT_TOP_K):
+        """Top-k private hosts by received bytes, then sent bytes (as the old autodetect)."""
+        keys = np.union1d(self.down.keys[self.down.top(k)], self.up.keys[self.up.top(k)])
+        if len(keys) == 0:
+            return []
+        down, err_down = self.down.estimate(keys)
+        up, err_up = self.up.estimate(keys)
+        order = np.lexsort((-up, -down))[:k]
+        names = ipv4_to_str(keys[order])
+        return [DeviceEstimate(str(names[i]), float(down[j]), float(up[j]),
+                               float(err_down[j]), float(err_up[j]))
+                for i, j in enumerate(order)]
+
+    def choose_device(self, k=DEFAULT_TOP_K):
+        """Best device IP: top private receiver, else top private sender, else busiest destination."""
+        ranked = self.ranked(k)
+        if ranked:
+            return ranked[0].ip
+        if len(self.any_dst.keys):
+            return str(ipv4_to_str(self.any_dst.keys[self.any_dst.top(1)])[0])
+        return '0.0.0.0'
+
+    def state(self):
+        return {'packets': self.packets, 'down': self.down.state(), 'up': self.up.state(),
+                'any_dst': self.any_dst.state()}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls()
+        sketch.packets = state['packets']
+        sketch.down = SpaceSaving.from_state(state['down'])
+        sketch.up = SpaceSaving.from_state(state['up'])
+        sketch.any_dst = SpaceSaving.from_state(state['any_dst'])
+        return sketch
+
+
+def devices_path(out_path):
+    return str(out_path).rstrip('/\\') + DEVICES_SUFFIX
+
+
+def save_device_sketch(out_path, sketch, k=DEFAULT_TOP_K):
+    """Write the sketch (and its ranked top-k for reading by eye) next to a converter output."""
+    state = sketch.state()
+    state['top'] = [d._asdict() for d in sketch.ranked(k)]
+    state['prefixes'] = str(private_prefixes())
+    path = devices_path(out_path)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+    return path
+
+
+def load_device_sketch(packets_path):
+    """Sketch saved alongside packets_path, or None if missing, older than the packets
+    or built with a different private prefix table."""
+    path = devices_path(packets_path)
+    if not os.path.exists(path) or not os.path.exists(packets_path):
+        return None
+    if os.path.getmtime(path) < os.path.getmtime(packets_path):
+        return None
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('prefixes', str(PrefixTable(PRIVATE_PREFIXES))) != str(private_prefixes()):
+            return None
+        return DeviceSketch.from_state(state)
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,321 @@
+# notebooks/packet_store.py
+# Columnar, memory-mappable on-disk packet format (ts,length,src,dst) used in place of packet CSV.
+#
+# A store is a directory (by convention named *.pkts) holding one raw little-endian
+# file per column plus meta.json:
+#   ts.f64      float64 epoch seconds
+#   length.u16  uint16 packet length (saturated at 65535)
+#   src.u32     uint32 IPv4 source (0 = unknown / non-IPv4)
+#   dst.u32     uint32 IPv4 destination
+# and, in stores written with flow fields (converters' --flows):
+#   proto.u8    uint8 IP protocol
+#   sport.u16   uint16 TCP/UDP source port (0 when not available)
+#   dport.u16   uint16 TCP/UDP destination port
+# and, once the writer first sees an IPv6 packet:
+#   src6_hi.u64, src6_lo.u64, dst6_hi.u64, dst6_lo.u64
+#               big-endian halves of the IPv6 addresses (0 for IPv4 rows, whose
+#               src/dst hold the address; earlier rows are zero-filled)
+# meta.json lists the columns a store has, so older 4-column stores still open.
+# Writers append whole chunks to every column file and then atomically rewrite
+# meta.json, which records the committed row count and the row range / time span
+# of each chunk. Readers only trust committed rows, so a crash mid-append never
+# exposes a partial chunk, and reopening for append discards any uncommitted tail.
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pcap_reader import format_csv_rows
+
+STORE_SUFFIX = '.pkts'
+META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+COLUMNS = {
+    'ts': ('ts.f64', np.dtype('<f8')),
+    'length': ('length.u16', np.dtype('<u2')),
+    'src': ('src.u32', np.dtype('<u4')),
+    'dst': ('dst.u32', np.dtype('<u4')),
+}
+FLOW_COLUMNS = {
+    'proto': ('proto.u8', np.dtype('<u1')),
+    'sport': ('sport.u16', np.dtype('<u2')),
+    'dport': ('dport.u16', np.dtype('<u2')),
+}
+IPV6_COLUMNS = {
+    'src6_hi': ('src6_hi.u64', np.dtype('<u8')),
+    'src6_lo': ('src6_lo.u64', np.dtype('<u8')),
+    'dst6_hi': ('dst6_hi.u64', np.dtype('<u8')),
+    'dst6_lo': ('dst6_lo.u64', np.dtype('<u8')),
+}
+CSV_HEADER = 'ts,length,src,dst\r\n'
+CSV_FLOW_HEADER = 'ts,length,src,dst,proto,sport,dport\r\n'
+
+
+def _store_columns(flows, ipv6=False):
+    columns = {**COLUMNS, **FLOW_COLUMNS} if flows else dict(COLUMNS)
+    if ipv6:
+        columns.update(IPV6_COLUMNS)
+    return columns
+
+
+def is_packet_store(path) -> bool:
+    """True for an existing store directory or a path meant to become one."""
+    p = Path(path)
+    return (p / META_FILE).exists() or p.suffix == STORE_SUFFIX
+
+
+def _read_meta(path):
+    with open(Path(path) / META_FILE) as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f'Unsupported packet store version: {meta.get("version")}')
+    return meta
+
+
+def _write_meta(path, meta):
+    tmp = Path(path) / (META_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, Path(path) / META_FILE)
+
+
+class PacketStore:
+    """Read-only view of a packet store. Columns are np.memmap arrays (zero-copy)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = _read_meta(self.path)
+        self.rows = int(self.meta['rows'])
+        self.chunks = self.meta['chunks']
+        self.has_flows = 'proto' in self.meta['columns']
+        self.has_ipv6 = 'src6_hi' in self.meta['columns']
+        store_columns = _store_columns(self.has_flows, self.has_ipv6)
+        self.columns = list(store_columns)
+        for name, (fname, dtype) in store_columns.items():
+            if self.rows == 0:
+                col = np.empty(0, dtype=dtype)
+            else:
+                col = np.memmap(self.path / fname, dtype=dtype, mode='r', shape=(self.rows,))
+            setattr(self, name, col)
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        return getattr(self, name)
+
+    @property
+    def ip6(self):
+        """(src_hi, src_lo, dst_hi, dst_lo) columns, or None for a store without IPv6 rows."""
+        return (self.src6_hi, self.src6_lo, self.dst6_hi, self.dst6_lo) if self.has_ipv6 else None
+
+    def to_frame(self, columns=None, start=0, stop=None):
+        """DataFrame over rows [start, stop) backed by the memmaps (no copy)."""
+        columns = columns or self.columns
+        data = {c: self.column(c)[start:stop] for c in columns}
+        return pd.DataFrame(data, copy=False)
+
+    def iter_chunks(self):
+        """Yield (start, stop) row ranges of the chunks as they were written."""
+        for chunk in self.chunks:
+            yield chunk['start'], chunk['start'] + chunk['rows']
+
+
+def open_packet_store(path) -> PacketStore:
+    return PacketStore(path)
+
+
+class PacketStoreWriter:
+    """Append ts,length,src,dst (and with flows=True proto,sport,dport) columns to a packet store.
+
+    append=False starts a new store (replacing existing column data); append=True
+    continues after the last committed chunk, or after row truncate_to if given
+    (used to roll back to a conversion checkpoint). The IPv6 columns are added
+    by the first append that carries an IPv6 address.
+    """
+
+    def __init__(self, path, append=False, truncate_to=None, flows=False):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flows = flows
+        self.columns = _store_columns(flows)
+        if append and (self.path / META_FILE).exists():
+            self.meta = _read_meta(self.path)
+            if ('proto' in self.meta['columns']) != flows:
+                raise ValueError(f'{path} was written {"without" if flows else "with"} flow columns')
+            if truncate_to is not None and truncate_to < self.meta['rows']:
+                self._rollback(truncate_to)
+            if 'src6_hi' in self.meta['columns']:
+                self.columns.update(IPV6_COLUMNS)
+        else:
+            self.meta = {'version': FORMAT_VERSION, 'rows': 0, 'chunks': [],
+                         'columns': {c: [f, d.str] for c, (f, d) in self.columns.items()}}
+        self._files = {}
+        rows = self.meta['rows']
+        for name, (fname, dtype) in self.columns.items():
+            f = open(self.path / fname, 'r+b' if (self.path / fname).exists() else 'w+b')
+            # Drop anything past the last commit (e.g. a crash between data and meta writes)
+            f.truncate(rows * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            self._files[name] = f
+        _write_meta(self.path, self.meta)
+
+    def _add_ipv6_columns(self):
+        rows = self.meta['rows']
+        for name, (fname, dtype) in IPV6_COLUMNS.items():
+            f = open(self.path / fname, 'w+b')
+            f.truncate(rows * dtype.itemsize)     # earlier rows read as ::
+            f.seek(0, os.SEEK_END)
+            self._files[name] = f
+            self.columns[name] = (fname, dtype)
+            self.meta['columns'][name] = [fname, dtype.str]
+
+    def _rollback(self, rows):
+        chunks = []
+        for chunk in self.meta['chunks']:
+            if chunk['start'] >= rows:
+                break
+            if chunk['start'] + chunk['rows'] > rows:
+                chunk = dict(chunk, rows=rows - chunk['start'])
+            chunks.append(chunk)
+        self.meta['chunks'] = chunks
+        self.meta['rows'] = rows
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def commit(self):
+        """Committed output offset (rows). Every append is already durable."""
+        return self.meta['rows']
+
+    def append(self, ts, length, src, dst, proto=None, sport=None, dport=None, ip6=None):
+        """Append one chunk and commit it. src/dst must already be uint32 addresses;
+        ip6 is the optional (src_hi, src_lo, dst_hi, dst_lo) uint64 columns.
+        """
+        n = len(ts)
+        if n == 0:
+            return
+        cols = {
+            'ts': np.asarray(ts, dtype=np.float64),
+            'length': np.minimum(np.asarray(length), 65535),
+            'src': np.asarray(src),
+            'dst': np.asarray(dst),
+        }
+        if self.flows:
+            if proto is None:
+                raise ValueError('This store has flow columns: append needs proto, sport and dport')
+            cols.update(proto=np.asarray(proto), sport=np.asarray(sport), dport=np.asarray(dport))
+        if ip6 is not None and 'src6_hi' not in self.columns and any(np.any(col) for col in ip6):
+            self._add_ipv6_columns()
+        if 'src6_hi' in self.columns:
+            halves = ip6 if ip6 is not None else (np.zeros(n, dtype=np.uint64),) * 4
+            cols.update(zip(IPV6_COLUMNS, halves))
+        for name, (_fname, dtype) in self.columns.items():
+            f = self._files[name]
+            f.write(np.ascontiguousarray(cols[name], dtype=dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        start = self.meta['rows']
+        self.meta['chunks'].append({'start': start, 'rows': n,
+                                    'ts_min': float(cols['ts'].min()), 'ts_max': float(cols['ts'].max())})
+        self.meta['rows'] = start + n
+        _write_meta(self.path, self.meta)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class CsvPacketWriter:
+    """Same append interface as PacketStoreWriter, producing the ts,length,src,dst CSV."""
+
+    def __init__(self, path, append=False, truncate_to=None, flows=False):
+        self.path = path
+        self.rows = 0
+        self.flows = flows
+        header = CSV_FLOW_HEADER if flows else CSV_HEADER
+        exists = append and os.path.exists(path)
+        if exists and truncate_to is not None:
+            # Roll back to a checkpoint: drop bytes written after it
+            with open(path, 'r+b') as f:
+                f.truncate(truncate_to)
+        write_header = not (exists and os.path.getsize(path) > 0)
+        if not write_header:
+            with open(path, newline='') as f:
+                if f.readline().rstrip('\r\n') != header.rstrip('\r\n'):
+                    raise ValueError(f'{path} was written {"without" if flows else "with"} flow columns')
+        self._f = open(path, 'a' if append else 'w', newline='')
+        if write_header:
+            self._f.write(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, ts, length, src, dst, proto=None, sport=None, dport=None, ip6=None):
+        extra = (proto, sport, dport) if self.flows else ()
+        self._f.write(format_csv_rows(np.asarray(ts), np.asarray(length), src, dst, *extra, ip6=ip6))
+        self.rows += len(ts)
+
+    def commit(self):
+        """Flush rows to disk and return the committed output offset (bytes)."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+
+def committed_output_offset(path):
+    """Durable size of an output written by another process: rows for a store, bytes for CSV."""
+    if is_packet_store(path):
+        return open_packet_store(path).rows
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+        return os.fstat(f.fileno()).st_size
+
+
+def open_packet_writer(path, append=False, truncate_to=None, flows=False):
+    """Pick the packet store or CSV writer from the output path."""
+    if is_packet_store(path):
+        return PacketStoreWriter(path, append=append, truncate_to=truncate_to, flows=flows)
+    return CsvPacketWriter(path, append=append, truncate_to=truncate_to, flows=flows)
+
+
+def concat_packet_outputs(part_paths, out_path):
+    """Concatenate part outputs (all CSV or all stores) into out_path, in order."""
+    if is_packet_store(out_path):
+        stores = [open_packet_store(part) for part in part_paths]
+        with PacketStoreWriter(out_path, flows=bool(stores) and stores[0].has_flows) as writer:
+            for store in stores:
+                flow_cols = ('proto', 'sport', 'dport') if store.has_flows else ()
+                for start, stop in store.iter_chunks():
+                    ip6 = store.ip6
+                    writer.append(*(store.column(c)[start:stop] for c in COLUMNS),
+                                  *(store.column(c)[start:stop] for c in flow_cols),
+                                  ip6=None if ip6 is None else tuple(col[start:stop] for col in ip6))
+        return
+    with open(out_path, 'wb') as out:
+        for i, part in enumerate(part_paths):
+            with open(part, 'rb') as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out, 16 * 1024 * 1024)
@@ -0,0 +1,758 @@
+# notebooks/pcap_reader.py
+# Memory-mapped capture reader that returns packet columns as NumPy arrays in batches.
+# Understands classic libpcap (microsecond and nanosecond magic, either byte order)
+# and pcapng (Enhanced Packet Blocks, multiple interfaces with per-interface
+# if_tsresol / if_tsoffset).
+#
+# The capture is mmapped once; a single sequential pass indexes record offsets
+# (the only per-record Python work, one unpack per record / block), then
+# timestamps, lengths and data offsets for a whole batch are gathered with
+# vectorized NumPy indexing. No per-packet Python objects are built.
+#
+# Network headers are decoded the same way: network_offsets() turns each
+# packet's interface linktype (Ethernet with VLAN / QinQ tags, Linux cooked
+# SLL / SLL2, BSD loopback, raw IP) into an IP header offset for the whole
+# batch, and network_headers() reads IPv4 and IPv6 addresses, protocol and
+# TCP/UDP ports from those offsets.
+
+import ipaddress
+import mmap
+import os
+import struct
+from array import array
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_USEC_SWAPPED = 0xd4c3b2a1
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAP_MAGIC_NSEC_SWAPPED = 0x4d3cb2a1
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002  # obsolete Packet Block
+PCAPNG_SPB = 0x00000003  # Simple Packet Block (no timestamp)
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_BYTE_ORDER_MAGIC_SWAPPED = 0x4D3C2B1A
+PCAPNG_EPB_HEADER_LEN = 28
+PCAPNG_OPT_TSRESOL = 9
+PCAPNG_OPT_TSOFFSET = 14
+GLOBAL_HEADER_LEN = 24
+RECORD_HEADER_LEN = 16
+MAX_RECORD_LEN = 65535
+DEFAULT_BATCH_SIZE = 1_000_000
+# Resync: a shard boundary must start this many consecutive plausible records,
+# with neighbouring timestamps no further apart than the gap below.
+RESYNC_CHAIN = 8
+RESYNC_MAX_GAP_SECONDS = 86400
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+# Linktypes (global header / IDB) with a known offset to the IP header
+LINKTYPE_NULL = 0           # BSD loopback: 4-byte address family
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113    # Linux "any" cooked capture, 16-byte header
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276   # 20-byte cooked header, protocol first
+RAW_LINKTYPES = (12, 14, LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6)   # 12 / 14: DLT_RAW on some BSDs
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)     # 802.1Q, 802.1ad (QinQ), legacy QinQ
+MAX_VLAN_TAGS = 3
+IPV6_FRAGMENT = 44
+IPV6_EXT_HEADERS = (0, 43, IPV6_FRAGMENT, 60)   # hop-by-hop, routing, fragment, destination options
+MAX_IPV6_EXT_HEADERS = 4
+
+
+class PacketBatch(NamedTuple):
+    ts: np.ndarray           # float64 epoch seconds
+    incl_len: np.ndarray     # uint32 captured length
+    orig_len: np.ndarray     # uint32 length on the wire
+    data_offset: np.ndarray  # int64 offset of the packet bytes in the capture
+    iface: np.ndarray        # uint32 index into PcapReader.interfaces
+
+    def __len__(self):
+        return len(self.ts)
+
+
+class Interface(NamedTuple):
+    linktype: int
+    snaplen: int
+    units_per_sec: int  # timestamp resolution, e.g. 10**6 for microseconds
+    offset_sec: int     # if_tsoffset added to every timestamp
+
+
+def _tsresol_units(value):
+    """Units per second for a pcapng if_tsresol byte (MSB set: power of two)."""
+    if value & 0x80:
+        return 2 ** (value & 0x7F)
+    return 10 ** value
+
+
+class PcapReader:
+    """Read a libpcap or pcapng capture through mmap.
+
+    Usage:
+        with PcapReader('capture.pcap') as reader:
+            for batch in reader.iter_batches():
+                ...  # batch.ts, batch.incl_len, batch.data_offset
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < GLOBAL_HEADER_LEN:
+            self._file.close()
+            raise ValueError('Invalid PCAP file - too short')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = size
+        self.buf = np.frombuffer(self._mm, dtype=np.uint8)
+        self.skipped_records = 0
+        self.truncated = False
+        self.interfaces = []
+
+        magic = struct.unpack_from('<I', self._mm, 0)[0]
+        self.magic = magic
+        try:
+            if magic == PCAPNG_SHB:
+                self._init_pcapng()
+            else:
+                self._init_pcap(magic)
+        except ValueError:
+            self.close()
+            raise
+        self._u32 = np.dtype(self.endian + 'u4')
+        self._incl_len = struct.Struct(self.endian + 'I').unpack_from
+        self.position = self.data_start
+
+    def _init_pcap(self, magic):
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            self.endian = '<'
+        elif magic in (PCAP_MAGIC_USEC_SWAPPED, PCAP_MAGIC_NSEC_SWAPPED):
+            self.endian = '>'
+        else:
+            raise ValueError(f'Unexpected magic number: {hex(magic)}')
+        self.format = 'pcap'
+        units = 10 ** 9 if magic in (PCAP_MAGIC_NSEC, PCAP_MAGIC_NSEC_SWAPPED) else 10 ** 6
+        (self.version_major, self.version_minor, _thiszone, _sigfigs,
+         snaplen, linktype) = struct.unpack_from(self.endian + 'HHiIII', self._mm, 4)
+        self.interfaces.append(Interface(linktype, snaplen, units, 0))
+        self.data_start = GLOBAL_HEADER_LEN
+
+    def _init_pcapng(self):
+        self.format = 'pcapng'
+        self.endian = None
+        self._section_base = 0
+        # Consume the leading SHB/IDBs so linktype/snaplen are known before the first packet
+        pos = 0
+        while pos + 12 <= self.size:
+            btype = struct.unpack_from('<I', self._mm, pos)[0]
+            if btype == PCAPNG_SHB:
+                self._start_section(pos)
+            if btype not in (PCAPNG_SHB, PCAPNG_IDB):
+                break
+            blen = struct.unpack_from(self.endian + 'I', self._mm, pos + 4)[0]
+            if blen < 12 or pos + blen > self.size:
+                raise ValueError('Invalid PCAPNG file - truncated header block')
+            if btype == PCAPNG_IDB:
+                self._add_interface(pos, blen)
+            pos += blen
+        self.version_major, self.version_minor = struct.unpack_from(self.endian + 'HH', self._mm, 12)
+        self.data_start = pos
+
+    def _start_section(self, pos):
+        bom = struct.unpack_from('<I', self._mm, pos + 8)[0]
+        if bom == PCAPNG_BYTE_ORDER_MAGIC:
+            endian = '<'
+        elif bom == PCAPNG_BYTE_ORDER_MAGIC_SWAPPED:
+            endian = '>'
+        else:
+            raise ValueError(f'Invalid PCAPNG byte-order magic: {hex(bom)}')
+        if self.endian is not None and endian != self.endian:
+            raise ValueError('PCAPNG sections with different byte orders are not supported')
+        self.endian = endian
+        # Interface ids in EPBs are local to their section
+        self._section_base = len(self.interfaces)
+
+    def _add_interface(self, pos, blen):
+        linktype, _reserved, snaplen = struct.unpack_from(self.endian + 'HHI', self._mm, pos + 8)
+        units, offset = 10 ** 6, 0
+        opt = pos + 16
+        end = pos + blen - 4
+        while opt + 4 <= end:
+            code, length = struct.unpack_from(self.endian + 'HH', self._mm, opt)
+            if code == 0:
+                break
+            if code == PCAPNG_OPT_TSRESOL and length >= 1:
+                units = _tsresol_units(self._mm[opt + 4])
+            elif code == PCAPNG_OPT_TSOFFSET and length >= 8:
+                offset = struct.unpack_from(self.endian + 'q', self._mm, opt + 4)[0]
+            opt += 4 + ((length + 3) & ~3)
+        self.interfaces.append(Interface(linktype, snaplen, units, offset))
+
+    @property
+    def linktype(self):
+        return self.interfaces[0].linktype if self.interfaces else None
+
+    @property
+    def snaplen(self):
+        return self.interfaces[0].snaplen if self.interfaces else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.buf = None
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # a caller still holds a view; the map is released with it
+        self._file.close()
+
+    @property
+    def byte_order(self):
+        return 'little-endian' if self.endian == '<' else 'big-endian'
+
+    def _scan(self, pos, max_records, stop=None):
+        """Index up to max_records packets starting at byte pos.
+        Returns (offsets, iface_ids or None, next_pos).
+        """
+        if self.format == 'pcapng':
+            return self._scan_pcapng(pos, max_records, stop)
+        offsets, pos = self._scan_pcap(pos, max_records, stop)
+        return offsets, None, pos
+
+    def _scan_pcap(self, pos, max_records, stop=None):
+        """Index up to max_records record offsets starting at byte pos.
+
+        Only records whose header starts before stop are taken. Records with an
+        implausible incl_len are skipped one header at a time, matching the old
+        converters; a record running past EOF ends the scan.
+        Returns (offsets, next_pos).
+        """
+        mm = self._mm
+        size = self.size
+        unpack = self._incl_len
+        offsets = array('q')
+        append = offsets.append
+        last_header = size - RECORD_HEADER_LEN
+        if stop is None or stop > last_header:
+            stop = last_header + 1
+        while pos < stop and len(offsets) < max_records:
+            incl_len = unpack(mm, pos + 8)[0]
+            if incl_len == 0 or incl_len > MAX_RECORD_LEN:
+                self.skipped_records += 1
+                pos += RECORD_HEADER_LEN
+                continue
+            end = pos + RECORD_HEADER_LEN + incl_len
+            if end > size:
+                self.truncated = True
+                pos = size
+                break
+            append(pos)
+            pos = end
+        return np.frombuffer(offsets, dtype=np.int64), pos
+
+    def _scan_pcapng(self, pos, max_records, stop=None):
+        """Walk pcapng blocks from pos, indexing Enhanced Packet Blocks.
+
+        Section and interface blocks met on the way extend self.interfaces;
+        Simple/obsolete packet blocks are counted in skipped_records.
+        """
+        mm = self._mm
+        size = self.size
+        unpack = struct.Struct(self.endian + 'III').unpack_from
+        offsets = array('q')
+        ifaces = array('I')
+        append = offsets.append
+        append_iface = ifaces.append
+        base = self._section_base
+        if stop is None or stop > size:
+            stop = size
+        while pos < stop and len(offsets) < max_records:
+            if pos + 12 > size:
+                self.truncated = True
+                pos = size
+                break
+            btype, blen, iface = unpack(mm, pos)
+            if btype == PCAPNG_SHB:
+                self._start_section(pos)
+                unpack = struct.Struct(self.endian + 'III').unpack_from
+                btype, blen, iface = unpack(mm, pos)
+                base = self._section_base
+            if blen < 12 or blen & 3 or pos + blen > size:
+                self.truncated = True
+                pos = size
+                break
+            if btype == PCAPNG_EPB:
+                append(pos)
+                append_iface(base + iface)
+            elif btype == PCAPNG_IDB:
+                self._add_interface(pos, blen)
+            elif btype in (PCAPNG_SPB, PCAPNG_OPB):
+                self.skipped_records += 1
+            pos += blen
+        return (np.frombuffer(offsets, dtype=np.int64),
+                np.frombuffer(ifaces, dtype=np.uint32), pos)
+
+    def gather_u32(self, offsets):
+        """Vectorized read of one uint32 (capture byte order) at each offset."""
+        idx = offsets[:, None] + np.arange(4)
+        return self.buf[idx].view(self._u32).ravel()
+
+    def batch_from_offsets(self, offsets, ifaces=None):
+        if self.format == 'pcapng':
+            return self._pcapng_batch(offsets, ifaces)
+        ts_sec = self.gather_u32(offsets)
+        ts_frac = self.gather_u32(offsets + 4)
+        incl_len = self.gather_u32(offsets + 8)
+        orig_len = self.gather_u32(offsets + 12)
+        ts = ts_sec.astype(np.float64) + ts_frac / float(self.interfaces[0].units_per_sec)
+        return PacketBatch(ts, incl_len.astype(np.uint32), orig_len.astype(np.uint32),
+                           offsets + RECORD_HEADER_LEN, np.zeros(len(offsets), dtype=np.uint32))
+
+    def _pcapng_batch(self, offsets, ifaces):
+        n_if = len(self.interfaces)
+        if len(ifaces) and int(ifaces.max()) >= n_if:
+            raise ValueError('Enhanced Packet Block refers to an undefined interface')
+        units_table = np.array([i.units_per_sec for i in self.interfaces] or [1], dtype=np.uint64)
+        offset_table = np.array([i.offset_sec for i in self.interfaces] or [0], dtype=np.float64)
+        high = self.gather_u32(offsets + 12).astype(np.uint64)
+        low = self.gather_u32(offsets + 16).astype(np.uint64)
+        ticks = (high << np.uint64(32)) | low
+        units = units_table[ifaces]
+        sec = ticks // units
+        frac = ticks - sec * units
+        # sec + frac / units mirrors the classic ts_sec + ts_usec / 1e6 computation
+        ts = sec.astype(np.float64) + frac / units.astype(np.float64)
+        if offset_table.any():
+            ts += offset_table[ifaces]
+        incl_len = self.gather_u32(offsets + 20).astype(np.uint32)
+        orig_len = self.gather_u32(offsets + 24).astype(np.uint32)
+        return PacketBatch(ts, incl_len, orig_len, offsets + PCAPNG_EPB_HEADER_LEN, ifaces)
+
+    def read_batch(self, max_records, start=None, stop=None):
+        """Decode up to max_records packets from start (default: self.position).
+
+        Returns a PacketBatch, or None at the end of the range, and advances
+        self.position to the next unread record/block.
+        """
+        if start is not None:
+            self.position = start
+        offsets, ifaces, self.position = self._scan(self.position, max_records, stop)
+        if len(offsets) == 0:
+            return None
+        return self.batch_from_offsets(offsets, ifaces)
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE, start=None,
+                     stop=None) -> Iterator[PacketBatch]:
+        """Yield batches of the records whose header lies in [start, stop).
+
+        start defaults to the first record and must be a record boundary (see
+        find_record_start). Afterwards self.position is the offset of the first
+        record header at or past stop.
+        """
+        self.position = self.data_start if start is None else start
+        while True:
+            batch = self.read_batch(batch_size, stop=stop)
+            if batch is None:
+                return
+            yield batch
+
+    def state(self):
+        """JSON-serializable decoder state needed to resume at self.position."""
+        return {'position': self.position,
+                'interfaces': [list(i) for i in self.interfaces],
+                'section_base': getattr(self, '_section_base', 0)}
+
+    def restore(self, state):
+        """Continue from a state() snapshot (e.g. a conversion checkpoint)."""
+        self.interfaces = [Interface(*i) for i in state['interfaces']]
+        self._section_base = state['section_base']
+        self.position = state['position']
+
+    def _plausible_header(self, pos, prev_sec=None):
+        if pos + RECORD_HEADER_LEN > self.size:
+            return False
+        ts_sec, ts_frac, incl_len, orig_len = struct.unpack_from(self.endian + 'IIII', self._mm, pos)
+        if incl_len == 0 or incl_len > MAX_RECORD_LEN or orig_len < incl_len:
+            return False
+        if ts_frac >= self.interfaces[0].units_per_sec:
+            return False
+        if prev_sec is not None and abs(ts_sec - prev_sec) > RESYNC_MAX_GAP_SECONDS:
+            return False
+        return pos + RECORD_HEADER_LEN + incl_len <= self.size
+
+    def find_record_start(self, pos, chain=RESYNC_CHAIN):
+        """First offset >= pos that starts a chain of `chain` plausible records
+        (or a shorter chain ending exactly at EOF). Returns self.size if none.
+        Classic pcap only.
+        """
+        if self.format != 'pcap':
+            raise ValueError('Record resync is only supported for classic pcap')
+        pos = max(pos, GLOBAL_HEADER_LEN)
+        unpack = struct.Struct(self.endian + 'II').unpack_from
+        while pos + RECORD_HEADER_LEN <= self.size:
+            p = pos
+            prev_sec = None
+            for _ in range(chain):
+                if not self._plausible_header(p, prev_sec):
+                    break
+                prev_sec, _frac = unpack(self._mm, p)
+                p += RECORD_HEADER_LEN + self._incl_len(self._mm, p + 8)[0]
+                if p == self.size:
+                    return pos
+            else:
+                return pos
+            pos += 1
+        return self.size
+
+    def shard_starts(self, n):
+        """Split the capture into n byte ranges aligned to record headers.
+
+        Returns n + 1 offsets; shard i covers headers in [starts[i], starts[i + 1]).
+        Classic pcap only (pcapng blocks depend on interface state seen earlier).
+        """
+        if self.format != 'pcap':
+            raise ValueError('Byte-range sharding is only supported for classic pcap')
+        span = self.size - GLOBAL_HEADER_LEN
+        starts = [GLOBAL_HEADER_LEN]
+        for i in range(1, n):
+            guess = GLOBAL_HEADER_LEN + span * i // n
+            starts.append(max(starts[-1], self.find_record_start(guess)))
+        starts.append(self.size)
+        return starts
+
+
+class NetworkHeaders(NamedTuple):
+    version: np.ndarray  # uint8 IP version: 4, 6, or 0 when no IP header was found
+    src: np.ndarray      # uint32 IPv4 source (0 for IPv6 / non-IP)
+    dst: np.ndarray      # uint32 IPv4 destination
+    proto: np.ndarray    # uint8 IPv4 protocol / IPv6 next header after extension headers
+    sport: np.ndarray    # uint16 TCP/UDP source port (0 when not available)
+    dport: np.ndarray    # uint16 TCP/UDP destination port
+    src6_hi: np.ndarray  # uint64 halves of the IPv6 source (0 for IPv4 / non-IP)
+    src6_lo: np.ndarray
+    dst6_hi: np.ndarray  # uint64 halves of the IPv6 destination
+    dst6_lo: np.ndarray
+
+    @property
+    def ip6(self):
+        return self.src6_hi, self.src6_lo, self.dst6_hi, self.dst6_lo
+
+
+def _u16_at(reader, batch, pos):
+    """Big-endian uint16 at per-packet offset pos (0 where the packet is too short)."""
+    valid = batch.incl_len >= pos + 2
+    idx = np.where(valid, batch.data_offset + pos, 0)
+    value = (reader.buf[idx].astype(np.uint16) << 8) | reader.buf[idx + 1]
+    return np.where(valid, value, 0)
+
+
+def network_offsets(reader, batch):
+    """Per-packet offset of the IP header, from each packet's interface linktype.
+
+    Ethernet frames skip up to MAX_VLAN_TAGS 802.1Q / QinQ tags; packets whose
+    (inner) ethertype is not IPv4 / IPv6, or whose linktype is not understood,
+    get -1.
+    """
+    n = len(batch)
+    off = np.full(n, -1, dtype=np.int64)
+    if n == 0 or not reader.interfaces:
+        return off
+    linktypes = np.array([i.linktype for i in reader.interfaces], dtype=np.int64)
+    lt = linktypes[np.minimum(batch.iface, len(linktypes) - 1)]
+
+    off[np.isin(lt, RAW_LINKTYPES)] = 0
+    off[np.isin(lt, (LINKTYPE_NULL, LINKTYPE_LOOP))] = 4
+
+    eth = lt == LINKTYPE_ETHERNET
+    if eth.any():
+        pos = np.full(n, 12, dtype=np.int64)
+        etype = _u16_at(reader, batch, pos)
+        for _ in range(MAX_VLAN_TAGS):
+            tagged = eth & np.isin(etype, VLAN_ETHERTYPES)
+            if not tagged.any():
+                break
+            pos += 4 * tagged
+            etype = np.where(tagged, _u16_at(reader, batch, pos), etype)
+        ip = eth & np.isin(etype, (ETHERTYPE_IPV4, ETHERTYPE_IPV6))
+        off[ip] = pos[ip] + 2
+
+    for linktype, proto_at, header_len in ((LINKTYPE_LINUX_SLL, 14, 16), (LINKTYPE_LINUX_SLL2, 0, 20)):
+        sll = lt == linktype
+        if sll.any():
+            etype = _u16_at(reader, batch, np.full(n, proto_at, dtype=np.int64))
+            off[sll & np.isin(etype, (ETHERTYPE_IPV4, ETHERTYPE_IPV6))] = header_len
+    return off
+
+
+def _l3_offsets(reader, batch, l3_offset):
+    if l3_offset is None:
+        return network_offsets(reader, batch)
+    return np.full(len(batch), l3_offset, dtype=np.int64)
+
+
+def _ipv4_headers(reader, batch, off):
+    """(ok mask, IP header offsets of the ok packets, their header lengths)."""
+    buf = reader.buf
+    # Clamp reads of packets too short to hold an IP header; they are masked out below.
+    has_header = (off >= 0) & (batch.incl_len >= off + 20)
+    ip_start = np.where(has_header, batch.data_offset + off, 0)
+    version_ihl = buf[ip_start]
+    ihl = (version_ihl & 0x0F).astype(np.int64) * 4
+    ok = has_header & ((version_ihl >> 4) == 4) & (ihl >= 20) & (batch.incl_len >= off + ihl)
+    return ok, ip_start[ok], ihl[ok]
+
+
+def _ipv4_pair(buf, idx):
+    addr = buf[idx[:, None] + np.arange(12, 20)].astype(np.uint32)
+    return ((addr[:, 0] << 24) | (addr[:, 1] << 16) | (addr[:, 2] << 8) | addr[:, 3],
+            (addr[:, 4] << 24) | (addr[:, 5] << 16) | (addr[:, 6] << 8) | addr[:, 7])
+
+
+def _read_ports(buf, rows, l4, sport, dport):
+    ports = buf[l4[:, None] + np.arange(4)].astype(np.uint16)
+    sport[rows] = (ports[:, 0] << 8) | ports[:, 1]
+    dport[rows] = (ports[:, 2] << 8) | ports[:, 3]
+
+
+def _fill_ipv4(reader, batch, off, src, dst, proto, sport, dport):
+    """Fill the IPv4 rows of the output columns; returns the IPv4 mask."""
+    buf = reader.buf
+    ok, idx, ihl = _ipv4_headers(reader, batch, off)
+    src[ok], dst[ok] = _ipv4_pair(buf, idx)
+    p = buf[idx + 9]
+    proto[ok] = p
+    frag_offset = ((buf[idx + 6].astype(np.uint16) & 0x1F) << 8) | buf[idx + 7]
+    end = (batch.data_offset + batch.incl_len)[ok]
+    has_ports = ((p == IPPROTO_TCP) | (p == IPPROTO_UDP)) & (frag_offset == 0) & (end >= idx + ihl + 4)
+    _read_ports(buf, np.flatnonzero(ok)[has_ports], idx[has_ports] + ihl[has_ports], sport, dport)
+    return ok
+
+
+def _fill_ipv6(reader, batch, off, cols, proto=None, sport=None, dport=None):
+    """Fill the IPv6 rows of the (src_hi, src_lo, dst_hi, dst_lo) columns and, if
+    given, the transport columns; returns the IPv6 mask.
+    """
+    buf = reader.buf
+    has_header = (off >= 0) & (batch.incl_len >= off + 40)
+    ip_start = np.where(has_header, batch.data_offset + off, 0)
+    ok = has_header & ((buf[ip_start] >> 4) == 6)
+    idx = ip_start[ok]
+    # Source and destination are bytes 8..40: four big-endian 64-bit halves
+    raw = np.ascontiguousarray(buf[idx[:, None] + np.arange(8, 40)])
+    halves = raw.view('>u8').astype(np.uint64)
+    for col, half in zip(cols, halves.T):
+        col[ok] = half
+    if proto is None:
+        return ok
+
+    # Walk hop-by-hop / routing / fragment / destination-options headers to the transport header
+    end = (batch.data_offset + batch.incl_len)[ok]
+    nxt = buf[idx + 6]
+    pos = idx + 40
+    first_fragment = np.ones(len(idx), dtype=bool)
+    for _ in range(MAX_IPV6_EXT_HEADERS):
+        ext = np.isin(nxt, IPV6_EXT_HEADERS) & (end >= pos + 8)
+        if not ext.any():
+            break
+        at = np.where(ext, pos, idx)
+        frag = ext & (nxt == IPV6_FRAGMENT)
+        frag_offset = ((buf[at + 2].astype(np.uint16) << 8) | buf[at + 3]) >> 3
+        first_fragment &= ~frag | (frag_offset == 0)
+        hdr_len = np.where(frag, 8, (buf[at + 1].astype(np.int64) + 1) * 8)
+        nxt = np.where(ext, buf[at], nxt)
+        pos = np.where(ext, pos + hdr_len, pos)
+    proto[ok] = nxt
+    has_ports = ((nxt == IPPROTO_TCP) | (nxt == IPPROTO_UDP)) & first_fragment & (end >= pos + 4)
+    _read_ports(buf, np.flatnonzero(ok)[has_ports], pos[has_ports], sport, dport)
+    return ok
+
+
+def ipv4_addresses(reader, batch, l3_offset=None):
+    """Return (src, dst) uint32 arrays for IPv4 packets. Non-IPv4 or short packets give 0 (0.0.0.0).
+
+    The IP header is found from the linktype (network_offsets) unless l3_offset
+    fixes it at that many bytes into every packet.
+    """
+    n = len(batch)
+    src = np.zeros(n, dtype=np.uint32)
+    dst = np.zeros(n, dtype=np.uint32)
+    if n == 0:
+        return src, dst
+    ok, idx, _ihl = _ipv4_headers(reader, batch, _l3_offsets(reader, batch, l3_offset))
+    src[ok], dst[ok] = _ipv4_pair(reader.buf, idx)
+    return src, dst
+
+
+def network_headers(reader, batch, l3_offset=None):
+    """Decode IPv4 and IPv6 headers of a whole batch into NetworkHeaders columns.
+
+    IPv6 ports are read after skipping up to MAX_IPV6_EXT_HEADERS extension
+    headers, and only from unfragmented packets or first fragments.
+    """
+    n = len(batch)
+    h = NetworkHeaders(np.zeros(n, dtype=np.uint8), np.zeros(n, dtype=np.uint32), np.zeros(n, dtype=np.uint32),
+                       np.zeros(n, dtype=np.uint8), np.zeros(n, dtype=np.uint16), np.zeros(n, dtype=np.uint16),
+                       *(np.zeros(n, dtype=np.uint64) for _ in range(4)))
+    if n == 0:
+        return h
+    off = _l3_offsets(reader, batch, l3_offset)
+    h.version[_fill_ipv4(reader, batch, off, h.src, h.dst, h.proto, h.sport, h.dport)] = 4
+    h.version[_fill_ipv6(reader, batch, off, h.ip6, h.proto, h.sport, h.dport)] = 6
+    return h
+
+
+def ipv4_to_str(addrs):
+    """Dotted-quad strings for a uint32 array, formatting each distinct address once."""
+    uniq, inverse = np.unique(addrs, return_inverse=True)
+    names = np.array([f'{a >> 24}.{(a >> 16) & 255}.{(a >> 8) & 255}.{a & 255}'
+                      for a in uniq.tolist()], dtype=object)
+    return names[inverse]
+
+
+def ipv4_to_int(ip):
+    """uint32 value of a dotted-quad string; '' or anything unparsable gives 0."""
+    try:
+        a, b, c, d = (int(x) for x in ip.split('.'))
+    except (AttributeError, ValueError):
+        return 0
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+def ipv6_to_str(hi, lo):
+    """Compressed IPv6 strings for (hi, lo) uint64 pairs, formatting each distinct address once."""
+    pairs = np.stack((np.asarray(hi, dtype=np.uint64), np.asarray(lo, dtype=np.uint64)), axis=1)
+    uniq, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    names = np.array([str(ipaddress.IPv6Address((h << 64) | l)) for h, l in uniq.tolist()], dtype=object)
+    return names[inverse.ravel()]
+
+
+def ipv6_to_pair(ip):
+    """(hi, lo) of an IPv6 string; anything unparsable gives (0, 0)."""
+    try:
+        value = int(ipaddress.IPv6Address(ip))
+    except (ipaddress.AddressValueError, ValueError):
+        return 0, 0
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+class PrefixTable:
+    """CIDR prefixes for vectorized membership tests on integer addresses.
+
+    IPv4 networks are grouped by prefix length: one mask-and-searchsorted pass
+    per distinct length, however many networks share it. IPv6 networks are
+    tested on (hi, lo) uint64 pairs.
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = [ipaddress.ip_network(p.strip(), strict=False) for p in prefixes if p.strip()]
+        by_len = {}
+        self.v6 = []
+        for net in self.prefixes:
+            if net.version == 4:
+                by_len.setdefault(net.prefixlen, set()).add(int(net.network_address))
+            else:
+                value = int(net.network_address)
+                mask = ((1 << 128) - 1) ^ ((1 << (128 - net.prefixlen)) - 1)
+                self.v6.append((np.uint64(value >> 64), np.uint64(value & 0xFFFFFFFFFFFFFFFF),
+                                np.uint64(mask >> 64), np.uint64(mask & 0xFFFFFFFFFFFFFFFF)))
+        self.v4 = [(np.uint32((0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF), np.array(sorted(nets), dtype=np.uint32))
+                   for bits, nets in sorted(by_len.items())]
+
+    @classmethod
+    def from_string(cls, text):
+        """'10.0.0.0/8,fc00::/7,...' (commas or whitespace)."""
+        return cls(text.replace(',', ' ').split())
+
+    def __str__(self):
+        return ','.join(str(net) for net in self.prefixes)
+
+    def contains(self, addrs):
+        """Boolean mask of uint32 IPv4 addresses inside any of the IPv4 prefixes."""
+        addrs = np.asarray(addrs, dtype=np.uint32)
+        mask = np.zeros(len(addrs), dtype=bool)
+        for netmask, nets in self.v4:
+            masked = addrs & netmask
+            if len(nets) <= 4:
+                for net in nets:
+                    mask |= masked == net
+            else:
+                pos = np.minimum(np.searchsorted(nets, masked), len(nets) - 1)
+                mask |= nets[pos] == masked
+        return mask
+
+    def contains_v6(self, hi, lo):
+        """Boolean mask of (hi, lo) IPv6 addresses inside any of the IPv6 prefixes."""
+        hi = np.asarray(hi, dtype=np.uint64)
+        lo = np.asarray(lo, dtype=np.uint64)
+        mask = np.zeros(len(hi), dtype=bool)
+        for net_hi, net_lo, mask_hi, mask_lo in self.v6:
+            mask |= ((hi & mask_hi) == net_hi) & ((lo & mask_lo) == net_lo)
+        return mask
+
+
+# Hosts inside the capture's own network: RFC 1918, IPv6 unique-local and link-local.
+# Override with $REEL_PRIVATE_PREFIXES or set_private_prefixes().
+PRIVATE_PREFIXES = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', 'fc00::/7', 'fe80::/10')
+PRIVATE_PREFIXES_ENV = 'REEL_PRIVATE_PREFIXES'
+_private_table = None
+
+
+def private_prefixes():
+    """The PrefixTable used to tell internal hosts from remote ones."""
+    global _private_table
+    if _private_table is None:
+        env = os.environ.get(PRIVATE_PREFIXES_ENV)
+        _private_table = PrefixTable.from_string(env) if env else PrefixTable(PRIVATE_PREFIXES)
+    return _private_table
+
+
+def set_private_prefixes(prefixes):
+    """Replace the private prefix table (a PrefixTable, a list of CIDRs or a comma-separated string).
+
+    The value is also exported to $REEL_PRIVATE_PREFIXES so worker processes see it.
+    """
+    global _private_table
+    if isinstance(prefixes, str):
+        prefixes = PrefixTable.from_string(prefixes)
+    elif not isinstance(prefixes, PrefixTable):
+        prefixes = PrefixTable(prefixes)
+    _private_table = prefixes
+    os.environ[PRIVATE_PREFIXES_ENV] = str(prefixes)
+
+
+def ipv4_private_mask(addrs):
+    """Boolean mask of uint32 addresses inside the private prefix table."""
+    return private_prefixes().contains(addrs)
+
+
+def format_csv_rows(ts, lengths, src, dst, *extra, ip6=None):
+    """Render ts,length,src,dst rows exactly as csv.writer would (repr floats, CRLF).
+
+    extra integer columns (e.g. proto, sport, dport) are appended to every row.
+    ip6 = (src_hi, src_lo, dst_hi, dst_lo) puts IPv6 text in src/dst wherever
+    the IPv4 address is 0 and the IPv6 one is set.
+    """
+    if len(ts) == 0:
+        return ''
+    src_text, dst_text = ipv4_to_str(src), ipv4_to_str(dst)
+    if ip6 is not None:
+        src_hi, src_lo, dst_hi, dst_lo = ip6
+        v6 = (np.asarray(src) == 0) & ((np.asarray(src_hi) | np.asarray(src_lo) | np.asarray(dst_hi)
+                                        | np.asarray(dst_lo)) != 0)
+        if v6.any():
+            src_text[v6] = ipv6_to_str(np.asarray(src_hi)[v6], np.asarray(src_lo)[v6])
+            dst_text[v6] = ipv6_to_str(np.asarray(dst_hi)[v6], np.asarray(dst_lo)[v6])
+    rows = map(','.join, zip(map(repr, ts.tolist()), map(str, lengths.tolist()),
+                             src_text.tolist(), dst_text.tolist(),
+                             *(map(str, np.asarray(col).tolist()) for col in extra)))
+    return '\r\n'.join(rows) + '\r\n'
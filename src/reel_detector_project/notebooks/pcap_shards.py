@@ -0,0 +1,113 @@
+# notebooks/pcap_shards.py
+# Parallel PCAP conversion over byte-range shards.
+#
+# The capture is split into byte ranges whose starts are resynced onto record
+# headers (PcapReader.shard_starts). Each shard is decoded in its own process
+# into a part file next to the output, then the parts are concatenated in shard
+# (= capture) order. Every shard reports the offset it started at and the offset
+# of the first header past its range; if a resynced start does not match where
+# the previous shard's record chain actually ended, that shard is decoded again
+# from the true boundary, so the result is always identical to a serial run.
+# Each shard also keeps a DeviceSketch of its packets; the sketches are merged.
+
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from pcap_reader import DEFAULT_BATCH_SIZE, GLOBAL_HEADER_LEN, PcapReader, network_headers
+from heavy_hitters import DeviceSketch
+from packet_store import STORE_SUFFIX, concat_packet_outputs, is_packet_store, open_packet_writer
+
+
+class ShardResult(NamedTuple):
+    index: int
+    start: int
+    end: int        # offset of the first record header at or past the shard's stop
+    packets: int
+    skipped: int
+    truncated: bool
+    part_path: str
+    devices: DeviceSketch
+
+
+def part_path_for(out_path, index):
+    """Temporary part file for shard index, of the same kind (CSV / store) as out_path."""
+    out = str(out_path)
+    if is_packet_store(out):
+        return f'{out[:-len(STORE_SUFFIX)]}.part{index}{STORE_SUFFIX}'
+    return f'{out}.part{index}'
+
+
+def decode_shard(pcap_path, part_path, index, start, stop, l3_offset=None, batch_size=DEFAULT_BATCH_SIZE,
+                 length_field='incl_len', flows=False):
+    """Decode records with headers in [start, stop) into part_path.
+
+    length_field picks the length column: 'incl_len' (captured) or 'orig_len' (on the wire).
+    flows=True also writes proto,sport,dport. l3_offset None locates the IP
+    header from the linktype (see pcap_reader.network_offsets).
+    """
+    sketch = DeviceSketch()
+    with PcapReader(pcap_path) as reader, open_packet_writer(part_path, flows=flows) as writer:
+        packets = 0
+        for batch in reader.iter_batches(batch_size, start=start, stop=stop):
+            length = getattr(batch, length_field)
+            h = network_headers(reader, batch, l3_offset=l3_offset)
+            src, dst = h.src, h.dst
+            flow = (h.proto, h.sport, h.dport) if flows else ()
+            writer.append(batch.ts, length, src, dst, *flow, ip6=h.ip6)
+            sketch.update(src, dst, length)
+            packets += len(batch)
+        return ShardResult(index, start, reader.position, packets,
+                           reader.skipped_records, reader.truncated, part_path, sketch)
+
+
+def _decode_shard_job(args):
+    return decode_shard(*args)
+
+
+def remove_part(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def convert_pcap_parallel(pcap_path, out_path, workers, l3_offset=None, batch_size=DEFAULT_BATCH_SIZE,
+                          length_field='incl_len', flows=False):
+    """Convert a classic pcap to out_path (CSV or .pkts) using `workers` processes.
+
+    Returns (packets, skipped_records, truncated, device_sketch).
+    """
+    with PcapReader(pcap_path) as reader:
+        starts = reader.shard_starts(workers)
+    shards = [(starts[i], starts[i + 1]) for i in range(workers)]
+    jobs = [(pcap_path, part_path_for(out_path, i), i, a, b, l3_offset, batch_size, length_field, flows)
+            for i, (a, b) in enumerate(shards)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_decode_shard_job, jobs))
+
+    try:
+        expected = GLOBAL_HEADER_LEN
+        for i, res in enumerate(results):
+            if res.start != expected:
+                # Resync landed off the real record chain: redo from the true boundary
+                print(f'[shard {i}] boundary mismatch ({res.start} != {expected}); re-decoding')
+                res = decode_shard(pcap_path, res.part_path, i, expected, shards[i][1], l3_offset,
+                                   batch_size, length_field, flows)
+                results[i] = res
+            expected = res.end
+
+        concat_packet_outputs([r.part_path for r in results], out_path)
+    finally:
+        for r in results:
+            remove_part(r.part_path)
+
+    packets = sum(r.packets for r in results)
+    skipped = sum(r.skipped for r in results)
+    truncated = any(r.truncated for r in results)
+    sketch = DeviceSketch()
+    for r in results:
+        sketch.merge(r.devices)
+    return packets, skipped, truncated, sketch
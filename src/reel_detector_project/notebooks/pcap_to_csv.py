@@ -1,28 +1,54 @@
 # notebooks/pcap_to_csv.py
 # Optional: convert pcap files to CSV (requires pyshark and tshark installed).
+# An output path ending in .pkts writes the columnar packet store (see packet_store.py) instead.
 import pyshark
 import csv
 import sys
 
-def pcap_to_csv(pcap_path, out_csv):
+from packet_store import PacketStoreWriter, is_packet_store
+from pcap_reader import ipv4_to_int
+
+STORE_BATCH_ROWS = 100_000
+
+def iter_packets(pcap_path):
     cap = pyshark.FileCapture(pcap_path, keep_packets=False)
-    with open(out_csv, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['ts','length','src','dst'])
+    try:
         for pkt in cap:
             try:
                 ts = float(pkt.sniff_timestamp)
                 length = int(pkt.length)
                 src = pkt.ip.src if hasattr(pkt, 'ip') else ''
                 dst = pkt.ip.dst if hasattr(pkt, 'ip') else ''
-                writer.writerow([ts, length, src, dst])
             except Exception:
                 continue
-    cap.close()
+            yield ts, length, src, dst
+    finally:
+        cap.close()
+
+def pcap_to_csv(pcap_path, out_csv):
+    if is_packet_store(out_csv):
+        return pcap_to_store(pcap_path, out_csv)
+    with open(out_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ts','length','src','dst'])
+        for row in iter_packets(pcap_path):
+            writer.writerow(row)
     print('Saved to', out_csv)
 
+def pcap_to_store(pcap_path, out_path):
+    rows = []
+    with PacketStoreWriter(out_path) as store:
+        for ts, length, src, dst in iter_packets(pcap_path):
+            rows.append((ts, length, ipv4_to_int(src), ipv4_to_int(dst)))
+            if len(rows) >= STORE_BATCH_ROWS:
+                store.append(*zip(*rows))
+                rows = []
+        if rows:
+            store.append(*zip(*rows))
+    print('Saved to', out_path)
+
 if __name__ == '__main__':
     if len(sys.argv) < 3:
-        print('Usage: python pcap_to_csv.py input.pcap output.csv')
+        print('Usage: python pcap_to_csv.py input.pcap output.csv|output.pkts')
     else:
         pcap_to_csv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,189 @@
+# notebooks/replay.py
+# Replay a capture through the online window + classifier pipeline and time it.
+#
+# Packets come from a pcap/pcapng (PcapReader), a .pkts packet store or a packet
+# CSV, in batches of ts,length,src,dst (uint32 addresses). The replay clock maps
+# capture time to wall time at `speed` x (None = as fast as possible). On every
+# tick the packets that are due are fed to a StreamingWindower for the device and
+# the windower is advanced to the current capture time, so a window closes when
+# the clock passes its end, not when the next packet happens to arrive. Closed
+# windows are classified immediately.
+#
+# Latency is measured from window close to prediction: for paced replay the
+# close is the wall time the clock reached the window end; at max speed it is
+# the start of the tick that closed it.
+
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from packet_store import is_packet_store, open_packet_store
+from pcap_reader import DEFAULT_BATCH_SIZE, PcapReader, ipv4_addresses, ipv4_to_int
+from tflite_model import TFLiteModel
+from windows import FEATURE_COLUMNS, StreamingWindower, ipv4_column
+
+TICK_SECONDS = 0.001        # paced replay: longest sleep between clock checks
+MAX_TICK_PACKETS = 4096     # max-speed replay: packets fed per tick
+CSV_CHUNK_ROWS = 1_000_000
+
+
+def iter_packet_batches(path, l3_offset=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield (ts, length, src, dst) arrays from a capture, packet store or packet CSV."""
+    if is_packet_store(path):
+        store = open_packet_store(path)
+        for start, stop in store.iter_chunks():
+            yield (np.asarray(store.ts[start:stop]), np.asarray(store.length[start:stop], dtype=np.int64),
+                   np.asarray(store.src[start:stop]), np.asarray(store.dst[start:stop]))
+    elif str(path).endswith('.csv'):
+        for chunk in pd.read_csv(path, usecols=['ts', 'length', 'src', 'dst'], chunksize=CSV_CHUNK_ROWS):
+            yield (chunk['ts'].to_numpy(dtype=np.float64), chunk['length'].to_numpy(dtype=np.int64),
+                   ipv4_column(chunk['src']), ipv4_column(chunk['dst']))
+    else:
+        with PcapReader(path) as reader:
+            for batch in reader.iter_batches(batch_size):
+                src, dst = ipv4_addresses(reader, batch, l3_offset=l3_offset)
+                yield batch.ts, batch.incl_len.astype(np.int64), src, dst
+
+
+class RuleClassifier:
+    """simple_eval's threshold rules; lets the harness run without a trained model."""
+
+    name = 'rules'
+
+    def predict(self, windows):
+        return ((windows['bytes_down'] > 100000) & (windows['pkt_count_down'] > 50)
+                & (windows['bitrate_down'] > 50000)).to_numpy(dtype=np.int64)
+
+
+class SklearnClassifier:
+    """A joblib-saved estimator fitted on the window feature columns."""
+
+    def __init__(self, model_path):
+        import joblib
+        self.name = str(model_path)
+        self.model = joblib.load(model_path)
+        self.features = list(getattr(self.model, 'feature_names_in_', FEATURE_COLUMNS))
+
+    def predict(self, windows):
+        return np.asarray(self.model.predict(windows[self.features]))
+
+
+class TFLiteClassifier:
+    """The exported MLP (train_and_convert.py): scaler.json normalization, sigmoid output > 0.5."""
+
+    def __init__(self, model_path, scaler_path):
+        self.model = TFLiteModel(model_path, scaler_path)
+        self.name = self.model.name
+        self.features = self.model.features
+
+    def predict(self, windows):
+        return self.model.predict(windows[self.features].to_numpy(dtype=np.float32))
+
+
+def load_classifier(model_path=None, scaler_path=None):
+    if model_path is None:
+        return RuleClassifier()
+    if str(model_path).endswith('.tflite'):
+        return TFLiteClassifier(model_path, scaler_path or 'models/scaler.json')
+    return SklearnClassifier(model_path)
+
+
+class ReplayReport(NamedTuple):
+    packets: int
+    windows: int
+    late_packets: int
+    wall_seconds: float
+    capture_seconds: float
+    latencies: np.ndarray    # seconds, one per window
+    predictions: pd.DataFrame
+
+    @property
+    def packets_per_second(self):
+        return self.packets / self.wall_seconds if self.wall_seconds > 0 else float('inf')
+
+    def latency_ms(self, q):
+        return float(np.percentile(self.latencies, q) * 1000.0) if len(self.latencies) else float('nan')
+
+
+class ReplayPipeline:
+    """StreamingWindower for one device followed by a classifier."""
+
+    def __init__(self, device_ip, classifier, window_size=5.0, step=2.5):
+        self.key = ipv4_to_int(device_ip)
+        self.windower = StreamingWindower(device_ip, window_size, step, drop_late=True)
+        self.classifier = classifier
+        self.latencies = []
+        self.frames = []
+
+    def feed(self, ts, length, src, dst, now_ts):
+        """Add packets and advance the window clock to capture time now_ts."""
+        down = dst == self.key
+        up = src == self.key
+        rel = down | up
+        closed = self.windower.push_rows(ts[rel], length[rel], down[rel], up[rel])
+        ticked = self.windower.advance(now_ts)
+        if closed.empty:
+            return ticked
+        return closed if ticked.empty else pd.concat([closed, ticked], ignore_index=True)
+
+    def classify(self, windows, closed_at):
+        """Predict closed windows; closed_at gives each window's close wall time."""
+        windows = windows.assign(prediction=self.classifier.predict(windows))
+        done = time.perf_counter()
+        self.latencies.extend(done - np.asarray(closed_at, dtype=np.float64))
+        self.frames.append(windows)
+
+    def finish(self):
+        windows = self.windower.finish()
+        if not windows.empty:
+            self.classify(windows, np.full(len(windows), time.perf_counter()))
+
+
+def replay(batches, pipeline, speed=1.0):
+    """Drive pipeline with packet batches; speed None replays as fast as possible."""
+    packets = 0
+    wall0 = time.perf_counter()
+    cap0 = None
+    clock = -np.inf         # running max of capture time fed so far
+    for ts, length, src, dst in batches:
+        if len(ts) == 0:
+            continue
+        if cap0 is None:
+            # The clock starts with the first packet, not when the source was opened
+            cap0 = float(ts[0])
+            wall0 = time.perf_counter()
+        # Schedule by the running maximum so out-of-order timestamps never stall the clock
+        due = np.maximum.accumulate(np.maximum(ts, clock))
+        i, n = 0, len(ts)
+        while i < n:
+            now = time.perf_counter()
+            if speed is None:
+                j = min(n, i + MAX_TICK_PACKETS)
+                now_ts = float(due[j - 1])
+            else:
+                now_ts = cap0 + (now - wall0) * speed
+                j = int(np.searchsorted(due, now_ts, side='right'))
+                if j <= i:
+                    time.sleep(min(TICK_SECONDS, (due[i] - now_ts) / speed))
+                    now_ts = cap0 + (time.perf_counter() - wall0) * speed
+                    j = int(np.searchsorted(due, now_ts, side='right'))
+            windows = pipeline.feed(ts[i:j], length[i:j], src[i:j], dst[i:j], now_ts)
+            if not windows.empty:
+                if speed is None:
+                    closed_at = np.full(len(windows), now)
+                else:
+                    wend = windows['wstart'].to_numpy() + pipeline.windower.window_size
+                    closed_at = wall0 + (wend - cap0) / speed
+                pipeline.classify(windows, closed_at)
+            packets += j - i
+            i = j
+        clock = float(due[-1])
+    pipeline.finish()
+    wall = time.perf_counter() - wall0
+    frames = [f for f in pipeline.frames if not f.empty]
+    preds = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return ReplayReport(packets, len(preds), pipeline.windower.late, wall,
+                        (clock - cap0) if cap0 is not None else 0.0,
+                        np.asarray(pipeline.latencies), preds)
@@ -0,0 +1,227 @@
+# notebooks/rolling_features.py
+# Online window features, updated in O(1) per packet.
+#
+# RollingFeatureState is the Python counterpart of the Android FeatureBuffer:
+# packets for one device go into array-backed ring buffers and every feature is
+# kept as a running aggregate that is updated when a packet enters and when it
+# expires, so reading the latest window never rescans the buffer.
+#   sizes   exact integer count / sum / sum of squares per direction (the same
+#           population std as compute_sliding_windows, with no drift)
+#   IAT     Welford mean / M2 over the gaps between consecutive downlink packets,
+#           with the matching removal step when the oldest packet expires
+#   bursts  count of downlink packets larger than BURST_BYTES
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from pcap_reader import ipv4_to_int
+from windows import BURST_BYTES, FEATURE_COLUMNS, compute_sliding_windows, window_starts
+
+INITIAL_CAPACITY = 1024
+
+
+class _Ring:
+    """FIFO over preallocated NumPy columns; doubles its capacity when full."""
+
+    def __init__(self, dtypes, capacity=INITIAL_CAPACITY):
+        self.cols = [np.empty(capacity, dtype=dt) for dt in dtypes]
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        cap = len(self.cols[0])
+        order = (self.head + np.arange(self.size)) % cap
+        self.cols = [np.concatenate((c[order], np.empty(cap, dtype=c.dtype))) for c in self.cols]
+        self.head = 0
+
+    def push(self, *values):
+        if self.size == len(self.cols[0]):
+            self._grow()
+        i = (self.head + self.size) % len(self.cols[0])
+        for col, v in zip(self.cols, values):
+            col[i] = v
+        self.size += 1
+
+    def peek(self, offset=0):
+        i = (self.head + offset) % len(self.cols[0])
+        return tuple(col[i] for col in self.cols)
+
+    def pop(self):
+        values = self.peek()
+        self.head = (self.head + 1) % len(self.cols[0])
+        self.size -= 1
+        return values
+
+
+class _Welford:
+    """Running mean / M2 supporting removal of any previously added value."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def remove(self, x):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean = (self.n * self.mean - x) / (self.n - 1)
+        self.m2 = max(self.m2 - (x - self.mean) * (x - mean), 0.0)
+        self.mean = mean
+        self.n -= 1
+
+    def std(self):
+        return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+
+class _SizeStats:
+    def __init__(self):
+        self.n = 0
+        self.s = 0
+        self.q = 0
+
+    def add(self, x):
+        self.n += 1
+        self.s += x
+        self.q += x * x
+
+    def remove(self, x):
+        self.n -= 1
+        self.s -= x
+        self.q -= x * x
+
+    def mean(self):
+        return self.s / self.n if self.n else 0.0
+
+    def std(self):
+        # Python ints: the numerator n*sum(x^2) - sum(x)^2 is exact
+        return math.sqrt((self.n * self.q - self.s * self.s) / (self.n * self.n)) if self.n else 0.0
+
+
+class RollingFeatureState:
+    """Window features of one device's most recent packets, maintained incrementally.
+
+    add() keeps the trailing window [newest_ts - window_size, newest_ts] like
+    FeatureBuffer.computeLatestWindow; expire_before(t) drops packets older than
+    t, which is how rolling_windows() reproduces the [wstart, wstart + window_size)
+    windows of compute_sliding_windows. features() is O(1).
+    Packets must be added in time order.
+    """
+
+    def __init__(self, device_ip, window_size=5.0):
+        self.device_ip = device_ip
+        self.window_size = window_size
+        # src/dst may be dotted strings (CSV) or uint32 (packet store / decoder output)
+        self._int_key = ipv4_to_int(device_ip) if isinstance(device_ip, str) else device_ip
+        self._packets = _Ring((np.float64, np.int64, np.bool_, np.bool_))   # ts, length, down, up
+        self._down_ts = _Ring((np.float64,))
+        self._down = _SizeStats()
+        self._up = _SizeStats()
+        self._iat = _Welford()
+        self._bursts = 0
+        self.last_ts = None
+
+    def __len__(self):
+        return len(self._packets)
+
+    def add(self, ts, length, src, dst):
+        """Add one packet; packets not involving the device are ignored."""
+        key = self._int_key if isinstance(dst, (int, np.integer)) else self.device_ip
+        down = dst == key
+        up = src == key
+        if not (down or up):
+            return
+        length = int(length)
+        self._packets.push(ts, length, down, up)
+        if down:
+            self._down.add(length)
+            self._bursts += length > BURST_BYTES
+            if len(self._down_ts):
+                self._iat.add(ts - self._down_ts.peek(len(self._down_ts) - 1)[0])
+            self._down_ts.push(ts)
+        if up:
+            self._up.add(length)
+        self.last_ts = ts
+        self.expire_before(ts - self.window_size)
+
+    def expire_before(self, t):
+        """Drop packets with ts < t."""
+        while len(self._packets) and self._packets.peek()[0] < t:
+            _ts, length, down, up = self._packets.pop()
+            if down:
+                self._down.remove(length)
+                self._bursts -= length > BURST_BYTES
+                first, = self._down_ts.pop()
+                if len(self._down_ts):
+                    self._iat.remove(self._down_ts.peek()[0] - first)
+            if up:
+                self._up.remove(length)
+
+    def features(self):
+        """The 13 FEATURE_COLUMNS of the packets currently in the window."""
+        bd, bu = self._down.s, self._up.s
+        return np.array([
+            bd, self._down.n, self._down.mean(), self._down.std(),
+            bu, self._up.n, self._up.mean(), self._up.std(),
+            bd / self.window_size, self._iat.mean if self._iat.n else 0.0, self._iat.std(),
+            self._bursts, bd / (bu + 1),
+        ], dtype=np.float64)
+
+    def features_dict(self):
+        return dict(zip(FEATURE_COLUMNS, self.features().tolist()))
+
+
+def rolling_windows(df, device_ip, window_size=5.0, step=2.5):
+    """compute_sliding_windows driven packet by packet through RollingFeatureState.
+
+    df should hold only the device's rows (as packets_to_windows prefilters),
+    sorted by ts.
+    """
+    if df.empty:
+        return pd.DataFrame()
+    state = RollingFeatureState(device_ip, window_size)
+    ts = df['ts'].to_numpy(dtype=np.float64)
+    length = df['length'].to_numpy(dtype=np.int64)
+    src = df['src'].to_numpy()
+    dst = df['dst'].to_numpy()
+    starts = window_starts(ts[0], ts[-1], step)
+    rows = []
+    i = 0
+    for wstart in starts:
+        # add() only expires packets older than wstart here, since every ts < wend
+        wend = wstart + window_size
+        while i < len(ts) and ts[i] < wend:
+            state.add(ts[i], length[i], src[i], dst[i])
+            i += 1
+        state.expire_before(wstart)
+        if len(state):
+            rows.append((wstart, *state.features()))
+    out = pd.DataFrame(rows, columns=['wstart'] + FEATURE_COLUMNS)
+    for c in ('bytes_down', 'pkt_count_down', 'bytes_up', 'pkt_count_up', 'burst_count_down'):
+        out[c] = out[c].astype(np.int64)
+    return out
+
+
+def check_rolling_parity(df, device_ip, window_size=5.0, step=2.5, rtol=1e-6, atol=1e-7):
+    """Compare rolling_windows against compute_sliding_windows; returns mismatching columns.
+
+    atol allows for near-zero IAT stds: both sides take the sqrt of a variance with ~1e-16 rounding.
+    """
+    rolled = rolling_windows(df, device_ip, window_size, step)
+    ref = compute_sliding_windows(df, device_ip, window_size, step)
+    if list(rolled.columns) != list(ref.columns) or len(rolled) != len(ref):
+        return ['<shape>']
+    return [c for c in ref.columns
+            if not np.allclose(rolled[c].to_numpy(dtype=np.float64), ref[c].to_numpy(dtype=np.float64),
+                               rtol=rtol, atol=atol)]
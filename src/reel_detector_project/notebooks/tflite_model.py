@@ -0,0 +1,190 @@
+# notebooks/tflite_model.py
+# TFLite inference without importing TensorFlow.
+#
+# load_interpreter() takes the Interpreter from the small tflite_runtime
+# package when it is installed and only falls back to tensorflow.lite (seconds
+# of import time) when it is not. The interpreter is given the model path, so
+# the flatbuffer is memory-mapped rather than read into Python.
+#
+# TFLiteModel bundles the interpreter with the scaler.json normalization of
+# train_and_convert.py: predict_proba takes raw feature rows in scaler
+# feature order and returns the sigmoid output, predict thresholds it at 0.5.
+#
+# Rows are run batch_size at a time: every batch is copied straight into the
+# interpreter's own input buffer (the last one zero-padded), so there is one
+# invoke per batch and no per-row allocation. Tensor shapes are fixed: calls
+# of up to SMALL_BATCH_ROWS rows (online replay ticks) run on a
+# (SMALL_BATCH_ROWS, features) interpreter, larger ones on a
+# (batch_size, features) one. Each shape gets its own interpreter, allocated
+# the first time it is used, so ticks alternating between 1 and N rows never
+# resize or re-allocate tensors. The MLP scores rows independently, so the
+# result equals invoking it row by row (row_loop_proba is kept to check that).
+# timing_summary() reports running totals plus latency percentiles over the
+# last TIMING_WINDOW invokes, so a long replay does not grow memory.
+#
+# Full-integer models (train_and_convert.py --int8) take int8 input and give
+# int8 output. Their input tensor has one (scale, zero_point), which cannot
+# cover raw features ranging from ~1 to ~1e5, so the model stays in
+# normalized space. Instead the scaler is folded into the input
+# quantization: q = clip(round(x * multiplier + offset), -128, 127) per
+# feature, with multiplier = 1 / (std * scale) and
+# offset = zero_point - mean / (std * scale). One multiply-add per feature
+# replaces both the z-score pass and the float input. int8_params() gives
+# these numbers, plus the output (scale, zero_point), as written next to the
+# model for the app.
+
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+DEFAULT_BATCH_SIZE = 256
+SMALL_BATCH_ROWS = 8
+TIMING_WINDOW = 10000
+
+
+def load_interpreter(model_path, num_threads=None):
+    """An allocated TFLite Interpreter from tflite_runtime, else tensorflow.lite."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def load_scaler(path):
+    """(features, mean, std) from a scaler.json."""
+    with open(path) as f:
+        scaler = json.load(f)
+    return (scaler['features'], np.array(scaler['mean'], dtype=np.float32),
+            np.array(scaler['std'], dtype=np.float32))
+
+
+def fold_scaler(mean, std, scale, zero_point):
+    """Per-feature (multiplier, offset) mapping raw features straight to int8 input codes."""
+    multiplier = 1.0 / (np.asarray(std, dtype=np.float64) * scale)
+    offset = zero_point - np.asarray(mean, dtype=np.float64) * multiplier
+    return multiplier.astype(np.float32), offset.astype(np.float32)
+
+
+def int8_params(interpreter, features, mean, std):
+    """Quantization parameters of a full-integer model, with the scaler folded into the input."""
+    inp = interpreter.get_input_details()[0]
+    outp = interpreter.get_output_details()[0]
+    in_scale, in_zero = inp['quantization']
+    out_scale, out_zero = outp['quantization']
+    multiplier, offset = fold_scaler(mean, std, in_scale, in_zero)
+    return {
+        'features': list(features),
+        'input_dtype': 'int8', 'input_scale': float(in_scale), 'input_zero_point': int(in_zero),
+        'input_multiplier': multiplier.tolist(), 'input_offset': offset.tolist(),
+        'output_dtype': 'int8', 'output_scale': float(out_scale), 'output_zero_point': int(out_zero),
+        'formula': 'q[i] = clip(round(x[i] * input_multiplier[i] + input_offset[i]), -128, 127); '
+                   'p = (out - output_zero_point) * output_scale',
+    }
+
+
+class TFLiteModel:
+    """The exported MLP: scaler.json normalization, sigmoid output > 0.5.
+
+    Without a scaler_path, inputs are taken as already normalized. Full-integer
+    models are fed int8 codes from the folded scaler and their output is dequantized.
+    """
+
+    def __init__(self, model_path, scaler_path=None, num_threads=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.name = str(model_path)
+        self.model_path, self.num_threads = model_path, num_threads
+        self.interpreter = load_interpreter(model_path, num_threads)
+        self.inp = self.interpreter.get_input_details()[0]
+        self.outp = self.interpreter.get_output_details()[0]
+        self.n_features = int(self.inp['shape'][-1])
+        if scaler_path is None:
+            self.features, self.mean, self.std = None, None, None
+        else:
+            self.features, self.mean, self.std = load_scaler(scaler_path)
+        self.quantized = self.inp['dtype'] == np.int8
+        if self.quantized:
+            mean = np.zeros(self.n_features) if self.mean is None else self.mean
+            std = np.ones(self.n_features) if self.std is None else self.std
+            self.multiplier, self.offset = fold_scaler(mean, std, *self.inp['quantization'])
+        self.batch_size = batch_size
+        self.interpreters = {int(self.inp['shape'][0]): self.interpreter}   # input rows -> interpreter
+        self.latencies = deque(maxlen=TIMING_WINDOW)   # seconds of the most recent invokes
+        self.invokes, self.rows_run, self.invoke_seconds = 0, 0, 0.0
+
+    def _interpreter(self, rows):
+        """An interpreter whose input tensor holds exactly rows rows, created and allocated once."""
+        interpreter = self.interpreters.get(rows)
+        if interpreter is None:
+            interpreter = load_interpreter(self.model_path, self.num_threads)
+            interpreter.resize_tensor_input(self.inp['index'], [rows, self.n_features])
+            interpreter.allocate_tensors()
+            self.interpreters[rows] = interpreter
+        return interpreter
+
+    def _normalize(self, X):
+        """Model input: z-scored float32, or int8 codes for a full-integer model."""
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        if self.quantized:
+            return np.clip(np.rint(X * self.multiplier + self.offset), -128, 127).astype(np.int8)
+        return X if self.mean is None else (X - self.mean) / self.std
+
+    def _output(self, out):
+        if self.outp['dtype'] == np.int8:
+            scale, zero_point = self.outp['quantization']
+            return (out.astype(np.float32) - zero_point) * scale
+        return out
+
+    def predict_proba(self, X):
+        X = self._normalize(X)
+        out = np.empty(len(X), dtype=np.float32)
+        if not len(X):
+            return out
+        # Small calls (online replay) are padded to a small fixed tensor, the rest to full batches
+        rows = SMALL_BATCH_ROWS if len(X) <= SMALL_BATCH_ROWS else self.batch_size
+        interpreter = self._interpreter(rows)
+        # Accessor for the input buffer; the view it returns must not be held across invoke()
+        tensor = interpreter.tensor(self.inp['index'])
+        for start in range(0, len(X), rows):
+            part = X[start:start + rows]
+            n = len(part)
+            buf = tensor()
+            buf[:n] = part
+            if n < rows:
+                buf[n:] = 0
+            del buf
+            t0 = time.perf_counter()
+            interpreter.invoke()
+            seconds = time.perf_counter() - t0
+            self.latencies.append(seconds)
+            self.invokes += 1
+            self.rows_run += n
+            self.invoke_seconds += seconds
+            out[start:start + n] = self._output(interpreter.get_tensor(self.outp['index'])[:n, 0])
+        return out
+
+    def row_loop_proba(self, X):
+        """Reference path: one set_tensor / invoke / get_tensor per row."""
+        X = self._normalize(X)
+        interpreter = self._interpreter(1)
+        out = np.empty(len(X), dtype=np.float32)
+        for i in range(len(X)):
+            interpreter.set_tensor(self.inp['index'], X[i:i + 1])
+            interpreter.invoke()
+            out[i] = self._output(interpreter.get_tensor(self.outp['index'])[0])[0]
+        return out
+
+    def predict(self, X):
+        return (self.predict_proba(X) > 0.5).astype(np.int64)
+
+    def timing_summary(self):
+        """Rows/s over all batches run so far; invoke latency percentiles over the last TIMING_WINDOW."""
+        if not self.invokes:
+            return 'no batches run'
+        p50, p95, p99 = np.percentile(np.array(self.latencies) * 1000, [50, 95, 99])
+        rows_s = self.rows_run / max(self.invoke_seconds, 1e-12)
+        return (f'{self.invokes} batches of up to {self.batch_size} rows: p50 {p50:.3f} ms, p95 {p95:.3f} ms, '
+                f'p99 {p99:.3f} ms (last {len(self.latencies)}), ~{rows_s:,.0f} rows/s')
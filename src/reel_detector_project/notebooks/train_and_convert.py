@@ -1,6 +1,9 @@
 # notebooks/train_and_convert.py
 # Train baseline and MLP, convert to quantized TFLite, save scaler.json
-import os, sys, json
+# --streaming trains the MLP from CSV batches (batch_stream.py) instead of an in-memory frame
+# --int8 also exports model_int8.tflite (int8 in/out) and model_int8.json with its quantization
+#   params and the scaler folded into the input quantization (see tflite_model.py)
+import os, sys, json, argparse
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
@@ -9,6 +12,11 @@ from sklearn.metrics import classification_report
 import tensorflow as tf
 from tensorflow import keras
 
+from batch_stream import csv_features, fit_scaler, iter_batches, make_tf_dataset
+from tflite_model import DEFAULT_BATCH_SIZE, TFLiteModel, int8_params, load_interpreter
+
+EVAL_SAMPLE_ROWS = 20000    # streaming mode: test rows gathered for the TFLite check
+
 def load_windows_csv(path):
     df = pd.read_csv(path)
     if 'label' not in df.columns:
@@ -32,8 +40,7 @@ def train_rf(X_train, y_train, X_test, y_test):
     print('[RF] Test report:\n', classification_report(y_test, preds))
     return rf
 
-def train_mlp(X_train, y_train, X_val, y_val, input_dim, epochs=25):
-    print('[MLP] Training model...')
+def build_mlp(input_dim):
     model = keras.Sequential([
         keras.layers.Input(shape=(input_dim,)),
         keras.layers.Dense(64, activation='relu'),
@@ -42,9 +49,56 @@ def train_mlp(X_train, y_train, X_val, y_val, input_dim, epochs=25):
         keras.layers.Dense(1, activation='sigmoid')
     ])
     model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+def train_mlp(X_train, y_train, X_val, y_val, input_dim, epochs=25):
+    print('[MLP] Training model...')
+    model = build_mlp(input_dim)
     model.fit(X_train, y_train, validation_data=(X_val, y_val), epochs=epochs, batch_size=64, verbose=2)
     return model
 
+def train_mlp_streaming(csv_path, features, scaler, epochs=25, batch_size=64):
+    """train_mlp fed by prefetched CSV batches; memory is bounded by the chunk size, not the CSV."""
+    print('[MLP] Training model from streamed batches...')
+    model = build_mlp(len(features))
+    train_ds = make_tf_dataset(csv_path, features, scaler, 'train', batch_size)
+    val_ds = make_tf_dataset(csv_path, features, scaler, 'val', batch_size, shuffle=False)
+    model.fit(train_ds, validation_data=val_ds, epochs=epochs, verbose=2)
+    return model
+
+def sample_part(csv_path, features, scaler, part, rows):
+    """Up to `rows` normalized rows of one part, as (X, y) arrays."""
+    Xs, ys, n = [], [], 0
+    for X, y in iter_batches(csv_path, features, scaler, part, batch_size=4096, shuffle=False):
+        Xs.append(X)
+        ys.append(y)
+        n += len(X)
+        if n >= rows:
+            break
+    return np.concatenate(Xs)[:rows], np.concatenate(ys)[:rows].astype(int)
+
+def run_streaming(csv_path, epochs, batch_size, int8=False):
+    features = csv_features(csv_path)
+    scaler, counts = fit_scaler(csv_path, features)
+    print('Rows per part:', counts)
+    os.makedirs('../models', exist_ok=True)
+    scaler.save('../models/scaler.json', features)
+    print('[RF] Skipped in streaming mode (needs the full training set in memory)')
+
+    model = train_mlp_streaming(csv_path, features, scaler, epochs=epochs, batch_size=batch_size)
+    model.save('../models/model.h5')
+    test_ds = make_tf_dataset(csv_path, features, scaler, 'test', batch_size=4096, shuffle=False)
+    loss, acc = model.evaluate(test_ds, verbose=0)
+    print(f'[MLP] Test loss {loss:.4f}, accuracy {acc:.4f}')
+    X_calib, _ = sample_part(csv_path, features, scaler, 'train', 200)
+    convert_to_tflite(model, X_calib, '../models/model_quant.tflite')
+    X_test, y_test = sample_part(csv_path, features, scaler, 'test', EVAL_SAMPLE_ROWS)
+    eval_tflite('../models/model_quant.tflite', X_test, y_test)
+    if int8:
+        convert_to_tflite_int8(model, X_calib, '../models/model_int8.tflite', scaler.to_json(features))
+        eval_tflite('../models/model_int8.tflite', X_test, y_test)
+    print('Saved scaler.json and models in ../models/')
+
 def convert_to_tflite(model, X_calib, out_path):
     print('[TFLite] Converting and quantizing...')
     converter = tf.lite.TFLiteConverter.from_keras_model(model)
@@ -58,27 +112,55 @@ def convert_to_tflite(model, X_calib, out_path):
         f.write(tflite_model)
     print('[TFLite] Saved:', out_path)
 
-def eval_tflite(tflite_path, X_test, y_test):
+def convert_to_tflite_int8(model, X_calib, out_path, scaler):
+    """Full-integer export: int8 ops, int8 input (normalized features) and int8 output.
+
+    The params file next to the model maps raw features to input codes in one
+    multiply-add per feature, so neither the z-score pass nor float I/O is needed.
+    """
+    print('[TFLite] Converting to full int8...')
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    def rep_gen():
+        for i in range(min(200, X_calib.shape[0])):
+            yield [X_calib[i:i+1].astype(np.float32)]
+    converter.representative_dataset = rep_gen
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    tflite_model = converter.convert()
+    with open(out_path,'wb') as f:
+        f.write(tflite_model)
+    params = int8_params(load_interpreter(out_path), scaler['features'], scaler['mean'], scaler['std'])
+    params_path = os.path.splitext(out_path)[0] + '.json'
+    with open(params_path, 'w') as f:
+        json.dump(params, f, indent=2)
+    print('[TFLite] Saved:', out_path, params_path)
+    print(f"[TFLite] input scale {params['input_scale']:.6g} zero point {params['input_zero_point']}, "
+          f"output scale {params['output_scale']:.6g} zero point {params['output_zero_point']}")
+
+def eval_tflite(tflite_path, X_test, y_test, batch_size=DEFAULT_BATCH_SIZE, num_threads=None):
     print('[TFLite] Running local eval...')
-    interpreter = tf.lite.Interpreter(model_path=tflite_path)
-    interpreter.allocate_tensors()
-    inp = interpreter.get_input_details()[0]
-    outp = interpreter.get_output_details()[0]
-    preds = []
-    for i in range(X_test.shape[0]):
-        x = X_test[i:i+1].astype(np.float32)
-        interpreter.set_tensor(inp['index'], x)
-        interpreter.invoke()
-        out = interpreter.get_tensor(outp['index'])[0][0]
-        preds.append(out)
-    y_pred = (np.array(preds) > 0.5).astype(int)
+    model = TFLiteModel(tflite_path, num_threads=num_threads, batch_size=batch_size)
+    preds = model.predict_proba(X_test)
+    print('[TFLite]', model.timing_summary())
+    y_pred = (preds > 0.5).astype(int)
     print('[TFLite] Report:\n', classification_report(y_test, y_pred))
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: python train_and_convert.py ../data/windows_labeled.csv')
-        sys.exit(1)
-    csv_path = sys.argv[1]
+    ap = argparse.ArgumentParser()
+    ap.add_argument('csv_path')
+    ap.add_argument('--streaming', action='store_true',
+                    help='Train the MLP from prefetched CSV batches instead of loading the CSV into memory')
+    ap.add_argument('--epochs', type=int, default=25)
+    ap.add_argument('--batch-size', dest='batch_size', type=int, default=64)
+    ap.add_argument('--int8', action='store_true',
+                    help='Also export a full-integer model (int8 I/O, scaler folded into the input quantization)')
+    args = ap.parse_args()
+    csv_path = args.csv_path
+    if args.streaming:
+        run_streaming(csv_path, args.epochs, args.batch_size, args.int8)
+        sys.exit(0)
     df = load_windows_csv(csv_path)
     X = df.drop(columns=[c for c in ['wstart'] if c in df.columns] + ['label'])
     y = df['label'].values
@@ -94,8 +176,11 @@ if __name__ == '__main__':
     # align splits for quick baseline (simplified)
     rf = train_rf(X_raw[:len(X_train_val)], y_train_val, X_raw[-len(X_test):], y_test)
 
-    model = train_mlp(X_train, y_train, X_val, y_val, input_dim=X_train.shape[1], epochs=25)
+    model = train_mlp(X_train, y_train, X_val, y_val, input_dim=X_train.shape[1], epochs=args.epochs)
     model.save('../models/model.h5')
     convert_to_tflite(model, X_train, '../models/model_quant.tflite')
     eval_tflite('../models/model_quant.tflite', X_test, y_test)
+    if args.int8:
+        convert_to_tflite_int8(model, X_train.to_numpy(dtype=np.float32), '../models/model_int8.tflite', scaler)
+        eval_tflite('../models/model_int8.tflite', X_test, y_test)
     print('Saved scaler.json and models in ../models/')
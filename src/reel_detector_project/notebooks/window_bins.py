@@ -0,0 +1,195 @@
+# notebooks/window_bins.py
+# Several (window, step) resolutions from one pass over the packets.
+#
+# FeatureBins folds a device's packets into time bins whose edges are exactly
+# the window boundaries of every requested (window, step): the starts that
+# window_starts() accumulates from the first packet (t += step, in float, as
+# the reference loop does) and those starts + window. A packet goes into the
+# bin [edge_j, edge_j+1) holding it, so "start <= ts < start + window" is
+# decided against the very same float boundaries compute_sliding_windows
+# uses, and every window is an exact range of bins. A uniform grid
+# (t0 + k * width) does not work: at epoch timestamps (~1.5e9 s) the
+# accumulated starts of a non-dyadic step such as 0.1 drift from it by many
+# ulps, and packets near a boundary land in the wrong window.
+#
+# Per bin FeatureBins keeps the row count, per-direction count / byte sum /
+# sum of squares, the downlink burst count, and the downlink IAT moments: the
+# sum and sum of squares of gaps between consecutive downlink packets inside
+# the bin, plus the gap from the previous downlink bin to the bin's first
+# downlink packet. Prefix sums over a window's bins give its aggregates, and
+# the IAT moments are the in-bin gaps plus the cross-bin gaps, minus the one
+# gap that reaches back before the window.
+#
+# Bins are filled chunk by chunk, so they work both on an in-memory frame and
+# on a streamed (time-ordered) input. Edges are generated ahead of the
+# packets; every edge up to the frontier (the smallest last generated start)
+# is final, so extending them never renumbers a bin that already holds data.
+# There are about two bins per window of each resolution, so every
+# resolution of a sweep comes out of a single read of the capture.
+
+import numpy as np
+import pandas as pd
+
+from windows import BURST_BYTES, FEATURE_COLUMNS, device_key, size_moments
+
+BIN_FIELDS = ('rows', 'n_down', 's_down', 'q_down', 'n_up', 's_up', 'q_up', 'burst',
+              'iat_sum', 'iat_sq', 'gap', 'gap_sq')
+FLOAT_FIELDS = ('iat_sum', 'iat_sq', 'gap', 'gap_sq')
+GROW_BINS = 4096
+MIN_AHEAD_WINDOWS = 64      # window starts generated past the packets at least
+
+
+class FeatureBins:
+    """Per-bin feature aggregates for one device; feed time-ordered chunks with add()."""
+
+    def __init__(self, device_ip, resolutions):
+        self.device_ip = device_ip
+        self.resolutions = list(dict.fromkeys((float(w), float(s)) for w, s in resolutions))
+        if not self.resolutions or any(w <= 0 or s <= 0 for w, s in self.resolutions):
+            raise ValueError('FeatureBins needs (window, step) pairs with positive lengths')
+        self.t0 = None
+        self.end_ts = None
+        self.nbins = 0
+        self.data = {f: np.zeros(0, dtype=np.float64 if f in FLOAT_FIELDS else np.int64) for f in BIN_FIELDS}
+        self._last_down = None      # (ts, bin) of the latest downlink packet so far
+        self.starts = {}            # (window, step) -> window starts generated so far
+        self.edges = np.empty(0)
+        self._frontier = -np.inf    # every edge <= frontier is in self.edges
+
+    def _extend_edges(self, ts_max):
+        """Generate window starts (and ends) until every edge up to ts_max is known."""
+        if ts_max < self._frontier:
+            return
+        # Run ahead by the span covered so far, so edges are rebuilt O(log) times
+        target = ts_max + (ts_max - self.t0)
+        for w, step in self.resolutions:
+            starts = self.starts.get((w, step), np.array([self.t0]))
+            n = max(int((target - starts[-1]) / step) + 2, MIN_AHEAD_WINDOWS)
+            parts = [starts]
+            last = starts[-1]
+            while last <= target:
+                # Continues the same sequential float sum as window_starts()
+                more = np.add.accumulate(np.concatenate(([last], np.full(n, step))))[1:]
+                parts.append(more)
+                last = more[-1]
+                n *= 2
+            self.starts[(w, step)] = np.concatenate(parts)
+        self.edges = np.unique(np.concatenate([a for (w, _), st in self.starts.items() for a in (st, st + w)]))
+        self._frontier = min(st[-1] for st in self.starts.values())
+
+    def _ensure(self, nbins):
+        if nbins <= len(self.data['rows']):
+            return
+        size = max(nbins, 2 * len(self.data['rows']), GROW_BINS)
+        for f, arr in self.data.items():
+            grown = np.zeros(size, dtype=arr.dtype)
+            grown[:len(arr)] = arr
+            self.data[f] = grown
+
+    def _add_counts(self, field, idx, weights=None):
+        if len(idx):
+            lo = idx.min()
+            counts = np.bincount(idx - lo, weights=weights)
+            self.data[field][lo:lo + len(counts)] += counts.astype(self.data[field].dtype)
+
+    def add_frame(self, df):
+        """add() for a ts,length,src,dst frame (rows not involving the device only count as rows)."""
+        key = device_key(df, self.device_ip)
+        self.add(df['ts'].to_numpy(dtype=np.float64), df['length'].to_numpy(dtype=np.int64),
+                 (df['dst'] == key).to_numpy(), (df['src'] == key).to_numpy())
+
+    def add(self, ts, length, down, up):
+        if len(ts) == 0:
+            return
+        if self.t0 is None:
+            self.t0 = float(ts[0])
+        if (self.end_ts is not None and ts[0] < self.end_ts) or (len(ts) > 1 and np.any(ts[1:] < ts[:-1])):
+            raise ValueError('FeatureBins needs packets in time order')
+        self.end_ts = float(ts[-1])
+        self._extend_edges(self.end_ts)
+        idx = np.searchsorted(self.edges, ts, side='right') - 1
+        self.nbins = int(idx[-1]) + 1
+        self._ensure(self.nbins)
+
+        self._add_counts('rows', idx)
+        for name, mask in (('down', down), ('up', up)):
+            sel = idx[mask]
+            sizes = length[mask]
+            self._add_counts(f'n_{name}', sel)
+            self._add_counts(f's_{name}', sel, sizes)
+            self._add_counts(f'q_{name}', sel, sizes.astype(np.float64) ** 2)
+        self._add_counts('burst', idx[down & (length > BURST_BYTES)])
+
+        dts, dbin = ts[down], idx[down]
+        if self._last_down is not None and len(dts):
+            dts = np.concatenate(([self._last_down[0]], dts))
+            dbin = np.concatenate(([self._last_down[1]], dbin))
+        if len(dts) > 1:
+            diff = np.diff(dts)
+            later = dbin[1:]
+            inside = dbin[:-1] == later
+            self._add_counts('iat_sum', later[inside], diff[inside])
+            self._add_counts('iat_sq', later[inside], diff[inside] ** 2)
+            # Each bin has at most one incoming cross-bin gap (to its first downlink packet)
+            self.data['gap'][later[~inside]] = diff[~inside]
+            self.data['gap_sq'][later[~inside]] = diff[~inside] ** 2
+        if len(dts):
+            self._last_down = (float(dts[-1]), int(dbin[-1]))
+
+    def windows(self, window_size, step):
+        """Feature frame for one of the resolutions, as compute_sliding_windows would give it."""
+        if (float(window_size), float(step)) not in self.resolutions:
+            raise ValueError(f'({window_size}, {step}) is not one of the binned resolutions')
+        if self.t0 is None:
+            return pd.DataFrame()
+        starts = self.starts[(float(window_size), float(step))]
+        wstart = starts[starts <= self.end_ts]
+        # Both boundaries are edges, so the windows are exact bin ranges
+        lo = np.searchsorted(self.edges, wstart)
+        hi = np.minimum(np.searchsorted(self.edges, wstart + window_size), self.nbins)
+        P = {f: np.concatenate(([0], np.cumsum(self.data[f][:self.nbins]))) for f in BIN_FIELDS}
+
+        def total(f):
+            return P[f][hi] - P[f][lo]
+
+        keep = total('rows') > 0
+        wstart, lo, hi = wstart[keep], lo[keep], hi[keep]
+
+        nd, sd, qd = total('n_down'), total('s_down'), total('q_down')
+        nu, su, qu = total('n_up'), total('s_up'), total('q_up')
+        md, stdd = size_moments(nd, sd, qd)
+        mu, stdu = size_moments(nu, su, qu)
+
+        # Gaps between consecutive downlink packets inside [lo, hi): every in-bin gap,
+        # plus cross-bin gaps except the one into the window's first downlink bin
+        iat_sum = total('iat_sum') + total('gap')
+        iat_sq = total('iat_sq') + total('gap_sq')
+        down_bins = np.append(np.flatnonzero(self.data['n_down'][:self.nbins] > 0), self.nbins)
+        first = down_bins[np.searchsorted(down_bins, lo)]
+        has_first = first < hi
+        first = np.minimum(first, self.nbins - 1)
+        iat_sum = iat_sum - np.where(has_first, self.data['gap'][first], 0.0)
+        iat_sq = iat_sq - np.where(has_first, self.data['gap_sq'][first], 0.0)
+        k = nd - 1
+        kf = np.maximum(k, 1).astype(np.float64)
+        iat_mean = np.where(k > 0, iat_sum / kf, 0.0)
+        iat_std = np.where(k > 0, np.sqrt(np.maximum(iat_sq / kf - iat_mean ** 2, 0.0)), 0.0)
+
+        return pd.DataFrame({
+            'wstart': wstart,
+            'bytes_down': sd, 'pkt_count_down': nd, 'avg_pkt_size_down': md, 'std_pkt_size_down': stdd,
+            'bytes_up': su, 'pkt_count_up': nu, 'avg_pkt_size_up': mu, 'std_pkt_size_up': stdu,
+            'bitrate_down': sd / window_size,
+            'iat_mean_down': iat_mean, 'iat_std_down': iat_std,
+            'burst_count_down': total('burst'),
+            'ratio_down_up': sd / (su + 1),
+        }, columns=['wstart'] + FEATURE_COLUMNS)
+
+
+def compute_multi_resolution_windows(df, device_ip, resolutions):
+    """{(window, step): feature frame} for every resolution from one binning pass over df."""
+    if not df['ts'].is_monotonic_increasing:
+        df = df.sort_values('ts', kind='stable')
+    bins = FeatureBins(device_ip, resolutions)
+    bins.add_frame(df)
+    return {(w, s): bins.windows(w, s) for w, s in resolutions}
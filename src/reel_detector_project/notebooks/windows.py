@@ -1,17 +1,378 @@
 # notebooks/windows.py
 # Convert a packet CSV (ts,length,src,dst) into sliding windows of features.
+# A .pkts packet store (see packet_store.py) can be used in place of the CSV.
+
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
 
+from packet_store import is_packet_store, open_packet_store
+from pcap_reader import ipv4_private_mask, ipv4_to_int, ipv4_to_str
+
 def load_packet_csv(path):
+    if is_packet_store(path):
+        # Columns stay memory-mapped; only sort (copy) if the capture was out of order
+        df = open_packet_store(path).to_frame()
+        if df['ts'].is_monotonic_increasing:
+            return df
+        return df.sort_values('ts', kind='stable').reset_index(drop=True)
     df = pd.read_csv(path)
     df = df.sort_values('ts').reset_index(drop=True)
     return df
 
+def device_key(df, device_ip):
+    """device_ip in the representation of df's src/dst columns (uint32 for packet stores)."""
+    if isinstance(device_ip, str) and pd.api.types.is_integer_dtype(df['dst']):
+        return ipv4_to_int(device_ip)
+    return device_ip
+
+FEATURE_COLUMNS = [
+    'bytes_down', 'pkt_count_down', 'avg_pkt_size_down', 'std_pkt_size_down',
+    'bytes_up', 'pkt_count_up', 'avg_pkt_size_up', 'std_pkt_size_up',
+    'bitrate_down', 'iat_mean_down', 'iat_std_down', 'burst_count_down', 'ratio_down_up',
+]
+BURST_BYTES = 1000
+# Bump whenever the meaning or computation of any feature column changes;
+# feature_cache keys on it so stale cached windows are never served
+FEATURE_SCHEMA_VERSION = 2
+
+def window_starts(start_ts, end_ts, step):
+    """Window start times exactly as the reference loop produces them (t += step while t <= end)."""
+    if start_ts > end_ts:
+        return np.empty(0)
+    n = int((end_ts - start_ts) / step) + 2
+    while True:
+        starts = np.add.accumulate(np.concatenate(([start_ts], np.full(n - 1, step))))
+        if starts[-1] > end_ts:
+            return starts[starts <= end_ts]
+        n *= 2
+
+def _prefix(values):
+    out = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=out[1:])
+    return out
+
+def _size_stats(length, mask, lo, hi):
+    """Per-window (bytes, count, mean, std) of length[mask] for rows [lo, hi)."""
+    sel = np.where(mask, length, 0)
+    c_n, c_s, c_q = _prefix(mask.astype(np.int64)), _prefix(sel), _prefix(sel * sel)
+    n = c_n[hi] - c_n[lo]
+    s = c_s[hi] - c_s[lo]
+    q = c_q[hi] - c_q[lo]
+    mean, std = size_moments(n, s, q)
+    return s, n, mean, std
+
+def size_moments(n, s, q):
+    """Per-window (mean, population std) from int64 count, sum and sum of squares."""
+    nf = np.maximum(n, 1).astype(np.float64)
+    mean = np.where(n > 0, s / nf, 0.0)
+    if np.all(n.astype(np.float64) * q.astype(np.float64) < 2.0 ** 62):
+        # Exact integer numerator n*sum(x^2) - sum(x)^2 while it fits in int64
+        var = (n * q - s * s) / (nf * nf)
+    else:
+        var = np.maximum(q / nf - mean * mean, 0.0)
+    std = np.where(n > 0, np.sqrt(var), 0.0)
+    return mean, std
+
 def compute_sliding_windows(df, device_ip, window_size=5.0, step=2.5):
+    """Sliding-window features for device_ip in O(packets + windows).
+
+    Window bounds come from searchsorted on the sorted timestamps; per-direction
+    counts, byte sums, sums of squares, burst counts and IAT moments come from
+    prefix sums built once, so each window is a handful of array lookups.
+    Produces the same columns and values as compute_sliding_windows_naive
+    (std/IAT moments up to float rounding).
+    """
+    if df.empty:
+        return pd.DataFrame()
+    device_ip = device_key(df, device_ip)
+    if not df['ts'].is_monotonic_increasing:
+        df = df.sort_values('ts', kind='stable')
+    ts = df['ts'].to_numpy(dtype=np.float64)
+    length = df['length'].to_numpy(dtype=np.int64)
+    down = (df['dst'] == device_ip).to_numpy()
+    up = (df['src'] == device_ip).to_numpy()
+    return window_features(ts, length, down, up, window_starts(ts[0], ts[-1], step), window_size)
+
+def window_features(ts, length, down, up, wstart, window_size):
+    """Feature frame for the given window starts over sorted packet arrays.
+
+    Windows without packets are dropped. Every window must lie inside the
+    rows passed in for its values to be complete.
+    """
+    lo = np.searchsorted(ts, wstart, side='left')
+    hi = np.searchsorted(ts, wstart + window_size, side='left')
+    keep = hi > lo
+    wstart, lo, hi = wstart[keep], lo[keep], hi[keep]
+
+    bd, nd, md, sd = _size_stats(length, down, lo, hi)
+    bu, nu, mu, su = _size_stats(length, up, lo, hi)
+    burst = _prefix((down & (length > BURST_BYTES)).astype(np.int64))
+    burst_count_down = burst[hi] - burst[lo]
+
+    # IATs between consecutive downlink packets; a window holding downlink
+    # packets a..b-1 (indices into the downlink-only series) owns diffs a..b-2.
+    down_ts = ts[down]
+    c_down = _prefix(down.astype(np.int64))
+    a = c_down[lo]
+    b = c_down[hi]
+    k = b - a - 1
+    has_iat = k > 0
+    kf = np.maximum(k, 1).astype(np.float64)
+    iat_mean = np.zeros(len(wstart))
+    iat_std = np.zeros(len(wstart))
+    if len(down_ts) > 1:
+        iat = np.diff(down_ts)
+        # Moments about the global mean keep the sum-of-squares subtraction well conditioned
+        ref = iat.mean()
+        dev = iat - ref
+        c_dev, c_dev2 = _prefix(dev), _prefix(dev * dev)
+        top = len(down_ts) - 1
+        ia = np.minimum(a, top)
+        ib = np.minimum(np.maximum(b - 1, a), top)
+        # Diffs telescope, so their mean is (last - first) / k
+        iat_mean = np.where(has_iat, (down_ts[ib] - down_ts[ia]) / kf, 0.0)
+        m1 = (c_dev[ib] - c_dev[ia]) / kf
+        m2 = (c_dev2[ib] - c_dev2[ia]) / kf
+        iat_std = np.where(has_iat, np.sqrt(np.maximum(m2 - m1 * m1, 0.0)), 0.0)
+
+    return pd.DataFrame({
+        'wstart': wstart,
+        'bytes_down': bd, 'pkt_count_down': nd, 'avg_pkt_size_down': md, 'std_pkt_size_down': sd,
+        'bytes_up': bu, 'pkt_count_up': nu, 'avg_pkt_size_up': mu, 'std_pkt_size_up': su,
+        'bitrate_down': bd / window_size,
+        'iat_mean_down': iat_mean, 'iat_std_down': iat_std,
+        'burst_count_down': burst_count_down,
+        'ratio_down_up': bd / (bu + 1),
+    })
+
+class StreamingWindower:
+    """compute_sliding_windows over packets that arrive in time-ordered chunks.
+
+    push() takes the next chunk (ts,length,src,dst, already filtered or not) and
+    returns the windows that can no longer change: those ending at or before the
+    newest timestamp seen. Rows that may still belong to a pending window are
+    carried over to the next push, so memory is bounded by one chunk plus one
+    window span. finish() returns the remaining windows. The concatenated output
+    matches compute_sliding_windows on the device's rows of the whole input
+    (IAT std up to float rounding).
+
+    Within the carried rows order does not matter, but a row older than an
+    already emitted window raises ValueError (or, with drop_late=True, is
+    dropped and counted in .late, as a live pipeline would have to).
+    """
+
+    def __init__(self, device_ip, window_size=5.0, step=2.5, drop_late=False):
+        self.device_ip = device_ip
+        self.window_size = window_size
+        self.step = step
+        self.drop_late = drop_late
+        self.next_start = None      # first window start not emitted yet
+        self.frontier = -np.inf     # end of the last emitted window
+        self.max_ts = -np.inf
+        self.rows = 0
+        self.late = 0
+        self._buf = None            # (ts, length, down, up) carried rows
+
+    def _append(self, df):
+        key = device_key(df, self.device_ip)
+        down = (df['dst'] == key).to_numpy()
+        up = (df['src'] == key).to_numpy()
+        rel = down | up
+        self._append_rows(df['ts'].to_numpy(dtype=np.float64)[rel],
+                          df['length'].to_numpy(dtype=np.int64)[rel], down[rel], up[rel])
+
+    def _append_rows(self, ts, length, down, up):
+        if len(ts) and self.drop_late and ts.min() < self.frontier:
+            keep = ts >= self.frontier
+            self.late += int(len(ts) - keep.sum())
+            ts, length, down, up = ts[keep], length[keep], down[keep], up[keep]
+        if len(ts) == 0:
+            return
+        if ts.min() < self.frontier:
+            raise ValueError(f'Packet at ts={ts.min()} is older than an emitted window '
+                             f'(ending {self.frontier}); input is not time-ordered')
+        cols = (ts, length, down, up)
+        if self._buf is not None:
+            cols = tuple(np.concatenate((old, new)) for old, new in zip(self._buf, cols))
+        ts = cols[0]
+        if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+            order = np.argsort(ts, kind='stable')
+            cols = tuple(c[order] for c in cols)
+        self._buf = cols
+        self.rows += len(ts)
+        self.max_ts = max(self.max_ts, float(cols[0][-1]))
+        if self.frontier == -np.inf:
+            # Nothing emitted yet: windows start at the earliest row seen so far
+            self.next_start = float(cols[0][0])
+
+    def _emit(self, final):
+        if self._buf is None or self.next_start > self.max_ts:
+            return pd.DataFrame()
+        starts = window_starts(self.next_start, self.max_ts, self.step)
+        if not final:
+            # Only windows whose whole span has been seen
+            starts = starts[starts + self.window_size <= self.max_ts]
+        if len(starts) == 0:
+            return pd.DataFrame()
+        ts, length, down, up = self._buf
+        out = window_features(ts, length, down, up, starts, self.window_size)
+        self.frontier = starts[-1] + self.window_size
+        self.next_start = starts[-1] + self.step
+        # Drop rows that no pending window can contain
+        cut = np.searchsorted(ts, self.next_start, side='left')
+        self._buf = tuple(c[cut:] for c in self._buf)
+        return out
+
+    def push(self, df):
+        if not df.empty:
+            self._append(df)
+        return self._emit(final=False)
+
+    def finish(self):
+        out = self._emit(final=True)
+        self._buf = None
+        return out
+
+    def push_rows(self, ts, length, down, up):
+        """push() for rows already reduced to this device (see split_by_device)."""
+        self._append_rows(ts, length, down, up)
+        return self._emit(final=False)
+
+    def advance(self, ts):
+        """Declare that no packet before ts is still to come (a clock tick) and emit what that closes."""
+        self.max_ts = max(self.max_ts, ts)
+        return self._emit(final=False)
+
+def ipv4_column(values):
+    """uint32 addresses for a src/dst column holding dotted strings or integers (unparsable -> 0)."""
+    if pd.api.types.is_integer_dtype(values):
+        return np.asarray(values, dtype=np.uint32)
+    codes, uniq = pd.factorize(values)
+    table = np.array([ipv4_to_int(ip) for ip in uniq], dtype=np.uint32)
+    # factorize marks missing values with -1: map them to 0
+    return np.append(table, np.uint32(0))[codes]
+
+def split_by_device(df):
+    """Group packets by internal (private-range) endpoint in one pass.
+
+    A packet is assigned to its src if that is private and to its dst if that
+    is private, so traffic between two internal hosts counts for both.
+    Returns (devices, bounds, ts, length, down, up): rows of devices[i] are
+    bounds[i]:bounds[i+1], sorted by time, with down/up relative to that device.
+    """
+    src = ipv4_column(df['src'])
+    dst = ipv4_column(df['dst'])
+    ts_all = df['ts'].to_numpy(dtype=np.float64)
+    src_dev = ipv4_private_mask(src)
+    dst_dev = ipv4_private_mask(dst) & (dst != src)
+    idx = np.concatenate((np.flatnonzero(src_dev), np.flatnonzero(dst_dev)))
+    dev = np.concatenate((src[src_dev], dst[dst_dev]))
+    # Primary key device, then time, then original row order
+    order = np.lexsort((idx, ts_all[idx], dev))
+    idx, dev = idx[order], dev[order]
+    devices, bounds = np.unique(dev, return_index=True)
+    bounds = np.append(bounds, len(dev))
+    return (devices, bounds, ts_all[idx], df['length'].to_numpy(dtype=np.int64)[idx],
+            dst[idx] == dev, src[idx] == dev)
+
+def _device_windows_job(args):
+    names, bounds, ts, length, down, up, window_size, step = args
+    frames = []
+    for i, name in enumerate(names):
+        a, b = bounds[i], bounds[i + 1]
+        t = ts[a:b]
+        out = window_features(t, length[a:b], down[a:b], up[a:b],
+                              window_starts(t[0], t[-1], step), window_size)
+        out.insert(0, 'device', name)
+        frames.append(out)
+    return frames
+
+def compute_all_device_windows(df, window_size=5.0, step=2.5, workers=1):
+    """Window features for every internal device in df as one long table.
+
+    Columns are device, wstart and the usual features; rows for each device are
+    what compute_sliding_windows(df, device) gives on that device's packets.
+    With workers > 1 devices are spread over processes in row-balanced groups.
+    """
+    if df.empty:
+        return pd.DataFrame()
+    devices, bounds, ts, length, down, up = split_by_device(df)
+    if len(devices) == 0:
+        return pd.DataFrame()
+    names = ipv4_to_str(devices)
+    # Contiguous device groups of roughly equal row counts (several per worker for balance)
+    groups = max(1, min(len(devices), workers * 4))
+    cuts = np.searchsorted(bounds[1:], np.linspace(0, bounds[-1], groups + 1)[1:-1], side='left') + 1
+    cuts = np.unique(np.concatenate(([0], cuts, [len(devices)])))
+    jobs = []
+    for g0, g1 in zip(cuts[:-1], cuts[1:]):
+        a, b = bounds[g0], bounds[g1]
+        jobs.append((names[g0:g1], bounds[g0:g1 + 1] - a, ts[a:b], length[a:b], down[a:b], up[a:b],
+                     window_size, step))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_device_windows_job, jobs))
+    else:
+        results = [_device_windows_job(job) for job in jobs]
+    frames = [f for frames in results for f in frames if not f.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+class AllDevicesStreamingWindower:
+    """compute_all_device_windows over time-ordered chunks (one StreamingWindower per device).
+
+    push()/finish() return long-format frames (device, wstart, features) of the
+    windows closed by that chunk.
+    """
+
+    def __init__(self, window_size=5.0, step=2.5):
+        self.window_size = window_size
+        self.step = step
+        self.windowers = {}
+        self.rows = 0
+
+    def _collect(self, pairs):
+        frames = []
+        for name, out in pairs:
+            if not out.empty:
+                out.insert(0, 'device', name)
+                frames.append(out)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def push(self, df):
+        if df.empty:
+            return pd.DataFrame()
+        devices, bounds, ts, length, down, up = split_by_device(df)
+        self.rows += len(ts)
+        pairs = []
+        for name, a, b in zip(ipv4_to_str(devices), bounds[:-1], bounds[1:]):
+            w = self.windowers.get(name)
+            if w is None:
+                w = self.windowers[name] = StreamingWindower(name, self.window_size, self.step)
+            pairs.append((name, w.push_rows(ts[a:b], length[a:b], down[a:b], up[a:b])))
+        return self._collect(pairs)
+
+    def finish(self):
+        return self._collect((name, w.finish()) for name, w in sorted(self.windowers.items()))
+
+def check_window_parity(df, device_ip, window_size=5.0, step=2.5, rtol=1e-6, atol=1e-9):
+    """Compare compute_sliding_windows against the reference loop on df.
+    Returns a list of mismatching column names (empty when they agree).
+    """
+    fast = compute_sliding_windows(df, device_ip, window_size, step)
+    ref = compute_sliding_windows_naive(df, device_ip, window_size, step)
+    if list(fast.columns) != list(ref.columns) or len(fast) != len(ref):
+        return ['<shape>']
+    return [c for c in ref.columns
+            if not np.allclose(fast[c].to_numpy(dtype=np.float64), ref[c].to_numpy(dtype=np.float64),
+                               rtol=rtol, atol=atol)]
+
+def compute_sliding_windows_naive(df, device_ip, window_size=5.0, step=2.5):
+    """Reference implementation: re-filters the whole frame for every window (O(windows x packets))."""
     if df.empty:
         return pd.DataFrame()
+    device_ip = device_key(df, device_ip)
     start_ts, end_ts = df['ts'].iloc[0], df['ts'].iloc[-1]
     windows = []
     t = start_ts
@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 """
-Proper PCAP to CSV converter using tshark (fast path)
-- Supports resume via --resume flag: continues from the last timestamp in existing CSV
+Proper PCAP to CSV converter (fast path)
+- Decodes pcap (usec/nsec) and pcapng natively with the memory-mapped reader;
+  falls back to tshark for anything the reader does not understand (--engine)
+- Supports resume via --resume flag: seeks to the input byte offset saved in the
+  <out>.ckpt.json sidecar checkpoint (falls back to the last timestamp in the output
+  when there is no checkpoint, e.g. output written by an older version)
 - Optional --max to limit number of rows appended in this run
-- Requires tshark to be installed and available on PATH
+- Optional --workers N runs one tshark per byte-range shard of a classic pcap
+- Writes a columnar packet store instead of CSV when the output path ends in .pkts
+- Optional --flows also writes proto,sport,dport (TCP/UDP ports, 0 otherwise), native or tshark
+- The tshark engine requires tshark to be installed and available on PATH
 """
 import csv
 import sys
@@ -12,13 +19,32 @@ import argparse
 import shutil
 import subprocess
 from pathlib import Path
-from typing import Optional
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Callable, Optional
+
+sys.path.append(str(Path('notebooks').resolve()))
+from pcap_reader import GLOBAL_HEADER_LEN, PcapReader, ipv4_to_int, network_headers  # type: ignore
+from packet_store import (PacketStoreWriter, committed_output_offset, concat_packet_outputs,  # type: ignore
+                          is_packet_store, open_packet_store, open_packet_writer)
+from pcap_shards import convert_pcap_parallel, part_path_for, remove_part  # type: ignore
+from checkpoint import load_checkpoint, remove_checkpoint, save_checkpoint  # type: ignore
+from heavy_hitters import DeviceSketch, devices_path, save_device_sketch  # type: ignore
+
+STORE_BATCH_ROWS = 100_000
+# Packets decoded between checkpoints (native engine) / per tshark run (tshark engine)
+CHECKPOINT_EVERY_PACKETS = 1_000_000
+# tshark fields after ts,len,src,dst for --flows; the port is whichever of TCP/UDP is present
+FLOW_FIELDS = ['ip.proto', 'tcp.srcport', 'tcp.dstport', 'udp.srcport', 'udp.dstport']
 
 
 def get_last_timestamp(csv_path: str) -> Optional[float]:
-    """Return last timestamp from existing CSV, or None if not found."""
+    """Return last timestamp from existing CSV or packet store, or None if not found."""
     if not os.path.exists(csv_path):
         return None
+    if is_packet_store(csv_path):
+        store = open_packet_store(csv_path)
+        return float(store.ts[-1]) if len(store) else None
     last_ts: Optional[float] = None
     try:
         with open(csv_path, 'rb') as f:
@@ -67,7 +93,8 @@ def ensure_tshark_available() -> None:
         sys.exit(1)
 
 
-def build_tshark_cmd(pcap_path: str, min_ts: Optional[float], max_rows: Optional[int]) -> list[str]:
+def build_tshark_cmd(pcap_path: str, min_ts: Optional[float], max_rows: Optional[int],
+                     flows: bool = False) -> list[str]:
     cmd = [
         'tshark',
         '-r', pcap_path,
@@ -76,6 +103,11 @@ def build_tshark_cmd(pcap_path: str, min_ts: Optional[float], max_rows: Optional
         '-e', 'frame.len',
         '-e', 'ip.src',
         '-e', 'ip.dst',
+    ]
+    if flows:
+        for field in FLOW_FIELDS:
+            cmd.extend(['-e', field])
+    cmd += [
         '-E', 'header=n',
         '-E', 'separator=,',
         '-E', 'quote=n',
@@ -88,7 +120,51 @@ def build_tshark_cmd(pcap_path: str, min_ts: Optional[float], max_rows: Optional
     return cmd
 
 
-def stream_tshark_to_csv(cmd: list[str], out_csv: str, append: bool) -> tuple[int, int]:
+def flow_values(parts: list[str]) -> tuple[int, int, int]:
+    """(proto, sport, dport) from the FLOW_FIELDS part of a tshark line; missing values are 0."""
+    values = [int(p) if p.isdigit() else 0 for p in parts[4:9]]
+    proto, tcp_sport, tcp_dport, udp_sport, udp_dport = values + [0] * (5 - len(values))
+    return proto, tcp_sport or udp_sport, tcp_dport or udp_dport
+
+
+def start_tshark(cmd: list[str], feed: Optional[Callable[[IO[bytes]], None]] = None) -> subprocess.Popen:
+    """Launch tshark. If feed is given, it runs in a thread and writes the capture to tshark's stdin."""
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if feed is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+    )
+    if feed is not None:
+        assert proc.stdin is not None
+        threading.Thread(target=feed, args=(proc.stdin.buffer,), daemon=True).start()
+    return proc
+
+
+def stop_tshark(proc: subprocess.Popen) -> None:
+    # Drain and terminate
+    try:
+        proc.kill()
+    except Exception:
+        pass
+    try:
+        proc.wait(timeout=5)
+    except Exception:
+        pass
+    # Print last stderr line if useful
+    if proc.stderr is not None:
+        err_out = proc.stderr.read() or ''
+        if err_out.strip():
+            last_line = err_out.strip().splitlines()[-1]
+            print('tshark stderr:', last_line)
+
+
+def stream_tshark_to_csv(cmd: list[str], out_csv: str, append: bool,
+                         feed: Optional[Callable[[IO[bytes]], None]] = None,
+                         flows: bool = False) -> tuple[int, int]:
     """Run tshark and stream its CSV-like output into out_csv.
     Returns (rows_written, errors)
     """
@@ -99,17 +175,10 @@ def stream_tshark_to_csv(cmd: list[str], out_csv: str, append: bool) -> tuple[in
     with open(out_csv, 'a' if append else 'w', newline='') as f:
         writer = csv.writer(f)
         if not append:
-            writer.writerow(['ts', 'length', 'src', 'dst'])
+            writer.writerow(['ts', 'length', 'src', 'dst'] + (['proto', 'sport', 'dport'] if flows else []))
 
         # Launch tshark
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-        )
+        proc = start_tshark(cmd, feed)
         try:
             assert proc.stdout is not None
             for line in proc.stdout:
@@ -125,28 +194,156 @@ def stream_tshark_to_csv(cmd: list[str], out_csv: str, append: bool) -> tuple[in
                 length = parts[1]
                 src = parts[2] if len(parts) > 2 and parts[2] else '0.0.0.0'
                 dst = parts[3] if len(parts) > 3 and parts[3] else '0.0.0.0'
-                writer.writerow([ts, length, src, dst])
+                if flows:
+                    writer.writerow([ts, length, src, dst, *flow_values(parts)])
+                else:
+                    writer.writerow([ts, length, src, dst])
                 rows_written += 1
         finally:
-            # Drain and terminate
-            try:
-                proc.kill()
-            except Exception:
-                pass
+            stop_tshark(proc)
+    return rows_written, errors
+
+
+def stream_tshark_to_store(cmd: list[str], out_path: str, append: bool,
+                           feed: Optional[Callable[[IO[bytes]], None]] = None,
+                           flows: bool = False) -> tuple[int, int]:
+    """Run tshark and append its output to a columnar packet store in chunks.
+    Returns (rows_written, errors)
+    """
+    rows_written = 0
+    errors = 0
+    ip_cache: dict[str, int] = {}
+
+    def ip_value(ip: str) -> int:
+        v = ip_cache.get(ip)
+        if v is None:
+            v = ip_cache[ip] = ipv4_to_int(ip)
+        return v
+
+    with PacketStoreWriter(out_path, append=append, flows=flows) as store:
+        ts_col: list[float] = []
+        len_col: list[int] = []
+        src_col: list[int] = []
+        dst_col: list[int] = []
+        flow_cols: list[list[int]] = [[], [], []] if flows else []
+
+        def flush() -> None:
+            store.append(ts_col, len_col, src_col, dst_col, *flow_cols)
+            for col in (ts_col, len_col, src_col, dst_col, *flow_cols):
+                col.clear()
+
+        proc = start_tshark(cmd, feed)
+        try:
+            assert proc.stdout is not None
+            for line in proc.stdout:
+                parts = line.strip('\r\n').split(',')
+                if len(parts) < 2:
+                    if parts[0]:
+                        errors += 1
+                    continue
+                try:
+                    ts_col.append(float(parts[0]))
+                    len_col.append(int(parts[1]))
+                except ValueError:
+                    errors += 1
+                    continue
+                src_col.append(ip_value(parts[2]) if len(parts) > 2 else 0)
+                dst_col.append(ip_value(parts[3]) if len(parts) > 3 else 0)
+                if flows:
+                    for col, v in zip(flow_cols, flow_values(parts)):
+                        col.append(v)
+                if len(ts_col) >= STORE_BATCH_ROWS:
+                    rows_written += len(ts_col)
+                    flush()
+            rows_written += len(ts_col)
+            flush()
+        finally:
+            stop_tshark(proc)
+    return rows_written, errors
+
+
+def stream_tshark(cmd: list[str], out_path: str, append: bool,
+                  feed: Optional[Callable[[IO[bytes]], None]] = None, flows: bool = False) -> tuple[int, int]:
+    if is_packet_store(out_path):
+        return stream_tshark_to_store(cmd, out_path, append, feed, flows)
+    return stream_tshark_to_csv(cmd, out_path, append, feed, flows)
+
+
+def make_feed(pcap_path: str, start: int, stop: int) -> Callable[[IO[bytes]], None]:
+    """stdin feeder for tshark: global header plus the records in bytes [start, stop) of a classic pcap."""
+    def feed(stdin: IO[bytes]) -> None:
+        with open(pcap_path, 'rb') as f:
             try:
-                proc.wait(timeout=5)
-            except Exception:
+                stdin.write(f.read(GLOBAL_HEADER_LEN))
+                f.seek(start)
+                remaining = stop - start
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 16 * 1024 * 1024))
+                    if not chunk:
+                        break
+                    stdin.write(chunk)
+                    remaining -= len(chunk)
+            except BrokenPipeError:
                 pass
-            # Print last stderr line if useful
-            if proc.stderr is not None:
-                err_out = proc.stderr.read() or ''
-                if err_out.strip():
-                    last_line = err_out.strip().splitlines()[-1]
-                    print('tshark stderr:', last_line)
-    return rows_written, errors
+            finally:
+                try:
+                    stdin.close()
+                except BrokenPipeError:
+                    pass
+    return feed
+
+
+def convert_shard_with_tshark(pcap_path: str, part_path: str, start: int, stop: int,
+                              flows: bool = False) -> tuple[int, int]:
+    """Run one tshark over records [start, stop) of a classic pcap, piped in with the global header."""
+    cmd = build_tshark_cmd('-', None, None, flows)
+    return stream_tshark(cmd, part_path, append=False, feed=make_feed(pcap_path, start, stop), flows=flows)
+
 
+def _convert_shard_job(args: tuple[str, str, int, int, bool]) -> tuple[int, int]:
+    return convert_shard_with_tshark(*args)
+
+
+def convert_with_tshark_parallel(pcap_path: str, out_path: str, workers: int,
+                                 flows: bool = False) -> tuple[int, int]:
+    """Split a classic pcap into record-aligned byte ranges and run one tshark per shard.
+    Shard outputs are concatenated in capture order, so the result matches a serial run.
+    Returns (rows_written, errors)
+    """
+    with PcapReader(pcap_path) as reader:
+        starts = reader.shard_starts(workers)
+    jobs = [(pcap_path, part_path_for(out_path, i), starts[i], starts[i + 1], flows) for i in range(workers)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_convert_shard_job, jobs))
+        concat_packet_outputs([job[1] for job in jobs], out_path)
+    finally:
+        for job in jobs:
+            remove_part(job[1])
+    return sum(r[0] for r in results), sum(r[1] for r in results)
 
-def convert_with_tshark(pcap_path: str, csv_path: str, resume: bool, max_rows: Optional[int]) -> bool:
+
+def convert_with_tshark(pcap_path: str, csv_path: str, resume: bool, max_rows: Optional[int],
+                        workers: int = 1, flows: bool = False) -> bool:
+    if workers > 1:
+        if resume or max_rows is not None:
+            print('Error: --workers cannot be combined with --resume or --max')
+            return False
+        if native_format(pcap_path) != 'pcap':
+            print('Parallel mode needs a classic pcap; running a single tshark.')
+            workers = 1
+    if workers > 1:
+        remove_checkpoint(csv_path)
+        print(f'Running {workers} tshark processes over byte-range shards...')
+        rows, errs = convert_with_tshark_parallel(pcap_path, csv_path, workers, flows)
+        print('Conversion complete!')
+        print(f'Total rows written this run: {rows}')
+        print(f'Errors (lines skipped): {errs}')
+        print(f'Output saved to: {csv_path}')
+        return rows > 0
+    if native_format(pcap_path) == 'pcap' and (not resume or load_checkpoint(csv_path, pcap_path)):
+        return convert_with_tshark_checkpointed(pcap_path, csv_path, resume, max_rows, flows)
+    remove_checkpoint(csv_path)
     min_ts = None
     append = False
     if resume and os.path.exists(csv_path):
@@ -156,9 +353,9 @@ def convert_with_tshark(pcap_path: str, csv_path: str, resume: bool, max_rows: O
             append = True
         else:
             print('Resume requested but no usable timestamp found. Starting fresh.')
-    cmd = build_tshark_cmd(pcap_path, min_ts, max_rows)
+    cmd = build_tshark_cmd(pcap_path, min_ts, max_rows, flows)
     print('Running:', ' '.join(cmd))
-    rows, errs = stream_tshark_to_csv(cmd, csv_path, append)
+    rows, errs = stream_tshark(cmd, csv_path, append, flows=flows)
     print('Conversion complete!')
     print(f'Total rows written this run: {rows}')
     print(f'Errors (lines skipped): {errs}')
@@ -166,16 +363,164 @@ def convert_with_tshark(pcap_path: str, csv_path: str, resume: bool, max_rows: O
     return rows > 0 or append  # consider success if we appended or wrote rows
 
 
+def convert_with_tshark_checkpointed(pcap_path: str, out_path: str, resume: bool,
+                                     max_rows: Optional[int], flows: bool = False) -> bool:
+    """Run tshark over consecutive record ranges of a classic pcap, checkpointing after each.
+    A resumed run pipes tshark only the bytes after the checkpoint instead of re-dissecting
+    the capture from the start.
+    """
+    ckpt = load_checkpoint(out_path, pcap_path) if resume else None
+    rows = errs = 0
+    with PcapReader(pcap_path) as reader:
+        if ckpt is not None:
+            reader.restore(ckpt['reader'])
+            total = ckpt['packets']
+            print(f'Resuming from checkpoint at byte {reader.position} ({total} rows already written)')
+            open_packet_writer(out_path, append=True, truncate_to=ckpt['output_offset'], flows=flows).close()
+        else:
+            total = 0
+            open_packet_writer(out_path, flows=flows).close()
+        save_checkpoint(out_path, pcap_path, reader.position, total,
+                        committed_output_offset(out_path), reader.state())
+        cmd = build_tshark_cmd('-', None, None, flows)
+        print('Running:', ' '.join(cmd), f'(in ranges of {CHECKPOINT_EVERY_PACKETS} packets)')
+        complete = False
+        while max_rows is None or rows < max_rows:
+            start = reader.position
+            n = CHECKPOINT_EVERY_PACKETS if max_rows is None else min(CHECKPOINT_EVERY_PACKETS, max_rows - rows)
+            # Only the record index is needed here; tshark does the decoding
+            batch = reader.read_batch(n)
+            if batch is None:
+                complete = True
+                break
+            seg_rows, seg_errs = stream_tshark(cmd, out_path, append=True,
+                                               feed=make_feed(pcap_path, start, reader.position), flows=flows)
+            rows += seg_rows
+            errs += seg_errs
+            total += seg_rows
+            save_checkpoint(out_path, pcap_path, reader.position, total,
+                            committed_output_offset(out_path), reader.state())
+        if complete:
+            save_checkpoint(out_path, pcap_path, reader.position, total,
+                            committed_output_offset(out_path), reader.state(), complete=True)
+    print('Conversion complete!')
+    print(f'Total rows written this run: {rows}')
+    print(f'Errors (lines skipped): {errs}')
+    print(f'Output saved to: {out_path}')
+    return rows > 0 or ckpt is not None
+
+
+def native_format(pcap_path: str) -> Optional[str]:
+    """'pcap' or 'pcapng' if the built-in reader can decode the file, else None."""
+    try:
+        with PcapReader(pcap_path) as reader:
+            return reader.format
+    except (OSError, ValueError):
+        return None
+
+
+def convert_native(pcap_path: str, out_path: str, resume: bool, max_rows: Optional[int],
+                   workers: int = 1, flows: bool = False) -> bool:
+    """Decode the capture with the memory-mapped reader (no tshark).
+
+    The length column is the on-the-wire length, like tshark's frame.len.
+    A checkpoint is saved after every CHECKPOINT_EVERY_PACKETS packets.
+    """
+    ckpt = load_checkpoint(out_path, pcap_path) if resume else None
+    min_ts = None
+    append = ckpt is not None
+    if resume and ckpt is None and os.path.exists(out_path):
+        min_ts = get_last_timestamp(out_path)
+        if min_ts is not None:
+            print(f'Resume enabled (no checkpoint). Skipping packets with ts <= {min_ts}')
+            append = True
+        else:
+            print('Resume requested but no usable timestamp found. Starting fresh.')
+
+    if workers > 1 and (resume or max_rows is not None):
+        print('Error: --workers cannot be combined with --resume or --max')
+        return False
+    if workers > 1 and native_format(pcap_path) == 'pcap':
+        remove_checkpoint(out_path)
+        print(f'Decoding with {workers} worker processes...')
+        rows, skipped, truncated, sketch = convert_pcap_parallel(pcap_path, out_path, workers, length_field='orig_len',
+                                                                 flows=flows)
+        errs = skipped + int(truncated)
+    else:
+        rows = 0
+        # The device sketch rides along in the checkpoint; after a timestamp-based
+        # resume it would only cover this run, so none is saved then.
+        sketch = None if min_ts is not None else DeviceSketch()
+        with PcapReader(pcap_path) as reader:
+            truncate_to = None
+            total = 0
+            if ckpt is not None:
+                reader.restore(ckpt['reader'])
+                truncate_to = ckpt['output_offset']
+                total = ckpt['packets']
+                sketch = DeviceSketch.from_state(ckpt['devices']) if ckpt.get('devices') else None
+                print(f'Resuming from checkpoint at byte {reader.position} ({total} rows already written)')
+            with open_packet_writer(out_path, append=append, truncate_to=truncate_to, flows=flows) as writer:
+                print(f'Decoding {reader.byte_order} {reader.format} natively...')
+                save_checkpoint(out_path, pcap_path, reader.position, total, writer.commit(), reader.state(),
+                                devices=sketch and sketch.state())
+                complete = False
+                while max_rows is None or rows < max_rows:
+                    n = CHECKPOINT_EVERY_PACKETS
+                    if max_rows is not None:
+                        n = min(n, max_rows - rows)
+                    batch = reader.read_batch(n)
+                    if batch is None:
+                        complete = True
+                        break
+                    if min_ts is not None:
+                        batch = batch_subset(batch, batch.ts > min_ts)
+                    h = network_headers(reader, batch)
+                    src, dst = h.src, h.dst
+                    flow = (h.proto, h.sport, h.dport) if flows else ()
+                    writer.append(batch.ts, batch.orig_len, src, dst, *flow, ip6=h.ip6)
+                    if sketch is not None:
+                        sketch.update(src, dst, batch.orig_len)
+                    rows += len(batch)
+                    total += len(batch)
+                    save_checkpoint(out_path, pcap_path, reader.position, total, writer.commit(), reader.state(),
+                                    devices=sketch and sketch.state())
+                if complete:
+                    save_checkpoint(out_path, pcap_path, reader.position, total, writer.commit(),
+                                    reader.state(), complete=True, devices=sketch and sketch.state())
+            errs = reader.skipped_records + int(reader.truncated)
+    print('Conversion complete!')
+    print(f'Total rows written this run: {rows}')
+    print(f'Errors (records skipped): {errs}')
+    print(f'Output saved to: {out_path}')
+    if sketch is not None:
+        print(f'Top devices saved to: {save_device_sketch(out_path, sketch)}')
+    elif os.path.exists(devices_path(out_path)):
+        os.remove(devices_path(out_path))
+    return rows > 0 or append
+
+
+def batch_subset(batch, index):
+    return type(batch)(*(col[index] for col in batch))
+
+
 def main():
-    parser = argparse.ArgumentParser(description='Convert PCAP/PCAPNG to CSV using tshark')
+    parser = argparse.ArgumentParser(description='Convert PCAP/PCAPNG to CSV (or a .pkts packet store)')
     parser.add_argument('pcap', nargs='?', default='data/raw/Thursday-WorkingHours.pcap')
-    parser.add_argument('out', nargs='?', default='data/thursday_traffic.csv')
+    parser.add_argument('out', nargs='?', default='data/thursday_traffic.csv',
+                        help='Output CSV, or a directory ending in .pkts for the columnar packet store')
     parser.add_argument('--max', type=int, default=None, help='Max rows to write in this run')
-    parser.add_argument('--resume', action='store_true', help='Resume from last timestamp in existing CSV')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume from the <out>.ckpt.json checkpoint (or the last timestamp in existing output)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Decode byte-range shards of a classic pcap in N processes')
+    parser.add_argument('--engine', choices=['auto', 'native', 'tshark'], default='auto',
+                        help='native: built-in pcap/pcapng reader; tshark: external dissector; '
+                             'auto: native when the file is readable (default)')
+    parser.add_argument('--flows', action='store_true',
+                        help='Also write proto,sport,dport columns (for packets_to_windows --flows)')
     args = parser.parse_args()
 
-    ensure_tshark_available()
-
     pcap_file = args.pcap
     csv_file = args.out
 
@@ -183,7 +528,16 @@ def main():
         print(f'Error: PCAP file not found: {pcap_file}')
         sys.exit(1)
 
-    ok = convert_with_tshark(pcap_file, csv_file, resume=args.resume, max_rows=args.max)
+    engine = args.engine
+    if engine == 'auto':
+        engine = 'native' if native_format(pcap_file) else 'tshark'
+    if engine == 'native':
+        ok = convert_native(pcap_file, csv_file, resume=args.resume, max_rows=args.max,
+                            workers=max(1, args.workers), flows=args.flows)
+    else:
+        ensure_tshark_available()
+        ok = convert_with_tshark(pcap_file, csv_file, resume=args.resume, max_rows=args.max,
+                                 workers=max(1, args.workers), flows=args.flows)
     sys.exit(0 if ok else 2)
 
 
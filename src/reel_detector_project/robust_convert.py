@@ -1,127 +1,89 @@
 #!/usr/bin/env python3
 """
 Robust PCAP to CSV converter for Thursday traffic data
+- Optional --workers N decodes byte-range shards in parallel (output identical to serial)
+- Ranks the busiest internal devices while converting (saved as <out>.devices.json)
+- Optional --flows also writes proto,sport,dport (TCP/UDP ports, 0 otherwise) for flow features
 """
-import csv
-import struct
+import argparse
 import sys
 from pathlib import Path
 
-def robust_pcap_to_csv(pcap_path, csv_path):
+sys.path.append(str(Path('notebooks').resolve()))
+from pcap_reader import DEFAULT_BATCH_SIZE, PcapReader, network_headers  # type: ignore
+from packet_store import open_packet_writer  # type: ignore
+from heavy_hitters import DeviceSketch, save_device_sketch  # type: ignore
+from pcap_shards import convert_pcap_parallel  # type: ignore
+
+def robust_pcap_to_csv(pcap_path, csv_path, batch_size=DEFAULT_BATCH_SIZE, workers=1, flows=False):
     """Convert PCAP to CSV with better error handling"""
     print(f"Converting {pcap_path} to {csv_path}...")
     
-    with open(csv_path, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['ts', 'length', 'src', 'dst'])
+    try:
+        reader = PcapReader(pcap_path)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    
+    if workers > 1 and reader.format != 'pcap':
+        print("Parallel mode needs a classic pcap; decoding serially")
+        workers = 1
+    if workers > 1:
+        reader.close()
+        print(f"Decoding with {workers} worker processes...")
+        packet_count, skipped, truncated, sketch = convert_pcap_parallel(
+            pcap_path, csv_path, workers, batch_size=batch_size, flows=flows)
+        if skipped:
+            print(f"Warning: Skipped {skipped} record headers with invalid packet length")
+        if truncated:
+            print(f"Warning: Could not read full packet data for packet {packet_count}")
+        report(csv_path, packet_count, skipped + int(truncated), sketch)
+        return
+    
+    with reader, open_packet_writer(csv_path, flows=flows) as writer:
+        print(f"Detected {reader.byte_order} {reader.format.upper()} format")
         
-        # Read PCAP file in binary mode
-        with open(pcap_path, 'rb') as pcapfile:
-            # Read PCAP global header (24 bytes)
-            global_header = pcapfile.read(24)
-            if len(global_header) < 24:
-                print("Error: Invalid PCAP file - too short")
-                return
-            
-            # Check magic number and determine endianness
-            magic = struct.unpack('I', global_header[:4])[0]
-            if magic == 0xa1b2c3d4:
-                endian = '>'
-                print("Detected big-endian PCAP format")
-            elif magic == 0xd4c3b2a1:
-                endian = '<'
-                print("Detected little-endian PCAP format")
-            else:
-                print(f"Warning: Unexpected magic number: {hex(magic)}")
-                endian = '<'  # Default to little-endian
-            
-            packet_count = 0
-            error_count = 0
-            
-            while True:
-                try:
-                    # Read packet header (16 bytes)
-                    header = pcapfile.read(16)
-                    if len(header) < 16:
-                        break
-                    
-                    # Parse packet header with correct endianness
-                    ts_sec, ts_usec, incl_len, orig_len = struct.unpack(f'{endian}IIII', header)
-                    timestamp = ts_sec + ts_usec / 1000000.0
-                    
-                    # Validate packet length
-                    if incl_len > 65535 or incl_len == 0:
-                        print(f"Warning: Invalid packet length {incl_len} at packet {packet_count}")
-                        error_count += 1
-                        # Skip this packet and try to find next valid header
-                        continue
-                    
-                    # Read packet data
-                    packet_data = pcapfile.read(incl_len)
-                    if len(packet_data) < incl_len:
-                        print(f"Warning: Could not read full packet data for packet {packet_count}")
-                        break
-                    
-                    # Extract IP addresses with better parsing
-                    src_ip, dst_ip = extract_ip_addresses(packet_data)
-                    
-                    writer.writerow([timestamp, incl_len, src_ip, dst_ip])
-                    packet_count += 1
-                    
-                    if packet_count % 10000 == 0:
-                        print(f"Processed {packet_count} packets...")
-                        
-                except Exception as e:
-                    print(f"Error processing packet {packet_count}: {e}")
-                    error_count += 1
-                    # Try to recover by reading ahead
-                    pcapfile.read(1)
-                    continue
+        packet_count = 0
+        sketch = DeviceSketch()
+        for batch in reader.iter_batches(batch_size):
+            h = network_headers(reader, batch)
+            src, dst = h.src, h.dst
+            flow = (h.proto, h.sport, h.dport) if flows else ()
+            writer.append(batch.ts, batch.incl_len, src, dst, *flow, ip6=h.ip6)
+            sketch.update(src, dst, batch.incl_len)
+            packet_count += len(batch)
+            print(f"Processed {packet_count} packets...")
+        
+        if reader.skipped_records:
+            print(f"Warning: Skipped {reader.skipped_records} record headers with invalid packet length")
+        if reader.truncated:
+            print(f"Warning: Could not read full packet data for packet {packet_count}")
+        error_count = reader.skipped_records + int(reader.truncated)
     
+    report(csv_path, packet_count, error_count, sketch)
+
+def report(csv_path, packet_count, error_count, sketch):
     print(f"Conversion complete!")
     print(f"Total packets processed: {packet_count}")
     print(f"Errors encountered: {error_count}")
     print(f"Output saved to: {csv_path}")
-
-def extract_ip_addresses(packet_data):
-    """Extract IP addresses from packet data with better parsing"""
-    src_ip = "0.0.0.0"
-    dst_ip = "0.0.0.0"
-    
-    try:
-        # Minimum size for Ethernet + IP headers
-        if len(packet_data) < 34:
-            return src_ip, dst_ip
-        
-        # Skip Ethernet header (14 bytes) and check IP version
-        ip_start = 14
-        if ip_start + 20 > len(packet_data):
-            return src_ip, dst_ip
-        
-        # Check if it's IPv4
-        version_ihl = packet_data[ip_start]
-        version = (version_ihl >> 4) & 0x0F
-        
-        if version == 4:
-            # Extract IP addresses (offset 12 and 16 from IP header start)
-            src_bytes = packet_data[ip_start + 12:ip_start + 16]
-            dst_bytes = packet_data[ip_start + 16:ip_start + 20]
-            
-            if len(src_bytes) == 4 and len(dst_bytes) == 4:
-                src_ip = '.'.join(str(b) for b in src_bytes)
-                dst_ip = '.'.join(str(b) for b in dst_bytes)
-                
-    except Exception:
-        pass  # Return default values if parsing fails
-    
-    return src_ip, dst_ip
+    print(f"Top devices saved to: {save_device_sketch(csv_path, sketch)}")
+    for d in sketch.ranked(5):
+        print(f"  {d.ip:15s} down={d.bytes_down:.0f} B  up={d.bytes_up:.0f} B")
 
 if __name__ == '__main__':
-    pcap_file = "data/raw/Thursday-WorkingHours.pcap"
-    csv_file = "data/thursday_traffic.csv"
+    parser = argparse.ArgumentParser(description='Convert PCAP to CSV (or a .pkts packet store)')
+    parser.add_argument('pcap', nargs='?', default='data/raw/Thursday-WorkingHours.pcap')
+    parser.add_argument('out', nargs='?', default='data/thursday_traffic.csv')
+    parser.add_argument('--workers', type=int, default=1, help='Decode byte-range shards in N processes')
+    parser.add_argument('--flows', action='store_true', help='Also write proto,sport,dport columns')
+    args = parser.parse_args()
+    
+    pcap_file = args.pcap
+    csv_file = args.out
     
     if not Path(pcap_file).exists():
         print(f"Error: PCAP file not found: {pcap_file}")
         sys.exit(1)
     
-    robust_pcap_to_csv(pcap_file, csv_file)
+    robust_pcap_to_csv(pcap_file, csv_file, workers=max(1, args.workers), flows=args.flows)
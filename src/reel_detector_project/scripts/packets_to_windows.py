@@ -1,64 +1,351 @@
 #!/usr/bin/env python3
 """
 Convert packet CSV (ts,length,src,dst) into windowed features CSV.
+- Also accepts a .pkts columnar packet store, which is memory-mapped instead of parsed
 - Prefilters to rows involving the target device IP for speed
-- Auto-detects device IP using a capped sample if not provided
-- Uses notebooks/windows.py compute_sliding_windows
+- Auto-detects device IP if not provided: heavy-hitter sketch over the whole input
+  (or the <input>.devices.json sketch the converters save), top-K devices printed
+- Uses notebooks/windows.py compute_sliding_windows (single-pass engine; --check-parity
+  compares it against the reference per-window loop and the online RollingFeatureState)
+- --max-memory streams the input in chunks sized to the budget and appends finished
+  windows to the output as it goes (input must be in capture/time order)
+- --resolutions 1,2.5,5:2.5,10,30 bins the packets once and derives every (win, step) pair
+- --all-devices computes every internal (private-range) host's windows from one read,
+  written as a long table keyed by (device, wstart)
+- --cache-dir (or $REEL_FEATURE_CACHE) keeps outputs in a content-addressed LRU cache keyed
+  by input fingerprint, device, win, step and feature-schema version; repeat runs copy the
+  cached file instead of recomputing (safe to share between jobs)
+- --device-ip must be an IPv4 address (IPv6 / unparsable values are rejected up front)
+- Addresses stay uint32 from load to windowing; "internal host" (autodetect, --all-devices)
+  is a CIDR test against --private-prefixes / $REEL_PRIVATE_PREFIXES (default RFC 1918)
+- --flows adds per-window flow aggregates (active_flows, top_flow_share) from a 5-tuple flow
+  table with idle/active timeouts; needs proto,sport,dport in the input (converters' --flows)
 
 Usage:
   python scripts/packets_to_windows.py --in data/thursday_traffic.csv --out data/windows_from_thursday.csv --device-ip 192.168.10.50 --win 10 --step 10
-  python scripts/packets_to_windows.py --in data/thursday_traffic.csv --out data/windows_from_thursday.csv   # auto-detect device from sample
+  python scripts/packets_to_windows.py --in data/thursday_traffic.csv --out data/windows_from_thursday.csv   # auto-detect device
+  python scripts/packets_to_windows.py --in data/thursday_traffic.csv --out data/windows_from_thursday.csv --max-memory 512M
+  python scripts/packets_to_windows.py --in data/thursday_traffic.csv --out data/windows_all.csv --all-devices --workers 8
 """
 import argparse
+import ipaddress
 import os
 import sys
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 # Import windowing util
 sys.path.append(str(Path('notebooks').resolve()))
-from windows import compute_sliding_windows  # type: ignore
+from windows import (FEATURE_COLUMNS, AllDevicesStreamingWindower, StreamingWindower,  # type: ignore
+                     check_window_parity, compute_all_device_windows, compute_sliding_windows,
+                     device_key, ipv4_column, window_starts)
+from packet_store import is_packet_store, open_packet_store  # type: ignore
+from pcap_reader import ipv4_to_int, private_prefixes, set_private_prefixes  # type: ignore
+from heavy_hitters import DEFAULT_TOP_K, DeviceSketch, load_device_sketch  # type: ignore
+from rolling_features import check_rolling_parity  # type: ignore
+from window_bins import FeatureBins  # type: ignore
+from feature_cache import FeatureCache, input_fingerprint  # type: ignore
+from flow_table import (DEFAULT_ACTIVE_TIMEOUT, DEFAULT_IDLE_TIMEOUT, FlowTable,  # type: ignore
+                        flow_window_features)
 
-PRIVATE_PREFIXES = (
-    '10.',
-    '172.16.', '172.17.', '172.18.', '172.19.', '172.20.', '172.21.', '172.22.', '172.23.', '172.24.', '172.25.', '172.26.', '172.27.', '172.28.', '172.29.', '172.30.', '172.31.',
-    '192.168.'
-)
+AUTODETECT_CHUNK_ROWS = 1_000_000
+PACKET_COLUMNS = ['ts','length','src','dst']
+FLOW_COLUMNS = ['proto', 'sport', 'dport']
 
-SAMPLE_ROWS_FOR_AUTODETECT = 250_000
+# Rough peak bytes per input row while a chunk is parsed and filtered
+# (CSV: float/int columns plus two Python strings; store: memmap slices, mask and copies)
+CSV_ROW_BYTES = 400
+STORE_ROW_BYTES = 64
+MIN_CHUNK_ROWS = 10_000
 
+CACHE_ENV = 'REEL_FEATURE_CACHE'
+DEFAULT_CACHE_SIZE = '5G'
 
-def is_private(ip: str) -> bool:
-    return isinstance(ip, str) and any(ip.startswith(p) for p in PRIVATE_PREFIXES)
 
+def autodetect_device_ip(csv_path: str, chunk_rows: int = AUTODETECT_CHUNK_ROWS, top_k: int = DEFAULT_TOP_K) -> str:
+    """Busiest private host over the whole input, from heavy-hitter sketches of dst/src bytes.
 
-def autodetect_device_ip_from_sample(csv_path: str) -> str:
-    print(f'[autodetect] Sampling first {SAMPLE_ROWS_FOR_AUTODETECT} rows to detect device IP...')
-    sample = pd.read_csv(csv_path, nrows=SAMPLE_ROWS_FOR_AUTODETECT)
-    if not {'ts','length','src','dst'}.issubset(sample.columns):
-        raise ValueError('Input must contain columns: ts,length,src,dst')
-    recv = sample.groupby('dst')['length'].sum().sort_values(ascending=False)
-    for ip, _ in recv.items():
-        if is_private(ip):
-            print(f'[autodetect] Chosen by dst bytes: {ip}')
-            return ip
-    send = sample.groupby('src')['length'].sum().sort_values(ascending=False)
-    for ip, _ in send.items():
-        if is_private(ip):
-            print(f'[autodetect] Chosen by src bytes: {ip}')
-            return ip
-    fallback = str(recv.index[0]) if len(recv) else '0.0.0.0'
-    print(f'[autodetect] Fallback: {fallback}')
-    return fallback
+    Uses the <input>.devices.json sketch left by the converters when it is newer
+    than the input; otherwise streams the input once in chunks of chunk_rows.
+    """
+    sketch = load_device_sketch(csv_path)
+    if sketch is not None:
+        print(f'[autodetect] Using device sketch saved by the converter ({sketch.packets} packets)')
+    else:
+        print(f'[autodetect] Scanning whole input for heavy-hitter devices ({chunk_rows} rows per chunk)...')
+        sketch = DeviceSketch()
+        for chunk in iter_packet_chunks(csv_path, chunk_rows):
+            sketch.update(ipv4_column(chunk['src']), ipv4_column(chunk['dst']), chunk['length'].to_numpy())
+    ranked = sketch.ranked(top_k)
+    for rank, d in enumerate(ranked, 1):
+        print(f'[autodetect] {rank:2d}. {d.ip:15s} down~{d.bytes_down:.0f} B (+-{d.error_down:.0f})  '
+              f'up~{d.bytes_up:.0f} B (+-{d.error_up:.0f})')
+    device_ip = sketch.choose_device(top_k)
+    if ranked:
+        print(f'[autodetect] Chosen: {device_ip}')
+    else:
+        print(f'[autodetect] No private hosts; fallback: {device_ip}')
+    return device_ip
+
+
+def check_device_ip(device_ip: str) -> str:
+    """device_ip as a dotted quad; exits on anything the uint32 IPv4 keys cannot match.
+
+    Unparsable addresses map to 0, the same key as non-IPv4 rows, so they would
+    select every IPv6 / non-IP packet instead of the device.
+    """
+    try:
+        ip = ipaddress.ip_address(device_ip.strip())
+    except ValueError:
+        print(f'Invalid --device-ip: {device_ip!r}')
+        sys.exit(1)
+    if ip.version != 4:
+        print(f'--device-ip {ip} is IPv6; windows are computed for IPv4 devices only')
+        sys.exit(1)
+    if ip.is_unspecified:
+        print('--device-ip 0.0.0.0 is the key of non-IPv4 rows, not a device')
+        sys.exit(1)
+    return str(ip)
+
+
+def open_cache(args):
+    """FeatureCache from --cache-dir / $REEL_FEATURE_CACHE (None when caching is off); sets args.fingerprint."""
+    args.fingerprint = None
+    root = None if args.no_cache else (args.cache_dir or os.environ.get(CACHE_ENV))
+    if not root:
+        return None
+    cache = FeatureCache(root, parse_size(args.cache_max_size))
+    args.fingerprint = input_fingerprint(args.inp)
+    print(f'[cache] {root} (input fingerprint {args.fingerprint[:12]})')
+    return cache
+
+
+def cache_key(args, device, win, step):
+    if args.cache is None:
+        return None
+    extra = {'flows': [args.flow_idle_timeout, args.flow_active_timeout]} if args.flows else {}
+    return args.cache.key(input=args.fingerprint, device=device, win=float(win), step=float(step), **extra)
+
+
+def restore_cached(args, key, outp: str) -> bool:
+    """Copy a cached output to outp; False on a miss or with caching off."""
+    if key is None:
+        return False
+    Path(os.path.dirname(outp) or '.').mkdir(parents=True, exist_ok=True)
+    if not args.cache.get(key, outp):
+        return False
+    print(f'[cache] hit {key[:12]} -> {outp}')
+    return True
+
+
+def store_cached(args, key, outp: str):
+    if key is not None:
+        args.cache.put(key, outp)
+        print(f'[cache] stored {key[:12]}')
+
+
+def parse_size(text: str) -> int:
+    """'512M', '2G', '750k' or plain bytes -> bytes."""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def iter_packet_chunks(inp: str, chunk_rows: int):
+    """Yield ts,length,src,dst DataFrames of at most chunk_rows rows (uint32 src/dst)."""
+    if is_packet_store(inp):
+        store = open_packet_store(inp)
+        for start in range(0, len(store), chunk_rows):
+            yield store.to_frame(PACKET_COLUMNS, start, start + chunk_rows)
+    else:
+        for chunk in pd.read_csv(inp, usecols=PACKET_COLUMNS, chunksize=chunk_rows):
+            yield chunk.assign(src=ipv4_column(chunk['src']), dst=ipv4_column(chunk['dst']))
+
+
+def stream_windows(inp: str, outp: str, windower, columns, max_memory: int) -> int:
+    """Chunked windowing with bounded memory; windows are appended to outp as they close.
+
+    windower is a StreamingWindower (one device) or AllDevicesStreamingWindower.
+    """
+    row_bytes = STORE_ROW_BYTES if is_packet_store(inp) else CSV_ROW_BYTES
+    chunk_rows = max(MIN_CHUNK_ROWS, max_memory // row_bytes)
+    print(f'[stream] Reading {chunk_rows} rows per chunk (budget {max_memory} bytes)...')
+    Path(os.path.dirname(outp) or '.').mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(outp, 'w', newline='') as f:
+        f.write(','.join(columns) + '\n')
+        for i, chunk in enumerate(iter_packet_chunks(inp, chunk_rows)):
+            out = windower.push(chunk)
+            if not out.empty:
+                out.to_csv(f, header=False, index=False)
+                written += len(out)
+            print(f'[stream] chunk {i}: {windower.rows} device rows, {written} windows written')
+        out = windower.finish()
+        if not out.empty:
+            out.to_csv(f, header=False, index=False)
+            written += len(out)
+    return written
+
+
+def run_all_devices(args):
+    """--all-devices: one read of the input, long-format output for every internal host."""
+    columns = ['device', 'wstart'] + FEATURE_COLUMNS
+    key = cache_key(args, f'*all-devices* {private_prefixes()}', args.win, args.step)
+    if restore_cached(args, key, args.out):
+        return
+    if args.max_memory:
+        windower = AllDevicesStreamingWindower(window_size=args.win, step=args.step)
+        written = stream_windows(args.inp, args.out, windower, columns, parse_size(args.max_memory))
+        store_cached(args, key, args.out)
+        print(f'Saved {written} windows for {len(windower.windowers)} devices to {args.out}')
+        return
+
+    if is_packet_store(args.inp):
+        print('[load] Opening packet store...')
+        df = open_packet_store(args.inp).to_frame(PACKET_COLUMNS)
+    else:
+        print('[load] Reading full CSV with required columns...')
+        df = pd.read_csv(args.inp, usecols=PACKET_COLUMNS)
+
+    print(f'[window] Computing windows for all internal devices (win={args.win}, step={args.step}, '
+          f'workers={args.workers}) on {len(df)} rows...')
+    windows_df = compute_all_device_windows(df, window_size=args.win, step=args.step, workers=args.workers)
+    if windows_df.empty:
+        print('No windows produced (no internal devices found).')
+        sys.exit(3)
+
+    Path(os.path.dirname(args.out) or '.').mkdir(parents=True, exist_ok=True)
+    windows_df.to_csv(args.out, index=False, columns=columns)
+    store_cached(args, key, args.out)
+    print(f'Saved {len(windows_df)} windows for {windows_df["device"].nunique()} devices to {args.out}')
+
+
+def parse_resolutions(text: str):
+    """'1,2.5:1,5:2.5' -> [(1.0, 1.0), (2.5, 1.0), (5.0, 2.5)]; a bare WIN means step = WIN."""
+    pairs = []
+    for item in text.split(','):
+        win, _, step = item.strip().partition(':')
+        pairs.append((float(win), float(step or win)))
+    return pairs
+
+
+def resolution_path(outp: str, win: float, step: float) -> str:
+    p = Path(outp)
+    return str(p.with_name(f'{p.stem}_w{win:g}_s{step:g}{p.suffix or ".csv"}'))
+
+
+def run_resolutions(args, device_ip: str):
+    """--resolutions: bin the device's packets once, then write one windows CSV per (win, step)."""
+    resolutions = parse_resolutions(args.resolutions)
+    # Each pair is cached under the same key as a single --win/--step run
+    keys = [cache_key(args, device_ip, win, step) for win, step in resolutions]
+    if all(restore_cached(args, key, resolution_path(args.out, win, step))
+           for key, (win, step) in zip(keys, resolutions)):
+        return
+    print(f'[bins] {len(resolutions)} resolutions from one pass, bins cut at their window boundaries')
+    bins = FeatureBins(device_ip, resolutions)
+    if args.max_memory:
+        row_bytes = STORE_ROW_BYTES if is_packet_store(args.inp) else CSV_ROW_BYTES
+        chunk_rows = max(MIN_CHUNK_ROWS, parse_size(args.max_memory) // row_bytes)
+        for chunk in iter_packet_chunks(args.inp, chunk_rows):
+            key = device_key(chunk, device_ip)
+            bins.add_frame(chunk[(chunk['src'] == key) | (chunk['dst'] == key)])
+    else:
+        dff = load_device_rows(args.inp, device_ip)
+        bins.add_frame(dff.sort_values('ts', kind='stable'))
+    if bins.t0 is None:
+        print('No rows found involving device. Exiting.')
+        sys.exit(2)
+    Path(os.path.dirname(args.out) or '.').mkdir(parents=True, exist_ok=True)
+    for key, (win, step) in zip(keys, resolutions):
+        windows_df = bins.windows(win, step)
+        path = resolution_path(args.out, win, step)
+        windows_df.to_csv(path, index=False)
+        store_cached(args, key, path)
+        print(f'Saved {len(windows_df)} windows (win={win:g}, step={step:g}) to {path}')
+
+
+def load_device_rows(inp: str, device_ip: str, columns=PACKET_COLUMNS) -> pd.DataFrame:
+    """All rows where src or dst is the device (store: mask on the memmaps; CSV: full read)."""
+    if is_packet_store(inp):
+        # Memory-mapped columns: the mask is computed on the maps and only matching rows are copied
+        print('[load] Opening packet store...')
+        store = open_packet_store(inp)
+        missing = [c for c in columns if c not in store.columns]
+        if missing:
+            raise ValueError(f'{inp} has no {",".join(missing)} columns')
+        print('[filter] Prefiltering to rows where src==device or dst==device...')
+        key = ipv4_to_int(device_ip)
+        mask = (store.src == key) | (store.dst == key)
+        return pd.DataFrame({c: store.column(c)[mask] for c in columns})
+    # Load full CSV but only required columns to save RAM
+    print('[load] Reading full CSV with required columns...')
+    df = pd.read_csv(inp, usecols=columns)
+    # Each distinct dotted string is parsed once; from here on addresses are uint32
+    df['src'] = ipv4_column(df['src'])
+    df['dst'] = ipv4_column(df['dst'])
+
+    # Prefilter rows involving the device to speed up windowing dramatically
+    print('[filter] Prefiltering to rows where src==device or dst==device...')
+    key = ipv4_to_int(device_ip)
+    mask = (df['src'] == key) | (df['dst'] == key)
+    return df.loc[mask].copy()
+
+
+def add_flow_features(dff: pd.DataFrame, windows_df: pd.DataFrame, args) -> pd.DataFrame:
+    """Append active_flows / top_flow_share; dff is the device's rows sorted by ts."""
+    table = FlowTable(args.flow_idle_timeout, args.flow_active_timeout)
+    ts = dff['ts'].to_numpy(dtype=np.float64)
+    length = dff['length'].to_numpy(dtype=np.int64)
+    src, dst = ipv4_column(dff['src']), ipv4_column(dff['dst'])
+    flow_id = table.update(ts, length, src, dst, dff['proto'].to_numpy(), dff['sport'].to_numpy(),
+                           dff['dport'].to_numpy())
+    table.finish()
+    print(f'[flows] {table.next_id} flows (idle timeout {args.flow_idle_timeout:g} s, '
+          f'active timeout {args.flow_active_timeout:g} s)')
+    flows = flow_window_features(ts, length, flow_id, window_starts(ts[0], ts[-1], args.step), args.win)
+    return pd.concat([windows_df, flows], axis=1)
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument('--in', dest='inp', required=True, help='Input packet CSV path')
+    ap.add_argument('--in', dest='inp', required=True, help='Input packet CSV path or .pkts packet store')
     ap.add_argument('--out', dest='out', required=True, help='Output windows CSV path')
     ap.add_argument('--device-ip', dest='device_ip', default=None, help='Device IP to compute features for')
     ap.add_argument('--win', dest='win', type=float, default=10.0, help='Window size seconds (default 10)')
     ap.add_argument('--step', dest='step', type=float, default=10.0, help='Step seconds (default 10)')
+    ap.add_argument('--check-parity', dest='check_parity', action='store_true',
+                    help='Also run the reference per-window loop and compare results (slow)')
+    ap.add_argument('--max-memory', dest='max_memory', default=None,
+                    help='Stream the input in chunks within this budget, e.g. 512M or 2G (needs time-ordered input)')
+    ap.add_argument('--resolutions', default=None,
+                    help='Several WIN[:STEP] pairs from one pass, e.g. 1,2.5,5:2.5,10,30:10 '
+                         '(one output per pair, named <out>_w<WIN>_s<STEP>.csv)')
+    ap.add_argument('--top-k', dest='top_k', type=int, default=DEFAULT_TOP_K,
+                    help=f'Devices to list when auto-detecting (default {DEFAULT_TOP_K})')
+    ap.add_argument('--all-devices', dest='all_devices', action='store_true',
+                    help='Windows for every internal (private-range) host in one pass; output keyed by device,wstart')
+    ap.add_argument('--workers', dest='workers', type=int, default=1,
+                    help='Processes for per-device windowing with --all-devices (default 1)')
+    ap.add_argument('--cache-dir', dest='cache_dir', default=None,
+                    help=f'Feature cache directory, may be shared between jobs (default ${CACHE_ENV}; unset = no cache)')
+    ap.add_argument('--cache-max-size', dest='cache_max_size', default=DEFAULT_CACHE_SIZE,
+                    help=f'Evict least recently used cache entries beyond this size (default {DEFAULT_CACHE_SIZE})')
+    ap.add_argument('--no-cache', dest='no_cache', action='store_true',
+                    help='Ignore --cache-dir / $REEL_FEATURE_CACHE and always recompute')
+    ap.add_argument('--private-prefixes', dest='private_prefixes', default=None,
+                    help='Comma-separated CIDRs of internal hosts for autodetect / --all-devices '
+                         '(default $REEL_PRIVATE_PREFIXES or the RFC 1918 ranges)')
+    ap.add_argument('--flows', action='store_true',
+                    help='Add active_flows and top_flow_share per window (input needs proto,sport,dport)')
+    ap.add_argument('--flow-idle-timeout', dest='flow_idle_timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                    help=f'Seconds without packets that end a flow (default {DEFAULT_IDLE_TIMEOUT:g})')
+    ap.add_argument('--flow-active-timeout', dest='flow_active_timeout', type=float,
+                    default=DEFAULT_ACTIVE_TIMEOUT,
+                    help=f'Seconds after which a long flow is split (default {DEFAULT_ACTIVE_TIMEOUT:g})')
     args = ap.parse_args()
 
     inp = args.inp
@@ -68,20 +355,68 @@ def main():
         print(f'Input not found: {inp}')
         sys.exit(1)
 
+    if args.flows and (args.all_devices or args.resolutions or args.max_memory):
+        print('--flows is only supported for in-memory single-device runs '
+              '(not with --all-devices, --resolutions or --max-memory)')
+        sys.exit(1)
+
+    if args.device_ip:
+        args.device_ip = check_device_ip(args.device_ip)
+    if args.private_prefixes:
+        set_private_prefixes(args.private_prefixes)
+    args.cache = open_cache(args)
+
+    if args.all_devices:
+        run_all_devices(args)
+        return
+
     # Detect or use provided device IP
-    device_ip = args.device_ip or autodetect_device_ip_from_sample(inp)
+    if args.device_ip:
+        device_ip = args.device_ip
+    else:
+        chunk_rows = AUTODETECT_CHUNK_ROWS
+        if args.max_memory:
+            row_bytes = STORE_ROW_BYTES if is_packet_store(inp) else CSV_ROW_BYTES
+            chunk_rows = max(MIN_CHUNK_ROWS, parse_size(args.max_memory) // row_bytes)
+        detect_key = (args.cache.key(input=args.fingerprint, autodetect=args.top_k, prefixes=str(private_prefixes()))
+                      if args.cache else None)
+        cached = args.cache.get_value(detect_key) if detect_key else None
+        if cached:
+            device_ip = cached
+            print('[cache] Auto-detected device from an earlier run')
+        else:
+            device_ip = autodetect_device_ip(inp, chunk_rows, args.top_k)
+            if detect_key:
+                args.cache.put_value(detect_key, device_ip)
     print(f'Using device IP: {device_ip}')
 
-    # Load full CSV but only required columns to save RAM
-    usecols = ['ts','length','src','dst']
-    print('[load] Reading full CSV with required columns...')
-    df = pd.read_csv(inp, usecols=usecols)
+    if args.resolutions:
+        run_resolutions(args, device_ip)
+        return
 
-    # Prefilter rows involving the device to speed up windowing dramatically
-    print('[filter] Prefiltering to rows where src==device or dst==device...')
-    mask = (df['src'] == device_ip) | (df['dst'] == device_ip)
-    dff = df.loc[mask].copy()
-    del df
+    # --check-parity has to recompute; its output still goes into the cache
+    key = cache_key(args, device_ip, args.win, args.step)
+    if not args.check_parity and restore_cached(args, key, outp):
+        return
+
+    if args.max_memory:
+        if args.check_parity:
+            print('[parity] --check-parity needs the whole input in memory; skipped in streaming mode')
+        windower = StreamingWindower(device_ip, window_size=args.win, step=args.step)
+        written = stream_windows(inp, outp, windower, ['wstart'] + FEATURE_COLUMNS,
+                                 parse_size(args.max_memory))
+        if written == 0:
+            print('No windows produced (no rows involving device).')
+            sys.exit(3)
+        store_cached(args, key, outp)
+        print(f'Saved {written} windows to {outp}')
+        return
+
+    try:
+        dff = load_device_rows(inp, device_ip, PACKET_COLUMNS + FLOW_COLUMNS if args.flows else PACKET_COLUMNS)
+    except ValueError as e:
+        print(f'{e}; --flows needs an input converted with --flows')
+        sys.exit(1)
 
     if dff.empty:
         print('No rows found involving device. Exiting.')
@@ -95,8 +430,25 @@ def main():
         print('No windows produced (empty dataframe).')
         sys.exit(3)
 
+    if args.check_parity:
+        print('[parity] Comparing against reference implementation...')
+        mismatched = check_window_parity(dff, device_ip, window_size=args.win, step=args.step)
+        if mismatched:
+            print(f'[parity] MISMATCH in columns: {mismatched}')
+            sys.exit(4)
+        print('[parity] Comparing against the online RollingFeatureState...')
+        mismatched = check_rolling_parity(dff, device_ip, window_size=args.win, step=args.step)
+        if mismatched:
+            print(f'[parity] MISMATCH (rolling) in columns: {mismatched}')
+            sys.exit(4)
+        print('[parity] OK')
+
+    if args.flows:
+        windows_df = add_flow_features(dff, windows_df, args)
+
     Path(os.path.dirname(outp) or '.').mkdir(parents=True, exist_ok=True)
     windows_df.to_csv(outp, index=False)
+    store_cached(args, key, outp)
     print(f'Saved {len(windows_df)} windows to {outp}')
     print('Columns:', list(windows_df.columns))
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Replay a capture through the online window + classifier pipeline and report throughput/latency.
+- Input: pcap/pcapng, .pkts packet store or packet CSV (ts,length,src,dst)
+- Speed: original timing (--speed 1), N x real time (--speed N) or as fast as possible (--speed max)
+- Classifier: joblib model (.pkl), TFLite model (.tflite + scaler.json) or the simple_eval rules (default)
+- Reports packets/s and p50/p95/p99 latency from window close to prediction
+
+Usage:
+  python scripts/replay_pcap.py --in data/raw/Thursday-WorkingHours.pcap --device-ip 192.168.10.50 --speed 10
+  python scripts/replay_pcap.py --in data/thursday_traffic.pkts --speed max --model models/model_quant.tflite --scaler models/scaler.json
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(str(Path('notebooks').resolve()))
+from replay import ReplayPipeline, iter_packet_batches, load_classifier, replay  # type: ignore
+from heavy_hitters import DeviceSketch, load_device_sketch  # type: ignore
+
+
+def detect_device(inp: str, l3_offset: Optional[int]) -> str:
+    sketch = load_device_sketch(inp)
+    if sketch is None:
+        print('[autodetect] Scanning input for the busiest internal device...')
+        sketch = DeviceSketch()
+        for _ts, length, src, dst in iter_packet_batches(inp, l3_offset):
+            sketch.update(src, dst, length)
+    device_ip = sketch.choose_device()
+    print(f'[autodetect] Chosen: {device_ip}')
+    return device_ip
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--in', dest='inp', required=True, help='pcap/pcapng, .pkts store or packet CSV')
+    ap.add_argument('--device-ip', dest='device_ip', default=None, help='Device IP (default: busiest internal host)')
+    ap.add_argument('--speed', default='1', help="Replay speed multiplier, or 'max' (default 1 = original timing)")
+    ap.add_argument('--win', type=float, default=10.0, help='Window size seconds (default 10)')
+    ap.add_argument('--step', type=float, default=10.0, help='Step seconds (default 10)')
+    ap.add_argument('--model', default=None, help='Classifier: .pkl/.joblib or .tflite (default: rule-based)')
+    ap.add_argument('--scaler', default=None, help='scaler.json for a .tflite model (default models/scaler.json)')
+    ap.add_argument('--l3-offset', dest='l3_offset', type=int, default=None,
+                    help='Bytes before the IP header in pcap input (default: from the capture linktype)')
+    ap.add_argument('--out', default=None, help='Optional CSV of windows with predictions')
+    args = ap.parse_args()
+
+    if not os.path.exists(args.inp):
+        print(f'Input not found: {args.inp}')
+        sys.exit(1)
+    speed = None if args.speed == 'max' else float(args.speed)
+    if speed is not None and speed <= 0:
+        print('--speed must be positive or max')
+        sys.exit(1)
+
+    device_ip = args.device_ip or detect_device(args.inp, args.l3_offset)
+    classifier = load_classifier(args.model, args.scaler)
+    pipeline = ReplayPipeline(device_ip, classifier, window_size=args.win, step=args.step)
+    print(f'[replay] {args.inp} at {"max speed" if speed is None else f"{speed:g}x"}, '
+          f'device {device_ip}, classifier {classifier.name}')
+
+    report = replay(iter_packet_batches(args.inp, args.l3_offset), pipeline, speed)
+
+    print(f'Packets replayed: {report.packets} ({report.capture_seconds:.1f} s of capture '
+          f'in {report.wall_seconds:.2f} s wall)')
+    print(f'Throughput: {report.packets_per_second:,.0f} packets/s')
+    print(f'Windows classified: {report.windows}')
+    if report.late_packets:
+        print(f'Late packets dropped (older than a closed window): {report.late_packets}')
+    print(f'Latency window close -> prediction: p50={report.latency_ms(50):.3f} ms  '
+          f'p95={report.latency_ms(95):.3f} ms  p99={report.latency_ms(99):.3f} ms')
+
+    if args.out and not report.predictions.empty:
+        Path(os.path.dirname(args.out) or '.').mkdir(parents=True, exist_ok=True)
+        report.predictions.to_csv(args.out, index=False)
+        print(f'Saved predictions to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
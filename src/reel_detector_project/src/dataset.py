@@ -0,0 +1,150 @@
+# src/dataset.py
+# Binary, memory-mappable processed dataset written by preprocess.py and read by train.py.
+#
+# A dataset is a directory holding meta.json plus, per split, two raw
+# little-endian files:
+#   <split>.X.f32   float32 features, column-major: column j is the contiguous
+#                   run of rows [j * rows, (j + 1) * rows)
+#   <split>.y.i32   int32 encoded labels
+# meta.json records the feature names, the label encoder classes (code i is
+# classes[i]), each split's row count and how the split was made. It is written
+# last, so a crashed preprocess run never looks like a complete dataset.
+#
+# Column-major storage means reading a subset of columns only touches those
+# columns' pages, and the (rows, features) view handed out is Fortran-ordered,
+# which is the layout sklearn's tree builders use without copying. iter_batches
+# hands out bounded row batches for out-of-core training (incremental.py).
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+FEATURE_DTYPE = np.dtype("<f4")
+LABEL_DTYPE = np.dtype("<i4")
+DEFAULT_DATASET_DIR = "data/processed/dataset"
+DEFAULT_BATCH_ROWS = 65536
+
+
+def _split_files(root, split):
+    return Path(root) / f"{split}.X.f32", Path(root) / f"{split}.y.i32"
+
+
+def write_dataset(root, X, y, splits, classes, split_info=None):
+    """Write row subsets of X / y as named splits.
+
+    X is a (rows, features) DataFrame, y integer label codes, splits maps a
+    split name to the row indices it takes (in output order) and classes
+    holds the original label of every code.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    if (root / META_FILE).exists():
+        os.remove(root / META_FILE)
+    y = np.asarray(y)
+    meta = {"version": FORMAT_VERSION, "features": [str(c) for c in X.columns],
+            "classes": [str(c) for c in classes], "splits": {}, "split_info": split_info or {}}
+    for split, idx in splits.items():
+        x_path, y_path = _split_files(root, split)
+        with open(x_path, "wb") as f:
+            # One column at a time keeps the extra memory to a single column
+            for col in X.columns:
+                f.write(np.ascontiguousarray(X[col].to_numpy()[idx], dtype=FEATURE_DTYPE).tobytes())
+        with open(y_path, "wb") as f:
+            f.write(np.ascontiguousarray(y[idx], dtype=LABEL_DTYPE).tobytes())
+        meta["splits"][split] = {"rows": int(len(idx))}
+    tmp = root / (META_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp, root / META_FILE)
+
+
+class ProcessedDataset:
+    """Read-only view of a processed dataset; splits load as zero-copy memmaps."""
+
+    def __init__(self, root=DEFAULT_DATASET_DIR):
+        self.root = Path(root)
+        try:
+            with open(self.root / META_FILE) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No processed dataset in {self.root}. Run src/preprocess.py first.") from None
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported processed dataset version: {self.meta.get('version')}")
+        self.features = self.meta["features"]
+        self.classes = self.meta["classes"]
+        self.splits = list(self.meta["splits"])
+
+    def rows(self, split):
+        return self.meta["splits"][split]["rows"]
+
+    def load(self, split, columns=None):
+        """(X, y) for a split: X a DataFrame over the memmap restricted to columns
+        (all features by default), y an int Series of label codes.
+        """
+        if split not in self.meta["splits"]:
+            raise KeyError(f"No split {split!r} in {self.root} (have {', '.join(self.splits)})")
+        columns = list(columns) if columns is not None else self.features
+        missing = [c for c in columns if c not in self.features]
+        if missing:
+            raise KeyError(f"Unknown feature columns: {', '.join(missing)}")
+        rows = self.rows(split)
+        x_path, y_path = _split_files(self.root, split)
+        if rows == 0:
+            X = np.empty((0, len(columns)), dtype=FEATURE_DTYPE)
+            y = np.empty(0, dtype=LABEL_DTYPE)
+        else:
+            mm = np.memmap(x_path, dtype=FEATURE_DTYPE, mode="r", shape=(len(self.features), rows))
+            pos = [self.features.index(c) for c in columns]
+            if pos and pos == list(range(pos[0], pos[0] + len(pos))):
+                block = mm[pos[0]:pos[0] + len(pos)]     # a run of columns stays a view
+            else:
+                block = mm[pos]                          # reads just the selected columns
+            X = block.T
+            y = np.memmap(y_path, dtype=LABEL_DTYPE, mode="r", shape=(rows,))
+        return pd.DataFrame(X, columns=columns, copy=False), pd.Series(y, name="Label", copy=False)
+
+    def iter_batches(self, split, batch_rows=DEFAULT_BATCH_ROWS, columns=None, shuffle=False, seed=0):
+        """Yield (X, y) batches of a split as C-ordered float32 / int arrays.
+
+        Only one batch is read into memory at a time. shuffle visits the
+        batches in random order and permutes the rows within each one, so the
+        reads stay sequential runs of every column.
+        """
+        columns = list(columns) if columns is not None else self.features
+        rows = self.rows(split)
+        if rows == 0:
+            return
+        x_path, y_path = _split_files(self.root, split)
+        mm = np.memmap(x_path, dtype=FEATURE_DTYPE, mode="r", shape=(len(self.features), rows))
+        y_mm = np.memmap(y_path, dtype=LABEL_DTYPE, mode="r", shape=(rows,))
+        pos = [self.features.index(c) for c in columns]
+        starts = np.arange(0, rows, batch_rows)
+        rng = np.random.default_rng(seed)
+        if shuffle:
+            starts = rng.permutation(starts)
+        for start in starts:
+            stop = min(start + batch_rows, rows)
+            X = np.array(mm[pos, start:stop].T, order="C")
+            y = np.array(y_mm[start:stop])
+            if shuffle:
+                order = rng.permutation(len(y))
+                X, y = X[order], y[order]
+            yield X, y
+
+    def decode(self, codes):
+        """Original labels for encoded predictions."""
+        return np.asarray(self.classes, dtype=object)[np.asarray(codes)]
+
+
+def open_dataset(root=DEFAULT_DATASET_DIR) -> ProcessedDataset:
+    return ProcessedDataset(root)
+
+
+def load_split(split, columns=None, root=DEFAULT_DATASET_DIR):
+    """(X, y) of one split of the dataset at root."""
+    return open_dataset(root).load(split, columns)
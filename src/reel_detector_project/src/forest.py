@@ -0,0 +1,356 @@
+# src/forest.py
+# Flattened, memory-mappable RandomForest for low-latency small-batch inference.
+#
+# Scope: the flat arrays speed up single rows and online ticks (~0.1 ms vs
+# several ms in sklearn), not bulk scoring. Bulk throughput stays sklearn's:
+# batches over SMALL_BATCH_ROWS run on the sklearn model stored with the
+# export, so the directory is not a standalone, sklearn-free artifact. The
+# NumPy fallback for large batches runs at roughly half sklearn's rows/s.
+#
+# export_forest() lays every tree of a fitted forest (RandomForest /
+# ExtraTrees classifier) out in shared node arrays, one raw little-endian file
+# each, plus meta.json:
+#   feature.i64    split feature per node (0 for leaves)
+#   threshold.f32  split threshold; a row goes right when x > threshold. Stored
+#                  as the largest float32 <= sklearn's float64 threshold, so the
+#                  test on float32 inputs is unchanged. Leaves hold +inf.
+#   child.i64      left child; the right child is always left + 1 (nodes are
+#                  renumbered breadth-first with siblings adjacent). A leaf
+#                  points at itself, so extra steps leave it in place.
+#   leaf.i64       row of values.f32 for leaves (-1 for split nodes)
+#   values.f32     (leaves, classes) per-leaf class fractions
+#   roots.i64      root node of every tree
+# Index arrays are 64-bit so NumPy gathers use them without a conversion.
+#
+# Because a finished walk is a fixed point, traversal needs no per-node branch:
+# every row takes up to max_depth steps of
+#     node = child[node] + (x[feature[node]] > threshold[node])
+# as whole-array NumPy gathers, and predict_proba averages the leaf values like
+# sklearn. Up to SMALL_BATCH_ROWS rows (single predictions, online ticks) every
+# row of every tree advances one level per NumPy step, which costs a few
+# microseconds per level whatever the forest size.
+#
+# Larger batches are handed to the sklearn forest itself, pickled into the
+# directory at export (batch_model.pkl, loaded on first use): pure NumPy pays
+# ~12 ns per row, tree and level in gathers, slower than sklearn's compiled
+# traversal. The copy lives inside the directory, so
+# retraining into another pickle can never swap the batch model of an export.
+# Without it (or joblib) batches are walked here, one tree at a time over a
+# column-major row chunk (the tree's nodes stay in cache), dropping rows as
+# they reach a leaf. check_forest() reports parity and the throughput of each
+# path against the sklearn model.
+#
+# meta "source_model" stamps the pickle the forest was exported from (size,
+# mtime_ns, sha256); is_export_of() tells whether a pickle on disk is still
+# that model, so a stale export is not served after a retrain.
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+DEFAULT_FOREST_DIR = "models/reel_detector.forest"
+META_FILE = "meta.json"
+BATCH_MODEL_FILE = "batch_model.pkl"
+HASH_READ_BYTES = 1 << 20
+ARRAYS = {
+    "feature": ("feature.i64", np.dtype("<i8")),
+    "threshold": ("threshold.f32", np.dtype("<f4")),
+    "child": ("child.i64", np.dtype("<i8")),
+    "leaf": ("leaf.i64", np.dtype("<i8")),
+    "values": ("values.f32", np.dtype("<f4")),
+    "roots": ("roots.i64", np.dtype("<i8")),
+}
+CHUNK_ROWS = 16384
+SMALL_BATCH_ROWS = 64   # walked all trees at once; larger batches go to the batch model
+COMPACT_EVERY = 4       # levels between dropping finished row/tree pairs
+
+
+def _floor_float32(t):
+    """Largest float32 <= each float64 value."""
+    t32 = t.astype(np.float32)
+    over = t32.astype(np.float64) > t
+    t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+    return t32
+
+
+def _flatten_tree(tree):
+    """One sklearn Tree as (feature, threshold, child, leaf mask, leaf values, depth), siblings adjacent."""
+    left, right = tree.children_left, tree.children_right
+    n = len(left)
+    new_id = np.empty(n, dtype=np.int64)
+    order = []
+    frontier = np.array([0])
+    new_id[0] = 0
+    next_id = 1
+    depth = 0
+    while len(frontier):
+        order.append(frontier)
+        split = frontier[left[frontier] != -1]
+        if not len(split):
+            break
+        kids = np.stack((left[split], right[split]), axis=1).ravel()
+        new_id[kids] = np.arange(next_id, next_id + len(kids))
+        next_id += len(kids)
+        frontier = kids
+        depth += 1
+    old = np.concatenate(order)             # old node id at each new position
+    is_leaf = left[old] == -1
+    own = np.arange(n)
+    feature = np.where(is_leaf, 0, tree.feature[old]).astype(np.int32)
+    threshold = np.where(is_leaf, np.float32(np.inf), _floor_float32(tree.threshold[old]))
+    child = np.where(is_leaf, own, new_id[np.where(is_leaf, 0, left[old])])
+    values = tree.value[old[is_leaf], 0, :].astype(np.float64)
+    values /= np.maximum(values.sum(axis=1, keepdims=True), 1e-300)
+    return feature, threshold, child, is_leaf, values, depth
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(HASH_READ_BYTES)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def model_stamp(model_path):
+    """Identity of a pickle on disk: size, mtime_ns and content hash."""
+    st = os.stat(model_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(model_path)}
+
+
+def is_export_of(forest_path, model_path):
+    """True when the forest directory was exported from the pickle now at model_path.
+
+    Size and mtime decide the common case without reading the pickle; a copy
+    with a new mtime is still recognised by its content hash.
+    """
+    try:
+        with open(Path(forest_path) / META_FILE) as f:
+            stamp = json.load(f).get("source_model")
+        st = os.stat(model_path)
+    except (OSError, ValueError):
+        return False
+    if not stamp or st.st_size != stamp["size"]:
+        return False
+    return st.st_mtime_ns == stamp["mtime_ns"] or _sha256(model_path) == stamp["sha256"]
+
+
+def export_forest(model, path, model_path=None):
+    """Write a fitted forest classifier as a flattened forest directory.
+
+    A joblib copy of the model goes into the directory for batch predictions;
+    model_path, the pickle the model was saved to, is stamped in meta.
+    """
+    if not hasattr(model, "estimators_") or not all(hasattr(t, "tree_") for t in model.estimators_):
+        raise ValueError(f"{type(model).__name__} is not a fitted tree ensemble")
+    parts = [_flatten_tree(est.tree_) for est in model.estimators_]
+    sizes = np.array([len(p[0]) for p in parts])
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    leaf_counts = np.array([len(p[4]) for p in parts])
+    leaf_offsets = np.concatenate(([0], np.cumsum(leaf_counts)[:-1]))
+
+    arrays = {
+        "feature": np.concatenate([p[0] for p in parts]),
+        "threshold": np.concatenate([p[1] for p in parts]),
+        "child": np.concatenate([p[2] + off for p, off in zip(parts, offsets)]),
+        "leaf": np.concatenate([np.where(p[3], np.cumsum(p[3]) - 1 + loff, -1) for p, loff in zip(parts, leaf_offsets)]),
+        "values": np.concatenate([p[4] for p in parts]),
+        "roots": offsets,
+    }
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    if (path / META_FILE).exists():
+        os.remove(path / META_FILE)
+    batch_model = None
+    if os.path.exists(path / BATCH_MODEL_FILE):
+        os.remove(path / BATCH_MODEL_FILE)
+    if hasattr(model, "predict_proba"):
+        try:
+            import joblib
+        except ImportError:
+            joblib = None
+        if joblib is not None:
+            joblib.dump(model, path / BATCH_MODEL_FILE)
+            batch_model = BATCH_MODEL_FILE
+    for name, (fname, dtype) in ARRAYS.items():
+        with open(path / fname, "wb") as f:
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+    classes = model.classes_.tolist()
+    meta = {"version": FORMAT_VERSION, "trees": len(parts), "nodes": int(sizes.sum()),
+            "leaves": int(leaf_counts.sum()), "classes": classes, "n_features": int(model.n_features_in_),
+            "features": [str(c) for c in getattr(model, "feature_names_in_", [])],
+            "max_depth": int(max(p[5] for p in parts)),
+            "batch_model": batch_model, "source_model": model_stamp(model_path) if model_path else None}
+    tmp = path / (META_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path / META_FILE)
+    return meta
+
+
+class FlatForest:
+    """Inference over an exported forest; arrays are np.memmap views of the files."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported forest version: {self.meta.get('version')}")
+        self.classes = np.asarray(self.meta["classes"])
+        self.n_features = self.meta["n_features"]
+        self.features = self.meta["features"] or None
+        self.max_depth = self.meta["max_depth"]
+        n_classes = len(self.classes)
+        shapes = {"values": (self.meta["leaves"], n_classes), "roots": (self.meta["trees"],)}
+        for name, (fname, dtype) in ARRAYS.items():
+            shape = shapes.get(name, (self.meta["nodes"],))
+            # Plain ndarray views of the mapping: np.memmap's subclass overhead dominates small gathers
+            setattr(self, name, np.memmap(self.path / fname, dtype=dtype, mode="r", shape=shape).view(np.ndarray))
+        self.n_trees = len(self.roots)
+        self._batch_model = None
+        self._batch_model_loaded = False
+
+    @property
+    def batch_model(self):
+        """The sklearn forest copy named in meta, loaded on first use; None when unavailable."""
+        if not self._batch_model_loaded:
+            self._batch_model_loaded = True
+            name = self.meta.get("batch_model")
+            if name and (self.path / name).exists():
+                try:
+                    import joblib
+                except ImportError:
+                    return None
+                self._batch_model = joblib.load(self.path / name, mmap_mode="r")
+        return self._batch_model
+
+    def _walk(self, XT, root):
+        """Leaf node of one tree for every row of a (features, rows) C-ordered chunk."""
+        n = XT.shape[1]
+        flat = XT.ravel()
+        feature, threshold, child, leaf = self.feature, self.threshold, self.child, self.leaf
+        out = np.empty(n, dtype=np.int64)
+        rows = np.arange(n)
+        node = np.full(n, root, dtype=np.int64)
+        for level in range(self.max_depth):
+            if level and level % COMPACT_EVERY == 0:
+                live = leaf[node] < 0
+                if not live.all():
+                    out[rows[~live]] = node[~live]
+                    node, rows = node[live], rows[live]
+                    if not len(node):
+                        return out
+            at = feature[node] * n
+            at += rows
+            node = child[node] + (flat[at] > threshold[node])
+        out[rows] = node
+        return out
+
+    def _walk_all(self, X):
+        """Leaf node of every tree for every row, (rows, trees): one NumPy step per level."""
+        n, F = X.shape
+        node = np.tile(self.roots, n)
+        base = np.repeat(np.arange(n, dtype=np.int64) * F, self.n_trees)
+        flat = X.ravel()
+        feature, threshold, child = self.feature, self.threshold, self.child
+        for _ in range(self.max_depth):
+            node = child[node] + (flat[base + feature[node]] > threshold[node])
+        return node.reshape(n, self.n_trees)
+
+    def numpy_proba(self, X):
+        """predict_proba computed here for any batch size (no batch model)."""
+        if len(X) <= SMALL_BATCH_ROWS:
+            leaves = self.leaf[self._walk_all(X)]
+            return self.values[leaves].sum(axis=1, dtype=np.float64) / self.n_trees
+        out = np.zeros((len(X), len(self.classes)), dtype=np.float64)
+        for start in range(0, len(X), CHUNK_ROWS):
+            XT = np.ascontiguousarray(X[start:start + CHUNK_ROWS].T)
+            proba = out[start:start + XT.shape[1]]
+            for root in self.roots:
+                proba += self.values[self.leaf[self._walk(XT, root)]]
+        out /= self.n_trees
+        return out
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over the trees (sklearn's soft vote)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        if len(X) > SMALL_BATCH_ROWS and self.batch_model is not None:
+            if self.features:
+                import pandas as pd
+                X = pd.DataFrame(X, columns=self.features, copy=False)
+            return self.batch_model.predict_proba(X)
+        return self.numpy_proba(X)
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def load_forest(path) -> FlatForest:
+    return FlatForest(path)
+
+
+def check_forest(forest, model, X, single_rows=200):
+    """Parity and throughput of the flat forest against the sklearn model it was exported from."""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+
+    def rows_per_s(predict):
+        t0 = time.perf_counter()
+        proba = predict(X)
+        return proba, len(X) / max(time.perf_counter() - t0, 1e-9)
+
+    def single_us(predict):
+        times = []
+        for i in range(min(single_rows, len(X))):
+            t0 = time.perf_counter()
+            predict(X[i:i + 1])
+            times.append(time.perf_counter() - t0)
+        return float(np.median(times) * 1e6)
+
+    ref, sklearn_rows_s = rows_per_s(model.predict_proba)
+    flat, numpy_rows_s = rows_per_s(forest.numpy_proba)
+    _, batch_rows_s = rows_per_s(forest.predict_proba)
+    return {"rows": len(X), "max_abs_diff": float(np.abs(flat - ref).max()),
+            "predictions_equal": bool(np.array_equal(flat.argmax(axis=1), ref.argmax(axis=1))),
+            "sklearn_rows_s": sklearn_rows_s, "numpy_rows_s": numpy_rows_s, "batch_rows_s": batch_rows_s,
+            "sklearn_single_us": single_us(model.predict_proba), "single_us": single_us(forest.predict_proba)}
+
+
+def print_check(check):
+    print(f"[forest] parity on {check['rows']} rows: max |p diff| {check['max_abs_diff']:.2e}, "
+          f"predictions {'identical' if check['predictions_equal'] else 'DIFFER'}")
+    print(f"[forest] batch rows/s: sklearn {check['sklearn_rows_s']:,.0f}, numpy walk {check['numpy_rows_s']:,.0f}, "
+          f"predict_proba {check['batch_rows_s']:,.0f}")
+    print(f"[forest] single row: sklearn {check['sklearn_single_us']:.0f} us, flat {check['single_us']:.0f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained forest for fast inference")
+    parser.add_argument("model", help="joblib pickle of the fitted forest (models/reel_detector.pkl)")
+    parser.add_argument("out", nargs="?", default=DEFAULT_FOREST_DIR, help=f"Output directory (default {DEFAULT_FOREST_DIR})")
+    parser.add_argument("--check-data", default=None,
+                        help="Processed dataset (preprocess.py) whose test split is used for the parity / throughput check")
+    parser.add_argument("--check-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    import joblib
+    model = joblib.load(args.model)
+    meta = export_forest(model, args.out, args.model)
+    print(f"Exported {meta['trees']} trees, {meta['nodes']} nodes (max depth {meta['max_depth']}) to {args.out}")
+    if args.check_data:
+        from dataset import open_dataset
+        X_test, _ = open_dataset(args.check_data).load("test", meta["features"] or None)
+        print_check(check_forest(load_forest(args.out), model, X_test.to_numpy()[:args.check_rows]))
@@ -0,0 +1,57 @@
+# src/incremental.py
+# Out-of-core training on a processed dataset (train.py --streaming).
+#
+# The training split is consumed in row batches from the memory-mapped dataset
+# (ProcessedDataset.iter_batches), so memory is bounded by the batch size rather
+# than the dataset: a first pass fits a StandardScaler with partial_fit, then
+# every epoch feeds shuffled, scaled batches to an incremental learner. The
+# fitted scaler and learner are returned as one Pipeline, which predict.py
+# loads like the RandomForest.
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from dataset import DEFAULT_BATCH_ROWS
+
+INCREMENTAL_MODELS = ("sgd", "nb")
+
+
+def make_incremental_model(name, random_state=42):
+    """An estimator supporting partial_fit."""
+    if name == "sgd":
+        # Logistic loss keeps predict_proba available
+        return SGDClassifier(loss="log_loss", alpha=1e-5, random_state=random_state)
+    if name == "nb":
+        return GaussianNB()
+    raise ValueError(f"Unknown incremental model {name!r} (choose from {', '.join(INCREMENTAL_MODELS)})")
+
+
+def fit_incremental(dataset, columns=None, model="sgd", epochs=3, batch_rows=DEFAULT_BATCH_ROWS, seed=42):
+    """Fit scaler + incremental learner on the train split, one batch in memory at a time."""
+    scaler = StandardScaler()
+    for X, _y in dataset.iter_batches("train", batch_rows, columns):
+        scaler.partial_fit(X)
+
+    clf = make_incremental_model(model, seed)
+    classes = np.arange(len(dataset.classes))
+    for epoch in range(epochs):
+        seen = 0
+        for X, y in dataset.iter_batches("train", batch_rows, columns, shuffle=True, seed=seed + epoch):
+            clf.partial_fit(scaler.transform(X), y, classes=classes)
+            seen += len(y)
+        print(f"[incremental] epoch {epoch + 1}/{epochs}: {seen} rows")
+    return Pipeline([("scaler", scaler), ("clf", clf)])
+
+
+def predict_split(model, dataset, split="test", columns=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """(y_true, y_pred) over a split, predicted batch by batch."""
+    y_true, y_pred = [], []
+    for X, y in dataset.iter_batches(split, batch_rows, columns):
+        y_true.append(y)
+        y_pred.append(model.predict(X))
+    if not y_true:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(y_true), np.concatenate(y_pred)
@@ -1,26 +1,185 @@
-import joblib
+import time
+
+_t_start = time.perf_counter()
+
 import argparse
+import os
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+# Only the standard library is imported up front; numpy, joblib/sklearn or a TFLite
+# runtime are imported by load_model() for the kind of model actually used.
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+MODEL_ENV = "REEL_DETECTOR_MODEL"
+DEFAULT_MODELS = ("models/reel_detector.forest", "models/reel_detector.pkl")
+DEFAULT_SCALER = "models/scaler.json"
+BATCH_CHUNK_ROWS = 100_000
+KEY_COLUMNS = ("device", "wstart")    # carried from a windows file to the predictions
+NON_FEATURE_COLUMNS = ("device", "wstart", "label")
+
+
+@lru_cache(maxsize=None)
+def resolve_model_path(path=None):
+    """--model, else $REEL_DETECTOR_MODEL, else the default forest export or pickle.
+
+    The forest is only used while it is still the export of the pickle next to
+    it; after a retrain that did not re-export, the newer pickle is served.
+    Relative default paths are looked up in the project directory, so the CLI works from any cwd.
+    """
+    path = path or os.environ.get(MODEL_ENV)
+    if path:
+        return Path(path)
+    forest_name, pickle_name = DEFAULT_MODELS
+    for base in (Path.cwd(), PROJECT_DIR):
+        forest, pickle = base / forest_name, base / pickle_name
+        if forest.exists():
+            if not pickle.exists():
+                return forest
+            from forest import is_export_of
+            if is_export_of(forest, pickle):
+                return forest
+            print(f"[model] {forest} was not exported from the current {pickle_name}; using the pickle "
+                  f"(re-export with src/forest.py)", file=sys.stderr)
+            return pickle
+        if pickle.exists():
+            return pickle
+    raise FileNotFoundError(f"No trained model found (looked for {', '.join(DEFAULT_MODELS)}); "
+                            f"train one or pass --model / set {MODEL_ENV}")
+
+
+@lru_cache(maxsize=None)
+def load_model(path=None, scaler_path=None):
+    """Load a model once; later calls with the same arguments reuse it.
+
+    - flattened forest directory (forest.py): memory-mapped numpy walk for small batches,
+      its sklearn copy (loaded on first use) for larger ones
+    - .tflite + scaler.json: tflite_runtime interpreter (TensorFlow as fallback)
+    - anything else: joblib pickle, numpy arrays memory-mapped
+    """
+    path = resolve_model_path(path)
+    if (path / "meta.json").exists():
+        from forest import load_forest
+        return load_forest(path)
+    if path.suffix == ".tflite":
+        sys.path.append(str(PROJECT_DIR / "notebooks"))
+        from tflite_model import TFLiteModel  # type: ignore
+        return TFLiteModel(path, scaler_path or path.with_name("scaler.json"))
+    import joblib
+    return joblib.load(path, mmap_mode="r")
 
-# 1. Load trained model
-model = joblib.load("models/reel_detector.pkl")
 
-def predict_reel_category(features):
+def predict_reel_category(features, model_path=None, scaler_path=None):
     """
     Predicts the category of a reel given feature input.
     features: list/array of numeric features
     """
+    model = load_model(model_path, scaler_path)
     prediction = model.predict([features])
     return prediction[0]
 
+
+def model_features(model, columns):
+    """Feature columns the model was trained on, else every non-key column of the input."""
+    names = getattr(model, "features", None) or getattr(model, "feature_names_in_", None)
+    if names is not None and len(names):
+        missing = [c for c in names if c not in columns]
+        if missing:
+            raise ValueError(f"Input is missing model features: {', '.join(missing)}")
+        return list(names)
+    return [c for c in columns if c not in NON_FEATURE_COLUMNS]
+
+
+def predict_chunk(model, X):
+    """(predictions, probabilities (rows, classes) or None, class labels) for a feature frame."""
+    if not hasattr(model, "predict_proba"):
+        return model.predict(X), None, None
+    proba = model.predict_proba(X)
+    if proba.ndim == 1:     # TFLite sigmoid: probability of class 1
+        return (proba > 0.5).astype("int64"), proba[:, None], ["1"]
+    classes = getattr(model, "classes", None)
+    if classes is None:
+        classes = model.classes_
+    return classes[proba.argmax(axis=1)], proba, [str(c) for c in classes]
+
+
+def predict_windows(model, source, out, chunk_rows=BATCH_CHUNK_ROWS):
+    """Score a windows CSV (path, "-" or file object) chunk by chunk; returns (rows, seconds).
+
+    Writes the key columns present (device, wstart), then prediction and one
+    proba_<class> column per class. Memory is bounded by chunk_rows.
+    """
+    import pandas as pd
+
+    t0 = time.perf_counter()
+    source = sys.stdin if source == "-" else source
+    out = sys.stdout if out == "-" else out
+    rows = 0
+    header = True
+    features = None
+    for chunk in pd.read_csv(source, chunksize=chunk_rows):
+        if features is None:
+            features = model_features(model, chunk.columns)
+        pred, proba, classes = predict_chunk(model, chunk[features].astype("float32"))
+        result = chunk[[c for c in KEY_COLUMNS if c in chunk.columns]].copy()
+        result["prediction"] = pred
+        if proba is not None:
+            for i, c in enumerate(classes):
+                result[f"proba_{c}"] = proba[:, i].astype("float32")    # shorter CSV text
+        result.to_csv(out, header=header, index=False, mode="w" if header else "a")
+        header = False
+        rows += len(chunk)
+    return rows, time.perf_counter() - t0
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Predict reel category")
-    parser.add_argument("--features", nargs="+", type=float, required=True,
+    parser.add_argument("--features", nargs="+", type=float,
                         help="Input features separated by space (numeric values)")
-    
+    parser.add_argument("--input", default=None,
+                        help="Batch mode: windows CSV from packets_to_windows.py, or - for stdin")
+    parser.add_argument("--output", default="-",
+                        help="Batch mode: predictions CSV (default - for stdout)")
+    parser.add_argument("--chunk-rows", type=int, default=BATCH_CHUNK_ROWS,
+                        help=f"Batch mode: rows scored per chunk (default {BATCH_CHUNK_ROWS})")
+    parser.add_argument("--model", default=None,
+                        help=f"Model: flattened forest dir, .pkl or .tflite (default: ${MODEL_ENV}, "
+                             f"then {' / '.join(DEFAULT_MODELS)})")
+    parser.add_argument("--scaler", default=None,
+                        help="scaler.json for a .tflite model (default: next to the model)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print time spent in imports, model loading and the first prediction (or batch)")
+
     args = parser.parse_args()
-    
+    if (args.features is None) == (args.input is None):
+        parser.error("pass either --features or --input")
+    t_parsed = time.perf_counter()
+
     # Convert list of strings to float list
     input_features = args.features
-    predicted_class = predict_reel_category(input_features)
-    
-    print(f"Predicted Reel Category: {predicted_class}")
+    try:
+        load_model(args.model, args.scaler)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    t_loaded = time.perf_counter()
+    if args.input is not None:
+        out = args.output if args.output == "-" else open(args.output, "w", newline="")
+        try:
+            rows, seconds = predict_windows(load_model(args.model, args.scaler), args.input, out, args.chunk_rows)
+        finally:
+            if out != "-":
+                out.close()
+        t_done = time.perf_counter()
+        print(f"[batch] {rows} windows in {seconds:.2f} s ({rows / max(seconds, 1e-9):,.0f} rows/s)",
+              file=sys.stderr)
+    else:
+        predicted_class = predict_reel_category(input_features, args.model, args.scaler)
+        t_done = time.perf_counter()
+        print(f"Predicted Reel Category: {predicted_class}")
+    if args.profile_startup:
+        print(f"[startup] imports + args  {(t_parsed - _t_start) * 1000:8.2f} ms", file=sys.stderr)
+        print(f"[startup] model load      {(t_loaded - t_parsed) * 1000:8.2f} ms "
+              f"({resolve_model_path(args.model)})", file=sys.stderr)
+        print(f"[startup] {'batch' if args.input else 'first predict':15s} {(t_done - t_loaded) * 1000:8.2f} ms", file=sys.stderr)
+        print(f"[startup] total in Python {(t_done - _t_start) * 1000:8.2f} ms "
+              f"(interpreter start not included; see python -X importtime)", file=sys.stderr)
@@ -1,59 +1,197 @@
+import argparse
 import os
+import resource
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 
+from dataset import DEFAULT_DATASET_DIR, write_dataset
+
 # Paths
 RAW_DATA_DIR = "data/raw"
 PROCESSED_DATA_DIR = "data/processed"
 
+LABEL_COLUMN = "Label"
+# Per-flow identifiers in the TrafficLabelling variant of the dataset; not features
+ID_COLUMNS = {"Flow ID", "Source IP", "Source Port", "Destination IP", "Timestamp"}
+FEATURE_DTYPE = np.float32
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+CHUNK_ROWS = 100_000
+READ_BYTES = 16 * 1024 * 1024
+MAX_WORKERS = 4             # each concurrent parser holds a chunk plus its buffers
+
 os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
 
-def load_raw_data():
+
+def normalize_column(name):
+    """CICIDS2017 headers carry stray spaces (' Label', ' Flow Duration')."""
+    return name.strip()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def read_schema(path):
+    """(raw column names, normalized feature names) of one raw CSV."""
+    raw = pd.read_csv(path, nrows=0, encoding_errors="replace").columns.tolist()
+    names = [normalize_column(c) for c in raw]
+    if LABEL_COLUMN not in names:
+        raise ValueError(f"{path}: no {LABEL_COLUMN} column")
+    features = [n for n in names if n != LABEL_COLUMN and n not in ID_COLUMNS]
+    return raw, features
+
+
+def count_rows(path):
+    """Upper bound on the data rows of a CSV: its newlines, less the header line."""
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(READ_BYTES)
+            if not buf:
+                break
+            lines += buf.count(b"\n")
+            last = buf[-1:]
+    return max(lines + (last != b"\n") - 1, 0)
+
+
+def _read_file(path, features, out, chunksize):
+    """Parse one file into out (a float32 slice of the merged matrix).
+
+    Rows with missing values are dropped (as preprocess used to do); +/-inf
+    entries are kept for preprocess() to fill from the training rows.
+    Returns the rows written and the categorical label chunks.
+    """
+    raw, names = read_schema(path)
+    if names != features:
+        raise ValueError(f"{path}: columns differ from the first file")
+    by_name = {normalize_column(c): c for c in raw}
+    feature_cols = [by_name[f] for f in features]
+    label_col = by_name[LABEL_COLUMN]
+    dtype = {c: FEATURE_DTYPE for c in feature_cols}
+    dtype[label_col] = "category"
+
+    labels = []
+    pos = 0
+    for chunk in pd.read_csv(path, usecols=feature_cols + [label_col], dtype=dtype, chunksize=chunksize,
+                             encoding_errors="replace"):
+        X = chunk[feature_cols].to_numpy(dtype=FEATURE_DTYPE)
+        label = chunk[label_col].values
+        del chunk
+        keep = ~(np.isnan(X).any(axis=1) | label.isna())
+        if not keep.all():
+            X, label = X[keep], label[keep]
+        out[pos:pos + len(X)] = X
+        labels.append(label)
+        pos += len(X)
+    return pos, labels
+
+
+def load_raw_data(raw_dir=RAW_DATA_DIR, workers=None, chunksize=CHUNK_ROWS):
     """
     Load and merge all CICIDS2017 raw CSV files into a single DataFrame.
     Place the raw CSV files into data/raw before running this script.
+
+    Files are read concurrently in chunks with a declared schema: float32
+    features under stripped column names, a categorical Label and rows with
+    missing values dropped (+/-inf is left for preprocess). Every
+    file parses straight into its own slice of one preallocated float32
+    matrix (sized from a newline count), so there is no per-file frame and
+    no concatenated second copy.
     """
-    all_files = [os.path.join(RAW_DATA_DIR, f) for f in os.listdir(RAW_DATA_DIR) if f.endswith(".csv")]
+    all_files = sorted(os.path.join(raw_dir, f) for f in os.listdir(raw_dir) if f.endswith(".csv"))
     if not all_files:
         raise FileNotFoundError("No CSV files found in data/raw. Please download CICIDS2017 dataset and place here.")
 
-    dfs = [pd.read_csv(f) for f in all_files]
-    df = pd.concat(dfs, ignore_index=True)
+    _, features = read_schema(all_files[0])
+    bounds = np.cumsum([0] + [count_rows(f) for f in all_files])
+    data = np.empty((bounds[-1], len(features)), dtype=FEATURE_DTYPE)
+    workers = workers or min(len(all_files), os.cpu_count() or 1, MAX_WORKERS)
+    # Threads: the C parser does the heavy lifting outside the GIL and every
+    # file writes into shared memory
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(lambda i: _read_file(all_files[i], features, data[bounds[i]:bounds[i + 1]], chunksize),
+                              range(len(all_files))))
+
+    labels = []
+    pos = 0
+    for start, (rows, file_labels) in zip(bounds, parts):
+        # Close the gaps left by dropped rows (moves only ever go towards the front)
+        if start != pos:
+            data[pos:pos + rows] = data[start:start + rows]
+        labels.extend(file_labels)
+        pos += rows
+    data = data[:pos]
+
+    df = pd.DataFrame(data, columns=features, copy=False)
+    df[LABEL_COLUMN] = union_categoricals(labels, ignore_order=True) if labels else pd.Categorical([])
     print(f"Loaded {len(df)} rows from {len(all_files)} files.")
+    print(f"[load] {len(features)} float32 features, {df[LABEL_COLUMN].cat.categories.size} labels, "
+          f"peak RSS {peak_rss_mb():.0f} MiB")
     return df
 
-def preprocess(df):
-    """
-    Clean, encode, and split dataset.
+
+def fill_inf(X, train_idx):
+    """Replace +/-inf in X (in place) with the column mean of the finite training values.
+
+    Only the training rows decide the fill, so no test statistics leak into
+    training; a column without finite training values is filled with 0.
+    Returns {column: fill value} for the columns that had any infinity.
     """
-    # Drop rows with missing values
-    df = df.dropna()
+    fills = {}
+    for col in X.columns:
+        values = X[col].to_numpy()
+        inf = np.isinf(values)
+        if not inf.any():
+            continue
+        train = values[train_idx]
+        finite = train[np.isfinite(train)]
+        fill = FEATURE_DTYPE(finite.mean(dtype=np.float64) if len(finite) else 0.0)
+        # One column at a time keeps the extra memory to a single column
+        X[col] = np.where(inf, fill, values)
+        fills[col] = float(fill)
+    return fills
 
-    # Rename target column if needed (CICIDS2017 often uses ' Label')
-    if " Label" in df.columns:
-        df.rename(columns={" Label": "Label"}, inplace=True)
 
+def preprocess(df, out_dir=DEFAULT_DATASET_DIR):
+    """
+    Encode and split dataset (load_raw_data has dropped incomplete rows), fill
+    +/-inf from the training rows and save the splits as a binary processed
+    dataset (see dataset.py).
+    """
     # Encode labels (Normal -> 0, Attack -> 1..N)
     encoder = LabelEncoder()
-    df["Label"] = encoder.fit_transform(df["Label"])
+    y = encoder.fit_transform(df[LABEL_COLUMN].astype(str))
+    X = df.drop(columns=[LABEL_COLUMN])
 
-    # Split features/target
-    X = df.drop(columns=["Label"])
-    y = df["Label"]
+    # Train-test split on row indices, so the features are only copied while writing
+    train_idx, test_idx = train_test_split(np.arange(len(df)), test_size=TEST_SIZE, random_state=RANDOM_STATE,
+                                           stratify=y)
 
-    # Train-test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    inf_fill = fill_inf(X, train_idx)
+    if inf_fill:
+        print(f"[clean] +/-inf filled with training means in {len(inf_fill)} columns")
 
-    # Save processed files
-    train = pd.concat([X_train, y_train], axis=1)
-    test = pd.concat([X_test, y_test], axis=1)
+    split_info = {"test_size": TEST_SIZE, "random_state": RANDOM_STATE, "stratify": LABEL_COLUMN,
+                  "source_rows": len(df), "inf_fill": inf_fill}
+    write_dataset(out_dir, X, y, {"train": train_idx, "test": test_idx}, encoder.classes_, split_info)
 
-    train.to_csv(os.path.join(PROCESSED_DATA_DIR, "train.csv"), index=False)
-    test.to_csv(os.path.join(PROCESSED_DATA_DIR, "test.csv"), index=False)
+    print(f"Saved processed data to {out_dir}: {len(train_idx)} train rows, {len(test_idx)} test rows.")
 
-    print(f"Saved processed data: {len(train)} train rows, {len(test)} test rows.")
 
 if __name__ == "__main__":
-    df = load_raw_data()
-    preprocess(df)
+    parser = argparse.ArgumentParser(description="Merge, clean and split the CICIDS2017 CSVs")
+    parser.add_argument("--raw-dir", default=RAW_DATA_DIR, help="Directory of raw CSV files (default data/raw)")
+    parser.add_argument("--out", default=DEFAULT_DATASET_DIR, help="Processed dataset directory (default data/processed/dataset)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Files read concurrently (default: up to 4, one per CPU)")
+    args = parser.parse_args()
+
+    df = load_raw_data(args.raw_dir, workers=args.workers)
+    preprocess(df, args.out)
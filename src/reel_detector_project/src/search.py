@@ -0,0 +1,244 @@
+# src/search.py
+# Hyperparameter search with successive halving over the processed dataset.
+#
+# Candidates are sampled from SEARCH_SPACES and evaluated in a process pool.
+# Workers open the memory-mapped dataset by path (dataset.py) in their
+# initializer and keep a view of the whole feature matrix, so the features sit
+# once in the page cache and are shared by every worker; a --features subset
+# is selected per fit, copying only that fit's rows. Only candidate configs
+# and metrics cross process boundaries.
+#
+# The training split is already in random order (preprocess splits shuffled
+# row indices), so a rung with budget r trains on its first r rows and every
+# candidate validates on the same tail of the split; the test split is left
+# untouched for the final model. After each rung the best 1/eta candidates by
+# validation accuracy move on with eta times the rows.
+#
+# Every evaluation also records the fitted model's pickled size (the same
+# measure for every kind) and its inference latency (per row in a batch, and
+# one row at a time). Scores from different budgets are not comparable, so
+# after the last rung every candidate on a rung's accuracy / size / latency
+# Pareto front is refit at the full budget, and the final front is taken over
+# full-budget evaluations only.
+
+import argparse
+import itertools
+import json
+import math
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from dataset import DEFAULT_DATASET_DIR, open_dataset
+
+SEARCH_SPACES = {
+    "rf": {"n_estimators": [25, 50, 100, 200], "max_depth": [8, 12, 20, None],
+           "min_samples_leaf": [1, 5, 20], "max_features": ["sqrt", 0.3]},
+    "et": {"n_estimators": [25, 50, 100, 200], "max_depth": [8, 12, 20, None],
+           "min_samples_leaf": [1, 5, 20], "max_features": ["sqrt", 0.3]},
+    # sklearn stand-in for the Keras MLP of train_and_convert.py
+    "mlp": {"hidden_layer_sizes": [(16,), (32, 16), (64, 32), (128, 64)], "alpha": [1e-5, 1e-4, 1e-3]},
+}
+LATENCY_BATCH_ROWS = 10000
+LATENCY_SINGLE_CALLS = 50
+
+_worker = {}
+
+
+def build_model(kind, params, seed=42):
+    if kind == "rf":
+        return RandomForestClassifier(random_state=seed, n_jobs=1, **params)
+    if kind == "et":
+        return ExtraTreesClassifier(random_state=seed, n_jobs=1, **params)
+    if kind == "mlp":
+        return make_pipeline(StandardScaler(), MLPClassifier(random_state=seed, max_iter=50,
+                                                             early_stopping=True, **params))
+    raise ValueError(f"Unknown model kind {kind!r} (choose from {', '.join(SEARCH_SPACES)})")
+
+
+def sample_candidates(kinds, n, seed=42):
+    """Up to n distinct (kind, params) drawn from the grids of the given model kinds."""
+    grid = [(kind, dict(zip(SEARCH_SPACES[kind], values)))
+            for kind in kinds for values in itertools.product(*SEARCH_SPACES[kind].values())]
+    rng = np.random.default_rng(seed)
+    return [grid[i] for i in rng.permutation(len(grid))[:n]]
+
+
+def rung_budgets(min_rows, max_rows, eta):
+    budgets = [max_rows]
+    while budgets[-1] / eta >= min_rows:
+        budgets.append(int(budgets[-1] / eta))
+    return budgets[::-1]
+
+
+def _init_worker(root, columns, val_rows):
+    dataset = open_dataset(root)
+    # All columns: a view of the memmap (a column subset would fancy-index a private copy)
+    X, y = dataset.load("train")
+    pos = None if columns is None else [dataset.features.index(c) for c in columns]
+    n = len(X)
+    _worker.update(X=X.to_numpy(), y=y.to_numpy(), pos=pos, val=slice(n - val_rows, n), fit_rows=n - val_rows)
+
+
+def _rows(sl):
+    """Feature rows sl of the worker's split, restricted to the searched columns."""
+    X = _worker["X"][sl]
+    return X if _worker["pos"] is None else X[:, _worker["pos"]]
+
+
+def _latency(model, X):
+    """(microseconds per row predicting a batch, median ms for a one-row predict)."""
+    t0 = time.perf_counter()
+    model.predict(X)
+    batch_us = (time.perf_counter() - t0) / len(X) * 1e6
+    single = []
+    for i in range(min(LATENCY_SINGLE_CALLS, len(X))):
+        t0 = time.perf_counter()
+        model.predict(X[i:i + 1])
+        single.append(time.perf_counter() - t0)
+    return batch_us, float(np.median(single) * 1000)
+
+
+def model_size_kb(model):
+    """Pickled size, the same measure for every model kind."""
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1024
+
+
+def evaluate_candidate(job):
+    """Fit one candidate on the first `rows` training rows and score it on the validation tail."""
+    cid, kind, params, rows, seed = job
+    y = _worker["y"]
+    rows = min(rows, _worker["fit_rows"])
+    model = build_model(kind, params, seed)
+    t0 = time.perf_counter()
+    model.fit(_rows(slice(0, rows)), y[:rows])
+    fit_s = time.perf_counter() - t0
+    X_val, y_val = _rows(_worker["val"]), y[_worker["val"]]
+    pred = model.predict(X_val)
+    batch_us, single_ms = _latency(model, np.ascontiguousarray(X_val[:LATENCY_BATCH_ROWS]))
+    return {"id": cid, "kind": kind, "params": json.dumps(params), "rows": rows,
+            "accuracy": accuracy_score(y_val, pred),
+            "macro_f1": f1_score(y_val, pred, average="macro", zero_division=0),
+            "size_kb": model_size_kb(model),
+            "batch_us_per_row": batch_us, "single_ms": single_ms, "fit_s": fit_s}
+
+
+def pareto_front(df, maximize="accuracy", minimize=("size_kb", "single_ms")):
+    """Boolean mask of rows not dominated on accuracy / size / latency."""
+    values = df[[maximize, *minimize]].to_numpy(dtype=np.float64) * np.array([-1.0] + [1.0] * len(minimize))
+    front = np.ones(len(df), dtype=bool)
+    for i, v in enumerate(values):
+        dominated = np.all(values <= v, axis=1) & np.any(values < v, axis=1)
+        front[i] = not dominated.any()
+    return front
+
+
+def successive_halving(root, kinds, n_candidates=27, eta=3, min_rows=20000, max_rows=None, val_rows=50000,
+                       columns=None, workers=None, seed=42):
+    """Run the search; returns a frame of every evaluation (one row per candidate per rung).
+
+    Rows with refit=True are front candidates of earlier rungs refit at the full budget.
+    """
+    dataset = open_dataset(root)
+    n_train = dataset.rows("train")
+    if val_rows >= n_train:
+        raise ValueError(f"val_rows ({val_rows}) must be smaller than the train split ({n_train} rows)")
+    max_rows = min(max_rows or n_train, n_train - val_rows)
+    missing = [c for c in columns or () if c not in dataset.features]
+    if missing:
+        raise KeyError(f"Unknown feature columns: {', '.join(missing)}")
+    budgets = rung_budgets(min(min_rows, max_rows), max_rows, eta)
+    candidates = dict(enumerate(sample_candidates(kinds, n_candidates, seed)))
+    alive = list(candidates.items())
+    workers = workers or os.cpu_count() or 1
+    print(f"[search] {len(alive)} candidates, rungs {budgets} rows, eta {eta}, {workers} workers, "
+          f"validating on {val_rows} rows")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(str(root), columns, val_rows)) as pool:
+        for rung, rows in enumerate(budgets):
+            t0 = time.perf_counter()
+            jobs = [(cid, kind, params, rows, seed) for cid, (kind, params) in alive]
+            scores = list(pool.map(evaluate_candidate, jobs))
+            for s in scores:
+                s["rung"], s["refit"] = rung, False
+            results.extend(scores)
+            best = max(scores, key=lambda s: s["accuracy"])
+            print(f"[search] rung {rung}: {len(scores)} candidates x {rows} rows in "
+                  f"{time.perf_counter() - t0:.1f} s, best {best['kind']} {best['params']} "
+                  f"acc={best['accuracy']:.4f}")
+            if rung == len(budgets) - 1:
+                break
+            keep = max(1, math.ceil(len(alive) / eta))
+            ranked = sorted(scores, key=lambda s: s["accuracy"], reverse=True)[:keep]
+            ids = {s["id"] for s in ranked}
+            alive = [c for c in alive if c[0] in ids]
+
+        # Pareto candidates pruned before the last rung were scored on fewer rows than the
+        # survivors; refit them at the full budget so the final front compares like with like
+        evaluated = pd.DataFrame(results)
+        front = np.zeros(len(evaluated), dtype=bool)
+        for _, idx in evaluated.groupby("rung").indices.items():
+            front[idx] = pareto_front(evaluated.iloc[idx])
+        full = set(evaluated.loc[evaluated["rows"] == budgets[-1], "id"])
+        refit_ids = sorted(set(evaluated.loc[front, "id"]) - full)
+        if refit_ids:
+            t0 = time.perf_counter()
+            jobs = [(cid, *candidates[cid], budgets[-1], seed) for cid in refit_ids]
+            scores = list(pool.map(evaluate_candidate, jobs))
+            for s in scores:
+                s["rung"], s["refit"] = len(budgets) - 1, True
+            results.extend(scores)
+            print(f"[search] refit {len(scores)} earlier-rung Pareto candidates at {budgets[-1]} rows in "
+                  f"{time.perf_counter() - t0:.1f} s")
+    return pd.DataFrame(results)
+
+
+def report(results):
+    """Evaluations at the full budget (last-rung survivors and refit front candidates), with Pareto flags."""
+    final = results[results["rows"] == results["rows"].max()].sort_values("accuracy", ascending=False)
+    final = final.assign(pareto=pareto_front(final))
+    cols = ["kind", "params", "rows", "refit", "accuracy", "macro_f1", "size_kb", "batch_us_per_row", "single_ms",
+            "pareto"]
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(final[cols].to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    return final
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter search")
+    parser.add_argument("--data", default=DEFAULT_DATASET_DIR, help="Processed dataset from preprocess.py")
+    parser.add_argument("--models", default="rf,et,mlp", help=f"Model kinds to search ({','.join(SEARCH_SPACES)})")
+    parser.add_argument("--candidates", type=int, default=27, help="Configurations sampled for the first rung")
+    parser.add_argument("--eta", type=int, default=3, help="Keep 1/eta of the candidates per rung (default 3)")
+    parser.add_argument("--min-rows", type=int, default=20000, help="Training rows in the first rung")
+    parser.add_argument("--max-rows", type=int, default=None, help="Training rows in the last rung (default: all)")
+    parser.add_argument("--val-rows", type=int, default=50000, help="Validation rows held out of the train split")
+    parser.add_argument("--features", default=None, help="Comma-separated feature columns (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="models/search_results.csv", help="CSV of every evaluation")
+    args = parser.parse_args()
+
+    kinds = [k.strip() for k in args.models.split(",") if k.strip()]
+    unknown = [k for k in kinds if k not in SEARCH_SPACES]
+    if unknown:
+        parser.error(f"unknown model kinds: {', '.join(unknown)}")
+    results = successive_halving(args.data, kinds, args.candidates, args.eta, args.min_rows, args.max_rows,
+                                 args.val_rows, args.features.split(",") if args.features else None,
+                                 args.workers, args.seed)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    final_out = os.path.splitext(args.out)[0] + "_final.csv"
+    report(results).to_csv(final_out, index=False)
+    results.to_csv(args.out, index=False)
+    print(f"Saved {len(results)} evaluations to {args.out}, final candidates to {final_out}")
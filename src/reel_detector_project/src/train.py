@@ -1,45 +1,70 @@
-import pandas as pd
+import argparse
+import time
+
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
 import os
+import shutil
 
-# Paths
-train_path = "data/processed/train.csv"
-test_path = "data/processed/test.csv"
-model_path = "models/reel_detector.pkl"
-
-# Load data
-print("Loading processed data...")
-train_df = pd.read_csv(train_path)
-test_df = pd.read_csv(test_path)
-
-X_train = train_df.drop("Label", axis=1)
-y_train = train_df["Label"]
-
-X_test = test_df.drop("Label", axis=1)
-y_test = test_df["Label"]
+from dataset import DEFAULT_BATCH_ROWS, DEFAULT_DATASET_DIR, open_dataset
+from forest import DEFAULT_FOREST_DIR, check_forest, export_forest, load_forest, print_check
+from incremental import INCREMENTAL_MODELS, fit_incremental, predict_split
 
-# Clean the data (handle NaN and infinity)
-X_train = X_train.replace([float('inf'), -float('inf')], float('nan'))
-X_test = X_test.replace([float('inf'), -float('inf')], float('nan'))
+# Paths (incremental learners get their own file: the forest export belongs to reel_detector.pkl)
+model_path = "models/reel_detector.pkl"
+streaming_model_path = "models/reel_detector_streaming.pkl"
 
-# Fill NaN with column means (or 0 if you prefer)
-X_train = X_train.fillna(X_train.mean())
-X_test = X_test.fillna(X_test.mean())
+parser = argparse.ArgumentParser(description="Train the reel detector (RandomForest, or an incremental learner with --streaming)")
+parser.add_argument("--data", default=DEFAULT_DATASET_DIR, help="Processed dataset from preprocess.py")
+parser.add_argument("--features", default=None,
+                    help="Comma-separated feature columns to train on (default: all)")
+parser.add_argument("--streaming", action="store_true",
+                    help="Out-of-core training: incremental learner fed in batches from disk")
+parser.add_argument("--model", choices=INCREMENTAL_MODELS, default="sgd",
+                    help="Incremental learner for --streaming (default sgd)")
+parser.add_argument("--epochs", type=int, default=3, help="Passes over the training split with --streaming")
+parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS,
+                    help=f"Rows per batch with --streaming (default {DEFAULT_BATCH_ROWS})")
+args = parser.parse_args()
+columns = args.features.split(",") if args.features else None
 
+# Load data (memory-mapped; NaN rows were dropped and infinity filled from training rows by preprocess.py)
+print("Loading processed data...")
+t0 = time.perf_counter()
+dataset = open_dataset(args.data)
+if args.streaming:
+    print(f"Streaming {dataset.rows('train')} train rows in batches of {args.batch_rows}...")
+    clf = fit_incremental(dataset, columns, model=args.model, epochs=args.epochs, batch_rows=args.batch_rows)
+    print(f"Trained in {time.perf_counter() - t0:.1f} s")
+    y_test, y_pred = predict_split(clf, dataset, "test", columns, args.batch_rows)
+else:
+    X_train, y_train = dataset.load("train", columns)
+    X_test, y_test = dataset.load("test", columns)
+    print(f"Loaded {len(X_train)} train / {len(X_test)} test rows x {X_train.shape[1]} features "
+          f"in {time.perf_counter() - t0:.3f} s")
 
-# Train model
-print("Training RandomForest model...")
-clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
-clf.fit(X_train, y_train)
+    # Train model
+    print("Training RandomForest model...")
+    clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
+    clf.fit(X_train, y_train)
+    y_pred = clf.predict(X_test)
 
 # Evaluate
-y_pred = clf.predict(X_test)
 print("Accuracy:", accuracy_score(y_test, y_pred))
-print(classification_report(y_test, y_pred))
+print(classification_report(y_test, y_pred, labels=range(len(dataset.classes)), target_names=dataset.classes,
+                            zero_division=0))
 
 # Save model
 os.makedirs("models", exist_ok=True)
-joblib.dump(clf, model_path)
-print(f"Model saved to {model_path}")
+if args.streaming:
+    joblib.dump(clf, streaming_model_path)
+    print(f"Model saved to {streaming_model_path}")
+else:
+    # The old export describes the model being replaced; never leave it next to the new pickle
+    shutil.rmtree(DEFAULT_FOREST_DIR, ignore_errors=True)
+    joblib.dump(clf, model_path)
+    print(f"Model saved to {model_path}")
+    meta = export_forest(clf, DEFAULT_FOREST_DIR, model_path)
+    print(f"Flattened forest ({meta['nodes']} nodes, max depth {meta['max_depth']}) saved to {DEFAULT_FOREST_DIR}")
+    print_check(check_forest(load_forest(DEFAULT_FOREST_DIR), clf, X_test.to_numpy()[:20000]))
@@ -0,0 +1,10 @@
+# tests/conftest.py
+# The scripts import their modules from notebooks/ and src/ by directory, not as packages
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+for sub in ('notebooks', 'src'):
+    path = str(PROJECT_DIR / sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
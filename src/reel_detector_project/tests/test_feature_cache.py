@@ -0,0 +1,35 @@
+# tests/test_feature_cache.py
+import shutil
+
+from feature_cache import input_fingerprint
+
+
+def test_fingerprint_ignores_name_and_sees_same_size_edits(tmp_path):
+    data = b''.join(b'%d,%d,10.0.0.1,192.168.1.10\n' % (i, 40 + i % 1400) for i in range(200000))
+    capture = tmp_path / 'capture.csv'
+    capture.write_bytes(data)
+    renamed = tmp_path / 'renamed.csv'
+    shutil.copy(capture, renamed)
+    assert input_fingerprint(renamed) == input_fingerprint(capture)
+
+    # Same size, one byte changed well past the first MiB
+    edited = bytearray(data)
+    edited[len(data) // 2 + 7] ^= 1
+    renamed.write_bytes(bytes(edited))
+    assert renamed.stat().st_size == capture.stat().st_size
+    assert input_fingerprint(renamed) != input_fingerprint(capture)
+
+
+def test_fingerprint_of_store_directory(tmp_path):
+    store = tmp_path / 'capture.pkts'
+    store.mkdir()
+    (store / 'meta.json').write_text('{"rows": 3}')
+    (store / 'ts.f64').write_bytes(bytes(24))
+    before = input_fingerprint(store)
+    (store / 'ts.f64.tmp').write_bytes(b'partial')
+    assert input_fingerprint(store) == before
+    moved = tmp_path / 'other.pkts'
+    store.rename(moved)
+    assert input_fingerprint(moved) == before
+    (moved / 'ts.f64').write_bytes(bytes(23) + b'\x01')
+    assert input_fingerprint(moved) != before
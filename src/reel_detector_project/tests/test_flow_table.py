@@ -0,0 +1,42 @@
+# tests/test_flow_table.py
+import numpy as np
+import pytest
+
+from flow_table import FlowTable
+
+
+def short_flows(batches=20, per_batch=500, seed=0):
+    """Many one-off flows (a new source port every few packets), time ordered."""
+    rng = np.random.default_rng(seed)
+    t = 0.0
+    for b in range(batches):
+        ts = t + np.sort(rng.uniform(0, 30, per_batch))
+        t = ts[-1]
+        sport = 10_000 + (b * per_batch + np.arange(per_batch)) // 5
+        yield (ts, rng.integers(40, 1500, per_batch), np.full(per_batch, 0xC0A8010A, dtype=np.uint32),
+               np.full(per_batch, 0x0A000001, dtype=np.uint32), np.full(per_batch, 6), sport,
+               np.full(per_batch, 443))
+
+
+def test_finished_flows_are_only_counted_by_default():
+    table = FlowTable(idle_timeout=1.0, capacity=64)
+    for batch in short_flows():
+        table.update(*batch)
+    table.finish()
+    assert table.finished == table.next_id > 1000
+    assert table._finished == []
+    with pytest.raises(ValueError):
+        table.pop_finished()
+
+
+def test_keep_finished_drains_every_flow_once():
+    table = FlowTable(idle_timeout=1.0, capacity=64, keep_finished=True)
+    seen = []
+    for batch in short_flows():
+        table.update(*batch)
+        seen.append(table.pop_finished().flow_id)
+        assert table._finished == []
+    table.finish()
+    seen.append(table.pop_finished().flow_id)
+    ids = np.concatenate(seen)
+    assert sorted(ids.tolist()) == list(range(table.next_id)) and table.finished == table.next_id
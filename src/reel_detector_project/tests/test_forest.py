@@ -0,0 +1,109 @@
+# tests/test_forest.py
+import types
+
+import numpy as np
+import pytest
+
+from forest import CHUNK_ROWS, SMALL_BATCH_ROWS, check_forest, export_forest, is_export_of, load_forest
+
+N_FEATURES, N_CLASSES = 6, 3
+
+
+def random_tree(rng, X, max_depth=12):
+    """sklearn Tree-like arrays grown on random median splits (ties included)."""
+    left, right, feature, threshold, value = [], [], [], [], []
+
+    def grow(rows, depth):
+        i = len(left)
+        left.append(-1), right.append(-1), feature.append(-2), threshold.append(-2.0)
+        value.append(np.bincount(rng.integers(0, N_CLASSES, max(1, len(rows) // 3)), minlength=N_CLASSES))
+        if depth == max_depth or len(rows) < 4:
+            return i
+        f = int(rng.integers(N_FEATURES))
+        t = float(np.median(X[rows, f]))
+        go_left = X[rows, f] <= t
+        if go_left.all() or not go_left.any():
+            return i
+        feature[i], threshold[i] = f, t
+        left[i] = grow(rows[go_left], depth + 1)
+        right[i] = grow(rows[~go_left], depth + 1)
+        return i
+
+    grow(np.arange(len(X)), 0)
+    return types.SimpleNamespace(children_left=np.array(left), children_right=np.array(right),
+                                 feature=np.array(feature), threshold=np.array(threshold),
+                                 value=np.array(value, dtype=np.float64)[:, None, :])
+
+
+def reference_proba(model, X):
+    """sklearn's traversal: left when x <= threshold, leaf class fractions averaged."""
+    out = np.zeros((len(X), N_CLASSES))
+    for est in model.estimators_:
+        t = est.tree_
+        for r, x in enumerate(X):
+            node = 0
+            while t.children_left[node] != -1:
+                node = t.children_left[node] if x[t.feature[node]] <= t.threshold[node] else t.children_right[node]
+            out[r] += t.value[node, 0] / t.value[node, 0].sum()
+    return out / len(model.estimators_)
+
+
+@pytest.fixture(scope='module')
+def forest_model():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, N_FEATURES)).astype(np.float32)
+    X[:, :2] = np.round(X[:, :2])      # repeated values land exactly on thresholds
+    trees = [types.SimpleNamespace(tree_=random_tree(rng, X[rng.integers(0, len(X), len(X))])) for _ in range(15)]
+    return types.SimpleNamespace(estimators_=trees, classes_=np.array([0, 5, 7]), n_features_in_=N_FEATURES)
+
+
+@pytest.mark.parametrize('rows', [1, SMALL_BATCH_ROWS, SMALL_BATCH_ROWS + 1, CHUNK_ROWS + 10])
+def test_flat_forest_matches_tree_traversal(tmp_path, forest_model, rows):
+    export_forest(forest_model, tmp_path / 'f')
+    forest = load_forest(tmp_path / 'f')
+    X = np.random.default_rng(rows).normal(size=(rows, N_FEATURES)).astype(np.float32)
+    X[:, :2] = np.round(X[:, :2])
+    check = X[:300]
+    np.testing.assert_allclose(forest.predict_proba(X)[:300], reference_proba(forest_model, check), atol=1e-6)
+    assert forest.predict(X).tolist()[:300] == forest_model.classes_[reference_proba(forest_model, check).argmax(axis=1)].tolist()
+
+
+def test_check_forest_reports_parity(tmp_path):
+    sklearn_ensemble = pytest.importorskip('sklearn.ensemble')
+    joblib = pytest.importorskip('joblib')
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(20000, N_FEATURES)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (X[:, 3] > 1)
+    model = sklearn_ensemble.RandomForestClassifier(n_estimators=30, random_state=0, n_jobs=1).fit(X, y)
+    joblib.dump(model, tmp_path / 'model.pkl')
+    export_forest(model, tmp_path / 'f', tmp_path / 'model.pkl')
+    forest = load_forest(tmp_path / 'f')
+    assert forest.batch_model is not None
+    assert is_export_of(tmp_path / 'f', tmp_path / 'model.pkl')
+
+    check = check_forest(forest, model, X[:5000], single_rows=50)
+    assert check['predictions_equal']
+    assert check['max_abs_diff'] < 1e-6
+    # Timings are reported, not asserted (wall clock is not stable on shared runners)
+    assert all(check[k] > 0 for k in ('sklearn_rows_s', 'numpy_rows_s', 'batch_rows_s', 'single_us'))
+    np.testing.assert_allclose(forest.predict_proba(X[:5000]), model.predict_proba(X[:5000]), atol=1e-6)
+
+
+def test_export_keeps_its_batch_model_when_the_pickle_is_replaced(tmp_path):
+    sklearn_ensemble = pytest.importorskip('sklearn.ensemble')
+    sklearn_linear = pytest.importorskip('sklearn.linear_model')
+    joblib = pytest.importorskip('joblib')
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(2000, N_FEATURES)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(int)
+    model = sklearn_ensemble.RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    joblib.dump(model, tmp_path / 'model.pkl')
+    export_forest(model, tmp_path / 'f', tmp_path / 'model.pkl')
+    # Another model written over the same pickle, as a retrain without re-export would
+    joblib.dump(sklearn_linear.SGDClassifier(loss='log_loss', random_state=0).fit(X, 1 - y), tmp_path / 'model.pkl')
+    assert not is_export_of(tmp_path / 'f', tmp_path / 'model.pkl')
+
+    forest = load_forest(tmp_path / 'f')
+    batch = X[:SMALL_BATCH_ROWS * 4]
+    np.testing.assert_allclose(forest.predict_proba(batch), model.predict_proba(batch), atol=1e-6)
+    np.testing.assert_allclose(forest.predict_proba(batch[:1]), model.predict_proba(batch[:1]), atol=1e-6)
@@ -0,0 +1,39 @@
+# tests/test_predict.py
+import numpy as np
+import pytest
+
+import predict
+from forest import export_forest
+
+joblib = pytest.importorskip('joblib')
+ensemble = pytest.importorskip('sklearn.ensemble')
+linear_model = pytest.importorskip('sklearn.linear_model')
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(predict.MODEL_ENV, raising=False)
+    predict.resolve_model_path.cache_clear()
+    (tmp_path / 'models').mkdir()
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 4)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(int)
+    model = ensemble.RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    forest, pickle = (tmp_path / name for name in predict.DEFAULT_MODELS)
+    joblib.dump(model, pickle)
+    export_forest(model, forest, pickle)
+    yield forest, pickle, X, y
+    predict.resolve_model_path.cache_clear()
+
+
+def test_default_model_is_the_current_forest_export(models_dir):
+    forest, _, _, _ = models_dir
+    assert predict.resolve_model_path() == forest
+
+
+def test_stale_forest_is_not_served_after_a_retrain(models_dir, capsys):
+    _, pickle, X, y = models_dir
+    joblib.dump(linear_model.SGDClassifier(random_state=0).fit(X, 1 - y), pickle)
+    assert predict.resolve_model_path() == pickle
+    assert 'not exported from the current' in capsys.readouterr().err
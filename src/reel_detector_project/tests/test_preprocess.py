@@ -0,0 +1,46 @@
+# tests/test_preprocess.py
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def preprocess(tmp_path, monkeypatch):
+    # The module creates data/processed relative to the working directory on import
+    monkeypatch.chdir(tmp_path)
+    import preprocess
+    return preprocess
+
+
+def test_inf_filled_from_training_rows_only(preprocess, tmp_path):
+    from dataset import open_dataset
+
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    rng = np.random.default_rng(0)
+    n = 400
+    rate = rng.uniform(0, 100, n)
+    rate[::10] = np.inf
+    rate[5] = np.nan                        # incomplete row: dropped while loading
+    labels = np.where(np.arange(n) % 2, 'BENIGN', 'DDoS')
+    pd.DataFrame({' Flow Duration': rng.uniform(0, 1, n), ' Flow Packets/s': rate, ' Label': labels}) \
+        .to_csv(raw / 'a.csv', index=False)
+
+    df = preprocess.load_raw_data(str(raw), workers=1)
+    assert len(df) == n - 1 and np.isinf(df['Flow Packets/s']).sum() == n // 10
+    # A huge finite value in a test row must not move the fill
+    _, test_idx = preprocess.train_test_split(np.arange(len(df)), test_size=preprocess.TEST_SIZE,
+                                              random_state=preprocess.RANDOM_STATE, stratify=df['Label'].astype(str))
+    finite_test = [i for i in test_idx if np.isfinite(df['Flow Packets/s'].iat[i])]
+    df.loc[finite_test[0], 'Flow Packets/s'] = 1e9
+
+    out = tmp_path / 'dataset'
+    preprocess.preprocess(df, str(out))
+    ds = open_dataset(out)
+    train = ds.load('train')[0]['Flow Packets/s'].to_numpy()
+    fill = ds.meta['split_info']['inf_fill']['Flow Packets/s']
+    assert set(ds.meta['split_info']['inf_fill']) == {'Flow Packets/s'}
+    assert np.isfinite(train).all() and np.isfinite(ds.load('test')[0]['Flow Packets/s'].to_numpy()).all()
+    observed = train[train != np.float32(fill)]
+    assert fill < 100
+    assert fill == pytest.approx(observed.mean(dtype=np.float64), rel=1e-5)
@@ -0,0 +1,88 @@
+# tests/test_rolling_features.py
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pcap_reader import ipv4_to_int
+from rolling_features import (INITIAL_CAPACITY, RollingFeatureState, _Ring, check_rolling_parity,
+                              rolling_windows)
+from windows import FEATURE_COLUMNS, compute_sliding_windows
+
+DEVICE = '192.168.1.10'
+PEER = '10.0.0.1'
+# A std is the sqrt of a variance carried with ~1e-16 rounding (Welford removal here,
+# prefix-sum cancellation in compute_sliding_windows), so near-zero stds differ by ~1e-8
+ATOL = 1e-7
+
+
+def device_packets(seed=0):
+    """A long steady stream (the ring wraps many times without growing), then a burst
+    of more than INITIAL_CAPACITY packets inside one window (it grows while wrapped),
+    then a gap that expires everything."""
+    rng = np.random.default_rng(seed)
+    steady = np.sort(rng.uniform(0, 400, 4000))
+    burst = np.sort(rng.uniform(400, 403, 3 * INITIAL_CAPACITY))
+    tail = np.sort(rng.uniform(430, 450, 300))
+    ts = np.concatenate((steady, burst, tail))
+    down = rng.random(len(ts)) < 0.6
+    return pd.DataFrame({'ts': ts, 'length': rng.integers(40, 1500, len(ts)),
+                         'src': np.where(down, PEER, DEVICE), 'dst': np.where(down, DEVICE, PEER)})
+
+
+@pytest.mark.parametrize('window_size,step', [(5.0, 2.5), (1.0, 1.0), (10.0, 2.5)])
+def test_rolling_windows_match_sliding_windows(window_size, step):
+    df = device_packets()
+    rolled = rolling_windows(df, DEVICE, window_size, step)
+    ref = compute_sliding_windows(df, DEVICE, window_size, step)
+    assert list(rolled.columns) == list(ref.columns) == ['wstart'] + FEATURE_COLUMNS
+    assert len(rolled) == len(ref) > 0
+    for c in ref.columns:
+        np.testing.assert_allclose(rolled[c].to_numpy(dtype=np.float64), ref[c].to_numpy(dtype=np.float64),
+                                   rtol=1e-6, atol=ATOL, err_msg=c)
+    assert check_rolling_parity(df, DEVICE, window_size, step, atol=ATOL) == []
+
+
+def test_rolling_windows_on_uint32_addresses():
+    df = device_packets(seed=1)
+    ints = df.assign(src=df['src'].map(ipv4_to_int).astype(np.uint32),
+                     dst=df['dst'].map(ipv4_to_int).astype(np.uint32))
+    assert check_rolling_parity(ints, DEVICE, atol=ATOL) == []
+
+
+def test_trailing_window_after_expiry():
+    """add() keeps [newest - window_size, newest]; the Welford IAT state must equal a fresh computation."""
+    df = device_packets(seed=2)
+    state = RollingFeatureState(DEVICE, 5.0)
+    ts, length = df['ts'].to_numpy(), df['length'].to_numpy()
+    down_all = (df['dst'] == DEVICE).to_numpy()
+    for i, row in enumerate(df.itertuples(index=False)):
+        state.add(row.ts, row.length, row.src, row.dst)
+        if i % 997 and i != len(df) - 1:
+            continue
+        keep = ts[:i + 1] >= ts[i] - 5.0
+        down = keep & down_all[:i + 1]
+        iat = np.diff(ts[:i + 1][down])
+        got = state.features_dict()
+        assert got['pkt_count_down'] == down.sum()
+        assert got['bytes_down'] == length[:i + 1][down].sum()
+        assert got['std_pkt_size_down'] == pytest.approx(length[:i + 1][down].std() if down.any() else 0.0)
+        assert got['iat_mean_down'] == pytest.approx(iat.mean() if len(iat) else 0.0, abs=1e-9)
+        assert got['iat_std_down'] == pytest.approx(iat.std() if len(iat) else 0.0, rel=1e-6, abs=ATOL)
+
+
+def test_ring_wraparound_and_growth():
+    ring = _Ring((np.int64, np.float64), capacity=4)
+    ref = deque()
+    rng = np.random.default_rng(3)
+    for i in range(500):
+        if ref and rng.random() < 0.45:
+            assert ring.pop() == ref.popleft()
+        else:
+            ring.push(i, i / 2)
+            ref.append((i, i / 2))
+        assert len(ring) == len(ref)
+        if ref:
+            assert ring.peek() == ref[0]
+            assert ring.peek(len(ref) - 1) == ref[-1]
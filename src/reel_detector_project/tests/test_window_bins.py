@@ -0,0 +1,58 @@
+# tests/test_window_bins.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from window_bins import FeatureBins, compute_multi_resolution_windows
+from windows import FEATURE_COLUMNS, compute_sliding_windows
+
+DEVICE = '192.168.1.10'
+PEER = '10.0.0.1'
+EPOCH = 1.5e9
+RESOLUTIONS = [(1.0, 0.1), (0.5, 0.1), (0.3, 0.3), (3.0, 1.5), (5.0, 2.5), (10.0, 10.0)]
+
+
+def epoch_packets(seed=0, seconds=600, n=30000):
+    """Epoch timestamps on a 0.1 ms grid (so many land on or next to window boundaries), with gaps."""
+    rng = np.random.default_rng(seed)
+    ticks = np.sort(rng.integers(0, seconds * 10_000, n))
+    ticks = ticks[(ticks < 200 * 10_000) | (ticks > 230 * 10_000)]      # idle stretch: empty windows
+    ts = EPOCH + ticks / 10_000
+    down = rng.random(len(ts)) < 0.6
+    return pd.DataFrame({'ts': ts, 'length': rng.integers(40, 1500, len(ts)),
+                         'src': np.where(down, PEER, DEVICE), 'dst': np.where(down, DEVICE, PEER)})
+
+
+def assert_matches(got, ref):
+    assert list(got.columns) == list(ref.columns) == ['wstart'] + FEATURE_COLUMNS
+    assert len(got) == len(ref) > 0
+    np.testing.assert_array_equal(got['wstart'].to_numpy(), ref['wstart'].to_numpy())
+    for c in FEATURE_COLUMNS:
+        np.testing.assert_allclose(got[c].to_numpy(dtype=np.float64), ref[c].to_numpy(dtype=np.float64),
+                                   rtol=1e-6, atol=1e-6, err_msg=c)
+
+
+def test_multi_resolution_matches_sliding_windows_at_epoch_timestamps():
+    df = epoch_packets()
+    got = compute_multi_resolution_windows(df, DEVICE, RESOLUTIONS)
+    for (w, s) in RESOLUTIONS:
+        assert_matches(got[(w, s)], compute_sliding_windows(df, DEVICE, w, s))
+
+
+def test_streamed_chunks_match_one_frame():
+    df = epoch_packets(seed=1)
+    bins = FeatureBins(DEVICE, RESOLUTIONS)
+    for start in range(0, len(df), 997):
+        bins.add_frame(df.iloc[start:start + 997])
+    for (w, s) in RESOLUTIONS:
+        assert_matches(bins.windows(w, s), compute_sliding_windows(df, DEVICE, w, s))
+
+
+def test_unknown_resolution_and_order():
+    bins = FeatureBins(DEVICE, [(1.0, 0.5)])
+    with pytest.raises(ValueError):
+        bins.windows(2.0, 1.0)
+    df = epoch_packets(n=100)
+    bins.add_frame(df.iloc[50:])
+    with pytest.raises(ValueError):
+        bins.add_frame(df.iloc[:50])
@@ -0,0 +1,77 @@
+# tests/test_windows.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from pcap_reader import ipv4_to_int
+from windows import (FEATURE_COLUMNS, check_window_parity, compute_sliding_windows,
+                     compute_sliding_windows_naive)
+
+DEVICE = '192.168.1.10'
+PEERS = ['10.0.0.1', '172.16.5.4', '192.168.1.20']
+
+
+def packet_frame(seed=0):
+    """Packets with idle gaps (empty windows), a lone packet and same-timestamp bursts."""
+    rng = np.random.default_rng(seed)
+    parts = []
+
+    def add(ts, length, down, other=None):
+        n = len(ts)
+        peer = rng.choice(PEERS, n)
+        src = np.where(down, peer, DEVICE) if other is None else np.full(n, other)
+        parts.append(pd.DataFrame({'ts': ts, 'length': length, 'src': src, 'dst': np.where(down, DEVICE, peer)}))
+
+    n = 400
+    add(np.sort(rng.uniform(0, 20, n)), rng.integers(40, 1500, n), rng.random(n) < 0.7)
+    add(np.array([47.3]), np.array([1400]), np.array([True]))           # alone after a 27 s gap
+    burst_ts = np.repeat([80.0, 80.5, 81.25], 30)                       # identical timestamps
+    add(burst_ts, rng.integers(900, 1500, len(burst_ts)), np.ones(len(burst_ts), dtype=bool))
+    add(np.array([81.25, 95.0]), np.array([60, 52]), np.array([False, False]))  # upload only
+    n = 200
+    add(np.sort(rng.uniform(120, 131, n)), rng.integers(40, 1500, n), rng.random(n) < 0.5)
+    # Traffic between other hosts
+    add(np.sort(rng.uniform(0, 20, 50)), rng.integers(40, 1500, 50), np.zeros(50, dtype=bool), other='10.9.9.9')
+    df = pd.concat(parts, ignore_index=True)
+    return df.sort_values('ts', kind='stable').reset_index(drop=True)
+
+
+def assert_windows_equal(fast, ref):
+    assert list(fast.columns) == ['wstart'] + FEATURE_COLUMNS
+    assert list(fast.columns) == list(ref.columns)
+    assert len(fast) == len(ref) > 0
+    for c in ref.columns:
+        np.testing.assert_allclose(fast[c].to_numpy(dtype=np.float64), ref[c].to_numpy(dtype=np.float64),
+                                   rtol=1e-9, atol=1e-9, err_msg=c)
+
+
+@pytest.mark.parametrize('window_size,step', [(5.0, 2.5), (10.0, 10.0), (1.0, 2.5), (2.5, 0.5)])
+def test_sliding_windows_match_naive(window_size, step):
+    df = packet_frame()
+    fast = compute_sliding_windows(df, DEVICE, window_size, step)
+    ref = compute_sliding_windows_naive(df, DEVICE, window_size, step)
+    assert_windows_equal(fast, ref)
+    assert check_window_parity(df, DEVICE, window_size, step) == []
+
+
+def test_sliding_windows_match_naive_on_uint32_addresses():
+    df = packet_frame(seed=1)
+    ints = df.assign(src=df['src'].map(ipv4_to_int).astype(np.uint32),
+                     dst=df['dst'].map(ipv4_to_int).astype(np.uint32))
+    assert_windows_equal(compute_sliding_windows(ints, DEVICE), compute_sliding_windows_naive(df, DEVICE))
+
+
+def test_windows_skip_gaps_and_handle_single_packet():
+    df = packet_frame()
+    fast = compute_sliding_windows(df, DEVICE, 5.0, 2.5)
+    # No packets between 20 s and 47.3 s: windows entirely inside the gap are not emitted
+    assert not ((fast['wstart'] > 20) & (fast['wstart'] + 5.0 <= 47.3)).any()
+    lone = fast[(fast['wstart'] > 42) & (fast['wstart'] <= 47.3)]
+    assert len(lone) and (lone['pkt_count_down'] == 1).all()
+    assert (lone['std_pkt_size_down'] == 0).all() and (lone['iat_mean_down'] == 0).all()
+
+
+def test_empty_frame():
+    empty = pd.DataFrame(columns=['ts', 'length', 'src', 'dst'])
+    assert compute_sliding_windows(empty, DEVICE).empty
+    assert compute_sliding_windows_naive(empty, DEVICE).empty